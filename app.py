@@ -3,7 +3,13 @@ from auth_bp import auth
 from resident_bp import resident
 from secretary_bp import secretary
 from treasurer_bp import treasurer
-from helpers import set_inactive_last_login
+from metrics_bp import metrics
+from helpers import record_heartbeat, prewarm_pool, start_scheduler, start_presence_flusher
+import instrumentation
+import telemetry
+import storage
+import images
+import certificates
 # =================================== APP INSTANCES =================================== 
 app = Flask(__name__)
 app.secret_key = 'secret'
@@ -11,6 +17,26 @@ app.register_blueprint(auth, url_prefix='/au')
 app.register_blueprint(resident, url_prefix='/resident')
 app.register_blueprint(secretary, url_prefix='/secretary')
 app.register_blueprint(treasurer, url_prefix='/treasurer')
+app.register_blueprint(metrics, url_prefix='/admin/metrics')
+instrumentation.init_app(app)
+telemetry.init_app(app)
+storage.init_app(app)
+images.init_app(app)
+certificates.init_app(app)
+
+# Open this worker's database connections and background scheduler up front.
+# With gunicorn --preload, call these from a post_fork hook instead. Skipped when the hashing and
+# rendering pools' spawned processes import this file as __mp_main__ (python app.py).
+if __name__ != '__mp_main__':
+    prewarm_pool()
+    start_scheduler()
+    start_presence_flusher()
+
+@app.before_request
+def track_presence():
+    """Record a heartbeat for the signed-in user; written to the database in batches"""
+    if 'id' in session and 'role' in session:
+        record_heartbeat(session['role'], session['id'])
 
 @app.route('/')
 def landing_page():
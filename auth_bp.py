@@ -1,10 +1,10 @@
 from flask import Blueprint, render_template, url_for, redirect, session, request, flash
-from bcrypt import checkpw, hashpw, gensalt
-from helpers import database as db, RealDictCursor, get_current_user_info, set_active_last_login, set_inactive_last_login
+from helpers import db_session, get_current_user_info, get_account_by_email, record_heartbeat, record_logout
+from passwords import hash_password, verify_password, PasswordServiceBusy
+from cache import invalidate
 from datetime import datetime
 
 auth = Blueprint('auth', __name__)
-roles = ['resident', 'secretary', 'treasurer']
 
 # =================================== ROUTES =================================== 
 @auth.route('/login')
@@ -17,7 +17,8 @@ def register():
 
 @auth.route('/logout')
 def logout():
-    set_inactive_last_login()
+    if 'id' in session and 'role' in session:
+        record_logout(session['role'], session['id'])
     session.clear()
     return redirect(url_for('landing_page'))
 
@@ -27,45 +28,28 @@ def login_submit():
     email = request.form['email']
     password = request.form['password']
  
-    user_found = False
+    account = get_account_by_email(email)
+    if not account:
+        flash('Email does not exist', 'danger')
+        return redirect(url_for('landing_page'))
 
-    for role in roles:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(f"SELECT * FROM {role} WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        db.putconn(conn)
-        if user:
-            user_found = True
+    if account['sanction_expires_at']:
+        flash(f'You are currently under sanctions for the Reason:"{account["sanction_reason"]}" until {account["sanction_expires_at"].strftime("%B %d, %Y %I:%M %p")}', 'danger')
+        return redirect(url_for('landing_page'))
 
-            if role == 'resident':
-                conn = db.getconn()
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute("""
-                    SELECT * FROM sanctions 
-                    WHERE resident_id = %s 
-                    AND expires_at > NOW()
-                """, (user['id'],))
-                sanction = cursor.fetchone()
-                db.putconn(conn)
+    try:
+        password_matches = verify_password(password, account['password'])
+    except PasswordServiceBusy as busy:
+        flash(f'The server is busy. Please try again in {busy.retry_after} seconds.', 'warning')
+        return redirect(url_for('landing_page'))
 
-                if sanction:
-                    flash(f'You are currently under sanctions for the Reason:"{sanction["reason"]}" until {sanction["expires_at"].strftime("%B %d, %Y %I:%M %p")}', 'danger')
-                    return redirect(url_for('landing_page'))
+    if password_matches:
+        session['id'] = account['id']
+        session['role'] = account['role']
+        record_heartbeat(account['role'], account['id'])
+        return redirect(url_for(f'{account["role"]}.dashboard'))
 
-            if checkpw(password.encode('utf-8'), user['password'].encode()):
-                session['id'] = user['id']
-                session['role'] = role
-                set_active_last_login()
-                return redirect(url_for(f'{role}.dashboard'))
-            else:
-                flash('Incorrect password', 'danger')
-                return redirect(url_for('landing_page'))
-    
-    if not user_found:
-        flash('Email does not exist', 'danger')
-        return redirect(url_for('landing_page'))
-    
+    flash('Incorrect password', 'danger')
     return redirect(url_for('landing_page'))
 
 @auth.route('/register-submit', methods=['GET', 'POST'])
@@ -84,35 +68,31 @@ def register_submit():
         address = request.form['address'].title()
     
         if password == confirm_password:
-            conn = None
             try:
-                conn = db.getconn()
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                
-                # Check if email exists within the same transaction
-                for role in roles:
-                    cursor.execute(f"SELECT email FROM {role} WHERE email = %s", (email,))
-                    if cursor.fetchone():
+                # Hash before checking out a connection so the pool isn't held during bcrypt
+                password_hash = hash_password(password)
+
+                with db_session(commit=True) as cursor:
+                    # Check if email exists within the same transaction
+                    if get_account_by_email(email, cursor):
                         flash('Email already exists. Please use a different email address.', 'danger')
                         return redirect(url_for('auth.register'))
-                
-                password_hash = hashpw(password.encode('utf-8'), gensalt()).decode('utf-8')
-                
-                command = """
-                    INSERT INTO resident 
-                    (first_name, last_name, age, gender, birth_date, contact_number, civil_status, email, password, address)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """    
-                values = (first_name, last_name, age, gender, birth_date, contact_number, civil_status, email, password_hash, address)
-                cursor.execute(command, values)
-                conn.commit()
-                db.putconn(conn)
+
+                    command = """
+                        INSERT INTO resident 
+                        (first_name, last_name, age, gender, birth_date, contact_number, civil_status, email, password, address)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """    
+                    values = (first_name, last_name, age, gender, birth_date, contact_number, civil_status, email, password_hash, address)
+                    cursor.execute(command, values)
+                invalidate('residents')
                 flash('Registration successful! You can now login.', 'success')
                 return redirect(url_for('landing_page'))
-                
+
+            except PasswordServiceBusy as busy:
+                flash(f'The server is busy. Please try again in {busy.retry_after} seconds.', 'warning')
+                return redirect(url_for('auth.register'))
             except Exception as error:
-                if conn:
-                    conn.rollback()
                 print(error)
                 flash('An error occurred during registration. Please try again.', 'danger')
                 return redirect(url_for('auth.register'))
@@ -125,19 +105,9 @@ def register_submit():
 
 # =================================== CHECK FUNCTIONS =================================== 
 def email_exist(email):
-    conn = db.getconn()
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
         # Check in all role tables
-        for role in roles:
-            cursor.execute(f"SELECT email FROM {role} WHERE email = %s", (email,))
-            if cursor.fetchone():
-                return True
-        return False
+        return get_account_by_email(email) is not None
     except Exception as error:
         print(error)
         return False
-    finally:
-        db.putconn(conn)
-
-
@@ -0,0 +1,215 @@
+from collections import OrderedDict
+from functools import wraps
+import os
+import pickle
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # the shared backend is optional; the in-process LRU needs nothing
+    redis = None
+
+# =================================== CONFIGURATION ===================================
+# Dashboard aggregates are cached for a few seconds. Write routes call invalidate() for the
+# namespaces they touch; with the in-process backend other workers catch up within CACHE_TTL.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 10))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+CACHE_KEY_PREFIX = 'barangay:cache:'
+
+_MISSING = object()
+
+class Uncacheable(Exception):
+    """Raised by a cached function to return value without storing it, e.g. a fallback after a database error"""
+
+    def __init__(self, value):
+        super().__init__('result not cached')
+        self.value = value
+
+# =================================== BACKENDS ===================================
+class MemoryBackend:
+    """Per-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class RedisBackend:
+    """Cache shared by every worker; values are pickled and expire through Redis TTLs"""
+
+    def __init__(self, url=CACHE_URL):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(CACHE_KEY_PREFIX + key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(CACHE_KEY_PREFIX + key, pickle.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def generation(self, namespace):
+        return int(self._client.get(f'{CACHE_KEY_PREFIX}gen:{namespace}') or 0)
+
+    def bump(self, namespace):
+        self._client.incr(f'{CACHE_KEY_PREFIX}gen:{namespace}')
+
+    def clear(self):
+        for key in self._client.scan_iter(match=CACHE_KEY_PREFIX + '*'):
+            self._client.delete(key)
+
+
+def _create_backend():
+    if CACHE_BACKEND == 'redis':
+        if redis is None:
+            print("CACHE_BACKEND=redis but the redis package is not installed; using the in-process cache")
+        else:
+            return RedisBackend()
+    return MemoryBackend()
+
+backend = _create_backend()
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'waits': 0, 'errors': 0, 'invalidations': 0}
+
+# =================================== SINGLE-FLIGHT ===================================
+# Only one thread per process recomputes a missing key; the others wait for its result.
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def _uncached(compute):
+    try:
+        return compute()
+    except Uncacheable as e:
+        return e.value
+
+def get_or_compute(key, compute, ttl=CACHE_TTL):
+    """Return the cached value for key, computing and storing it once if it is missing or expired"""
+    try:
+        value = backend.get(key)
+    except Exception as e:
+        # A broken shared cache must not take the dashboards down with it
+        _count('errors')
+        print(f"Cache read error: {e}")
+        return _uncached(compute)
+    if value is not _MISSING:
+        _count('hits')
+        return value
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = {'done': threading.Event(), 'value': _MISSING, 'error': None}
+
+    if not leader:
+        _count('waits')
+        flight['done'].wait()
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['value']
+
+    _count('misses')
+    try:
+        try:
+            value = compute()
+        except Uncacheable as e:
+            # Waiters share the fallback, but the next call computes again
+            flight['value'] = e.value
+            return e.value
+        flight['value'] = value
+        try:
+            backend.set(key, value, ttl)
+        except Exception as e:
+            _count('errors')
+            print(f"Cache write error: {e}")
+        return value
+    except Exception as e:
+        flight['error'] = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight['done'].set()
+
+# =================================== PUBLIC API ===================================
+def cached(namespace, ttl=CACHE_TTL):
+    """Cache a function's result per argument list under namespace; invalidate(namespace) drops them all"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                generation = backend.generation(namespace)
+            except Exception as e:
+                _count('errors')
+                print(f"Cache read error: {e}")
+                return _uncached(lambda: fn(*args, **kwargs))
+            key = f"{namespace}:{generation}:{fn.__module__}.{fn.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+            return get_or_compute(key, lambda: fn(*args, **kwargs), ttl)
+
+        @wraps(fn)
+        def uncached(*args, **kwargs):
+            return _uncached(lambda: fn(*args, **kwargs))
+        wrapper.uncached = uncached
+        return wrapper
+    return decorator
+
+def invalidate(*namespaces):
+    """Drop every cached entry in the given namespaces (old entries are never read again)"""
+    for namespace in namespaces:
+        try:
+            backend.bump(namespace)
+            _count('invalidations')
+        except Exception as e:
+            _count('errors')
+            print(f"Cache invalidation error: {e}")
+
+def get_cache_stats():
+    """Hit, miss, single-flight wait and error counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['backend'] = type(backend).__name__
+    stats['ttl'] = CACHE_TTL
+    if isinstance(backend, MemoryBackend):
+        stats['entries'] = len(backend._entries)
+    return stats
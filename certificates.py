@@ -0,0 +1,376 @@
+from flask import session, redirect, url_for, flash
+from helpers import db_session
+import storage
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+
+# =================================== CONFIGURATION ===================================
+# Certificates are single-page PDFs written directly (standard Helvetica fonts, nothing embedded).
+# Each template is compiled once per process into its fixed PDF objects and pre-laid-out header;
+# rendering only wraps the filled-in paragraphs and assembles the page. Rendering runs in a
+# process pool, and rendered files are kept in storage under the request id and template version,
+# so editing a template re-renders on next download while unchanged certificates are served as-is.
+BARANGAY_NAME = os.environ.get('BARANGAY_NAME', 'Barangay')
+MUNICIPALITY_NAME = os.environ.get('MUNICIPALITY_NAME', '')
+CERTIFICATE_WORKERS = int(os.environ.get('CERTIFICATE_WORKERS', os.cpu_count() or 2))
+CERTIFICATE_TIMEOUT = float(os.environ.get('CERTIFICATE_TIMEOUT', 30))
+CERTIFICATE_BATCH_CHUNK = 16
+CERTIFICATE_STATUSES = ('To Pick Up', 'Released')
+ENGINE_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 72
+BODY_SIZE = 12
+BODY_LEADING = 18
+PARAGRAPH_GAP = 12
+
+TEMPLATES = {
+    'barangay-clearance': {
+        'title': 'BARANGAY CLEARANCE',
+        'body': [
+            'TO WHOM IT MAY CONCERN:',
+            'This is to certify that {name}, {age} years old, {civil_status}, residing at {address}, '
+            'is a bona fide resident of this barangay.',
+            'Based on the records of this office, the above-named person has no derogatory record '
+            'filed in this barangay as of {issued_on}.',
+            'This clearance is issued upon the request of the above-named person for {purpose}.',
+        ],
+    },
+    'certificate-of-residency': {
+        'title': 'CERTIFICATE OF RESIDENCY',
+        'body': [
+            'TO WHOM IT MAY CONCERN:',
+            'This is to certify that {name}, {age} years old, {civil_status}, is a resident of '
+            '{address} within the jurisdiction of this barangay.',
+            'This certification is issued upon the request of the above-named person for {purpose}.',
+        ],
+    },
+    'indigency-certificate': {
+        'title': 'CERTIFICATE OF INDIGENCY',
+        'body': [
+            'TO WHOM IT MAY CONCERN:',
+            'This is to certify that {name}, {age} years old, {civil_status}, residing at {address}, '
+            'belongs to an indigent family of this barangay.',
+            'This certification is issued upon the request of the above-named person for {purpose}.',
+        ],
+    },
+}
+
+class CertificateError(Exception):
+    """Raised when a request cannot be rendered as a certificate (unknown type or not yet approved)"""
+
+# =================================== FONT METRICS ===================================
+# Advance widths (1/1000 em) of the standard Helvetica fonts for characters 32-126
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, 1015,
+    667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778, 667, 778,
+    722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556, 333,
+    556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556,
+    333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611, 975,
+    722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778, 667, 778,
+    722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556, 333,
+    556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611, 611, 611,
+    389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+FONTS = {'F1': _HELVETICA, 'F2': _HELVETICA_BOLD}
+
+def text_width(text, font, size):
+    """Width of text in points; characters outside ASCII are counted as a digit"""
+    widths = FONTS[font]
+    return sum(widths[ord(ch) - 32] if 32 <= ord(ch) <= 126 else 556 for ch in text) * size / 1000
+
+def wrap(text, font, size, width):
+    """Greedy word wrap to lines no wider than width"""
+    lines, line = [], ''
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and text_width(candidate, font, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+# =================================== PDF WRITER ===================================
+def _pdf_string(text):
+    """PDF literal string in WinAnsiEncoding, so names like Ñ render with the standard fonts"""
+    raw = text.encode('cp1252', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+def _text_op(text, font, size, x, y):
+    return b'BT /%s %d Tf %.2f %.2f Td %s Tj ET\n' % (font.encode(), size, x, y, _pdf_string(text))
+
+def _centered_op(text, font, size, y):
+    return _text_op(text, font, size, (PAGE_WIDTH - text_width(text, font, size)) / 2, y)
+
+# Objects every certificate shares; the page's content stream is object 6 and the info dictionary 7
+_FIXED_OBJECTS = [
+    b'<< /Type /Catalog /Pages 2 0 R >>',
+    b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+    b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+    b'/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>' % (PAGE_WIDTH, PAGE_HEIGHT),
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+]
+
+def _pdf_header():
+    """File header plus the fixed objects, and the byte offset of each object"""
+    parts, offsets = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'], []
+    position = len(parts[0])
+    for number, body in enumerate(_FIXED_OBJECTS, start=1):
+        obj = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        offsets.append(position)
+        parts.append(obj)
+        position += len(obj)
+    return b''.join(parts), offsets
+
+_HEADER_BYTES, _HEADER_OFFSETS = _pdf_header()
+
+def assemble_pdf(content, info):
+    """Complete PDF file from a page content stream and an info dictionary"""
+    stream = zlib.compress(content, 6)
+    objects = [
+        b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream),
+        b'<< ' + b' '.join(b'/%s %s' % (key.encode(), _pdf_string(value)) for key, value in info.items()) + b' >>',
+    ]
+    parts, offsets, position = [_HEADER_BYTES], list(_HEADER_OFFSETS), len(_HEADER_BYTES)
+    for number, body in enumerate(objects, start=len(_FIXED_OBJECTS) + 1):
+        obj = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        offsets.append(position)
+        parts.append(obj)
+        position += len(obj)
+
+    count = len(offsets) + 1
+    xref = [b'xref\n0 %d\n0000000000 65535 f \n' % count] + [b'%010d 00000 n \n' % offset for offset in offsets]
+    trailer = b'trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, count - 1, position)
+    return b''.join(parts + xref + [trailer])
+
+# =================================== TEMPLATES ===================================
+def template_version(document_type):
+    """Short hash of a template and the engine; part of the cache key of every rendered certificate"""
+    spec = {'engine': ENGINE_VERSION, 'template': TEMPLATES[document_type],
+            'barangay': BARANGAY_NAME, 'municipality': MUNICIPALITY_NAME}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+def compile_template(document_type):
+    """Pre-render the fixed header and title of a template and split its paragraphs for filling in"""
+    spec = TEMPLATES[document_type]
+    header = [_centered_op('Republic of the Philippines', 'F1', 11, PAGE_HEIGHT - MARGIN)]
+    y = PAGE_HEIGHT - MARGIN - 16
+    if MUNICIPALITY_NAME:
+        header.append(_centered_op(MUNICIPALITY_NAME, 'F1', 11, y))
+        y -= 16
+    header.append(_centered_op(BARANGAY_NAME, 'F2', 13, y))
+    header.append(_centered_op('OFFICE OF THE BARANGAY SECRETARY', 'F1', 10, y - 16))
+    header.append(b'%.2f %.2f m %.2f %.2f l S\n' % (MARGIN, y - 28, PAGE_WIDTH - MARGIN, y - 28))
+    header.append(_centered_op(spec['title'], 'F2', 18, y - 76))
+    return {
+        'header': b''.join(header),
+        'body_top': y - 120,
+        'paragraphs': spec['body'],
+        'title': spec['title'],
+        'version': template_version(document_type),
+    }
+
+# Compiled once per process: at import in the web worker and in each pool process
+COMPILED = {document_type: compile_template(document_type) for document_type in TEMPLATES}
+
+def render_pdf(document_type, fields):
+    """Render one certificate from a compiled template and its fields; returns the PDF bytes"""
+    template = COMPILED[document_type]
+    ops = [template['header']]
+    y = template['body_top']
+    width = PAGE_WIDTH - 2 * MARGIN
+    for paragraph in template['paragraphs']:
+        for line in wrap(paragraph.format(**fields), 'F1', BODY_SIZE, width):
+            ops.append(_text_op(line, 'F1', BODY_SIZE, MARGIN, y))
+            y -= BODY_LEADING
+        y -= PARAGRAPH_GAP
+
+    signature_x = PAGE_WIDTH - MARGIN - 200
+    y -= 48
+    ops.append(b'%.2f %.2f m %.2f %.2f l S\n' % (signature_x, y + 14, PAGE_WIDTH - MARGIN, y + 14))
+    ops.append(_text_op(fields['secretary'], 'F2', 11, signature_x, y))
+    ops.append(_text_op('Barangay Secretary', 'F1', 10, signature_x, y - 14))
+    ops.append(_text_op(f"Control No. {fields['control_no']}    Issued {fields['issued_on']}    Template {template['version']}",
+                        'F1', 8, MARGIN, MARGIN / 2))
+
+    return assemble_pdf(b''.join(ops), {
+        'Title': f"{template['title'].title()} - {fields['name']}",
+        'Creator': f"{BARANGAY_NAME} Management System",
+    })
+
+def _render_job(job):
+    """Pool entry point: (request_id, document_type, fields) -> (request_id, pdf bytes)"""
+    request_id, document_type, fields = job
+    return request_id, render_pdf(document_type, fields)
+
+# =================================== DATA ===================================
+CERTIFICATE_QUERY = """
+    SELECT
+        rd.id, rd.resident_id, rd.document_type, rd.status, rd.reviewed_at, rd.requirements->>'purpose' AS purpose,
+        CONCAT(r.first_name, ' ', r.last_name) AS name, r.age, r.civil_status, r.address,
+        s.username AS secretary
+    FROM request_document rd
+    JOIN resident r ON rd.resident_id = r.id
+    LEFT JOIN secretary s ON rd.reviewed_by = s.id
+"""
+
+def certificate_fields(row):
+    """Template fields for a request row from CERTIFICATE_QUERY"""
+    issued = row['reviewed_at'] or datetime.now()
+    return {
+        'name': row['name'].upper(),
+        'age': row['age'] if row['age'] is not None else 'of legal',
+        'civil_status': (row['civil_status'] or 'single').lower(),
+        'address': row['address'] or BARANGAY_NAME,
+        'purpose': row['purpose'] or 'whatever legal purpose it may serve',
+        'issued_on': issued.strftime('%B %d, %Y'),
+        'control_no': f"{issued.year}-{row['id']:06d}",
+        'secretary': (row['secretary'] or '').upper() or 'BARANGAY SECRETARY',
+    }
+
+def certificate_key(request_id, document_type):
+    """Storage key of the rendered certificate for the current template version"""
+    return f"certificates/{template_version(document_type)}/{request_id % 256:02x}/{request_id}.pdf"
+
+# =================================== WORKER POOL ===================================
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {'rendered': 0, 'cache_hits': 0, 'render_ms_total': 0.0, 'render_ms_max': 0.0}
+
+def _get_executor():
+    """Create the process pool lazily, once per (forked) worker process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # Spawned for the same reason as the password pool: forked children can hang on inherited locks
+            _executor = ProcessPoolExecutor(max_workers=CERTIFICATE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+def _record_render(elapsed_ms, count=1):
+    with _stats_lock:
+        _stats['rendered'] += count
+        _stats['render_ms_total'] += elapsed_ms
+        _stats['render_ms_max'] = max(_stats['render_ms_max'], elapsed_ms / count)
+
+# =================================== PUBLIC API ===================================
+def get_certificate(request_id, resident_id=None):
+    """
+    Storage key of the certificate for a request, rendering it in the pool if this template version
+    has not been rendered yet. Pass resident_id to only allow that resident's requests.
+    Returns (key, request row); raises CertificateError if it cannot be issued.
+    """
+    with db_session() as cursor:
+        cursor.execute(CERTIFICATE_QUERY + " WHERE rd.id = %s", (request_id,))
+        row = cursor.fetchone()
+    if row is None or row['document_type'] not in TEMPLATES:
+        raise CertificateError("No certificate template for this request")
+    if resident_id is not None and row['resident_id'] != resident_id:
+        raise CertificateError("This request belongs to another resident")
+    if row['status'] not in CERTIFICATE_STATUSES:
+        raise CertificateError("The request has not been approved yet")
+
+    key = certificate_key(row['id'], row['document_type'])
+    if storage.backend.exists(key):
+        with _stats_lock:
+            _stats['cache_hits'] += 1
+        return key, row
+
+    started = time.perf_counter()
+    future = _get_executor().submit(_render_job, (row['id'], row['document_type'], certificate_fields(row)))
+    try:
+        _, pdf = future.result(timeout=CERTIFICATE_TIMEOUT)
+    except FutureTimeoutError:
+        raise CertificateError("Certificate rendering timed out")
+    storage.put_object(key, pdf)
+    _record_render((time.perf_counter() - started) * 1000)
+    return key, row
+
+def render_day(day=None, force=False):
+    """
+    Bulk mode: render every 'To Pick Up' request approved on day (default today) in one pool job,
+    skipping ones already rendered unless force. Returns counts, elapsed seconds and documents per second.
+    """
+    day = day or date.today()
+    with db_session() as cursor:
+        cursor.execute(CERTIFICATE_QUERY + """
+            WHERE rd.status = 'To Pick Up'
+            AND rd.reviewed_at >= %s AND rd.reviewed_at < %s
+            AND rd.document_type = ANY(%s)
+            ORDER BY rd.id
+        """, (day, day + timedelta(days=1), list(TEMPLATES)))
+        rows = cursor.fetchall()
+
+    started = time.perf_counter()
+    jobs, cached = [], 0
+    for row in rows:
+        if not force and storage.backend.exists(certificate_key(row['id'], row['document_type'])):
+            cached += 1
+            continue
+        jobs.append((row['id'], row['document_type'], certificate_fields(row)))
+
+    types = {row['id']: row['document_type'] for row in rows}
+    rendered = 0
+    for request_id, pdf in _get_executor().map(_render_job, jobs, chunksize=CERTIFICATE_BATCH_CHUNK):
+        storage.put_object(certificate_key(request_id, types[request_id]), pdf)
+        rendered += 1
+
+    elapsed = time.perf_counter() - started
+    if rendered:
+        _record_render(elapsed * 1000, rendered)
+    return {
+        'day': day.isoformat(),
+        'requests': len(rows),
+        'rendered': rendered,
+        'cached': cached,
+        'seconds': round(elapsed, 3),
+        'documents_per_second': round(rendered / elapsed, 1) if elapsed and rendered else 0.0,
+    }
+
+def get_certificate_stats():
+    """Snapshot of render counts, storage cache hits and render latency for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['render_ms_avg'] = stats['render_ms_total'] / stats['rendered'] if stats['rendered'] else 0.0
+    stats['workers'] = CERTIFICATE_WORKERS
+    stats['versions'] = {document_type: template['version'] for document_type, template in COMPILED.items()}
+    return stats
+
+# =================================== ROUTES ===================================
+def download_certificate(request_id):
+    """Serve the certificate of an approved request to its resident, secretaries and treasurers"""
+    role = session.get('role')
+    if role not in ('resident', 'secretary', 'treasurer'):
+        return redirect(url_for('auth.login'))
+    try:
+        key, _ = get_certificate(request_id, session.get('id') if role == 'resident' else None)
+        return storage.backend.serve(key)
+    except CertificateError as e:
+        flash(str(e), 'danger')
+    except Exception as e:
+        flash('Error generating certificate', 'danger')
+        print(f"Certificate error: {e}")
+    return redirect(url_for(f'{role}.dashboard'))
+
+def init_app(app):
+    """Serve certificates at /certificates/<request_id>.pdf"""
+    app.add_url_rule('/certificates/<int:request_id>.pdf', 'certificate', download_certificate)
@@ -0,0 +1,178 @@
+from flask import Response
+from decimal import Decimal
+import csv
+import io
+import os
+import tempfile
+
+try:
+    import xlsxwriter
+except ImportError:  # XLSX export is optional; CSV always works
+    xlsxwriter = None
+
+# =================================== CONFIGURATION ===================================
+# Exports stream rows from a server-side cursor ordered by document type, so subtotals can be
+# written as each group ends and nothing larger than one batch is ever held in memory.
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK_SIZE = 64 * 1024
+
+FINANCIAL_COLUMNS = [
+    ('paid_at', 'Paid At'),
+    ('receipt_id', 'Receipt No.'),
+    ('request_id', 'Request No.'),
+    ('document_type', 'Document Type'),
+    ('resident_name', 'Resident'),
+    ('amount', 'Amount'),
+]
+
+FINANCIAL_EXPORT_QUERY = """
+    SELECT
+        r.paid_at,
+        r.id AS receipt_id,
+        rd.id AS request_id,
+        rd.document_type,
+        CONCAT(res.first_name, ' ', res.last_name) AS resident_name,
+        rd.price AS amount
+    FROM receipt r
+    JOIN request_document rd ON r.request_id = rd.id
+    LEFT JOIN resident res ON rd.resident_id = res.id
+    WHERE r.paid_at >= %s AND r.paid_at < %s
+    ORDER BY rd.document_type, r.paid_at, r.id
+"""
+
+RECEIPT_COLUMNS = [
+    ('receipt_id', 'Receipt No.'),
+    ('request_id', 'Request No.'),
+    ('created_at', 'Requested At'),
+    ('document_type', 'Document Type'),
+    ('resident_name', 'Resident'),
+    ('status', 'Status'),
+    ('payment_status', 'Payment Status'),
+    ('paid_at', 'Paid At'),
+    ('amount', 'Amount'),
+]
+
+RECEIPTS_EXPORT_QUERY = """
+    SELECT
+        receipt.id AS receipt_id,
+        request_document.id AS request_id,
+        request_document.created_at,
+        request_document.document_type,
+        CONCAT(first_name, ' ', last_name) AS resident_name,
+        request_document.status,
+        receipt.payment_status,
+        receipt.paid_at,
+        request_document.price AS amount
+    FROM receipt
+    JOIN request_document ON receipt.request_id = request_document.id
+    LEFT JOIN resident ON request_document.resident_id = resident.id
+    WHERE request_document.status IN ('To Pay', 'Released', 'To Pick Up')
+    ORDER BY request_document.document_type, request_document.created_at, receipt.id
+"""
+
+# =================================== SUBTOTALS ===================================
+def with_subtotals(rows, columns):
+    """
+    Turn rows ordered by document_type into lists of cell values, inserting a subtotal line after
+    each document type and a grand total at the end. Yields (kind, values), kind being 'row', 'subtotal' or 'total'.
+    """
+    keys = [key for key, _ in columns]
+    amount_index = keys.index('amount')
+    label_index = keys.index('document_type')
+
+    def summary(label, count, amount):
+        values = [''] * len(keys)
+        values[0] = label
+        values[label_index] = f"{count} document(s)"
+        values[amount_index] = amount
+        return values
+
+    current, count, amount = None, 0, Decimal(0)
+    total_count, total_amount = 0, Decimal(0)
+    for row in rows:
+        if current is not None and row['document_type'] != current:
+            yield 'subtotal', summary(f"Subtotal: {current}", count, amount)
+            count, amount = 0, Decimal(0)
+        current = row['document_type']
+        count += 1
+        amount += row['amount'] or 0
+        total_count += 1
+        total_amount += row['amount'] or 0
+        yield 'row', [row[key] for key in keys]
+
+    if current is not None:
+        yield 'subtotal', summary(f"Subtotal: {current}", count, amount)
+    yield 'total', summary('Total', total_count, total_amount)
+
+# =================================== WRITERS ===================================
+def iter_csv(rows, columns):
+    """Yield the CSV export in chunks of CSV_FLUSH_ROWS lines"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([title for _, title in columns])
+    pending = 1
+    for _, values in with_subtotals(rows, columns):
+        writer.writerow(['' if value is None else value for value in values])
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+def write_xlsx(rows, columns, path, sheet_name='Export'):
+    """Write the export to an XLSX file at path, flushing each row to disk as it is written"""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'remove_timezone': True})
+    try:
+        sheet = workbook.add_worksheet(sheet_name[:31])
+        bold = workbook.add_format({'bold': True})
+        money = workbook.add_format({'num_format': '#,##0.00'})
+        bold_money = workbook.add_format({'bold': True, 'num_format': '#,##0.00'})
+        dates = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm'})
+        amount_index = [key for key, _ in columns].index('amount')
+
+        sheet.write_row(0, 0, [title for _, title in columns], bold)
+        for row_number, (kind, values) in enumerate(with_subtotals(rows, columns), start=1):
+            summary = kind != 'row'
+            for column, value in enumerate(values):
+                if column == amount_index:
+                    sheet.write_number(row_number, column, float(value or 0), bold_money if summary else money)
+                elif hasattr(value, 'year') and hasattr(value, 'hour'):
+                    sheet.write_datetime(row_number, column, value, dates)
+                elif value is not None and value != '':
+                    sheet.write(row_number, column, value, bold if summary else None)
+    finally:
+        workbook.close()
+
+def iter_xlsx(rows, columns, sheet_name):
+    """Build the XLSX in a temporary file (rows are streamed into it), then yield the file in chunks"""
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        write_xlsx(rows, columns, path, sheet_name)
+        with open(path, 'rb') as output:
+            while True:
+                chunk = output.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+def export_response(rows, columns, filename, export_format='csv'):
+    """Streaming download response for rows in CSV (default) or XLSX"""
+    if export_format == 'xlsx':
+        if xlsxwriter is None:
+            raise RuntimeError("XLSX export requires the xlsxwriter package")
+        body = iter_xlsx(rows, columns, filename)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        export_format = 'csv'
+        body = iter_csv(rows, columns)
+        mimetype = 'text/csv'
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}.{export_format}"',
+        'X-Accel-Buffering': 'no',
+    })
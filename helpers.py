@@ -1,245 +1,1174 @@
-from flask import session
+from flask import session, request, jsonify, flash, redirect
+from contextlib import contextmanager
 from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
-import schedule
+from instrumentation import InstrumentedCursor, record_pool_wait
+from cache import cached, Uncacheable
+import psycopg2
+import os
+import sys
+import atexit
+import heapq
+import itertools
+import select
 import time
 import threading
 from datetime import datetime
 
-try:
-    database = pool.ThreadedConnectionPool(
-        minconn=1,
-        maxconn=10,
-        host='localhost',
-        user='postgres', 
-        password='unoserrato05',
-        database='barangaydb',
-        port=5432
-    )
+def _env_flag(name, default='false'):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
 
-    if database:
-        print("Connection pool created successfully.")
+DB_PARAMS = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', 'unoserrato05'),
+    'database': os.environ.get('DB_NAME', 'barangaydb'),
+    'port': int(os.environ.get('DB_PORT', 5432)),
+}
 
-except Exception as e:
-    print("Error creating connection pool:", e)
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+POOL_PREWARM = int(os.environ.get('DB_POOL_PREWARM', POOL_MIN))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+POOL_LONG_HELD_SECONDS = float(os.environ.get('DB_POOL_LONG_HELD_SECONDS', 10))
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
 
-def get_current_user_info():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(f"SELECT * FROM {session['role']} WHERE id = %s", (session['id'],))
-    user = cursor.fetchone()
-    database.putconn(conn)  
-    return user
-
-def get_all_resident_info(filter='Default'):
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    if filter == 'Default':
-        cursor.execute("SELECT *, CONCAT(first_name, ' ', last_name) as name FROM resident ORDER BY id")
-    elif filter == 'Online':
-        cursor.execute("SELECT *, CONCAT(first_name, ' ', last_name) as name FROM resident WHERE is_active = true ORDER BY id")
-    elif filter == 'Offline':
-        cursor.execute("SELECT *, CONCAT(first_name, ' ', last_name) as name FROM resident WHERE is_active = false ORDER BY id")
-    resident = cursor.fetchall()
-    database.putconn(conn)
-
-    return resident
+# Transaction-pooling mode (PgBouncer pool_mode=transaction): a server connection only belongs
+# to us for one transaction, so nothing may rely on session state. statement_timeout is applied
+# with SET LOCAL per transaction instead of as a startup option, advisory locks are xact-scoped,
+# and LISTEN needs a direct connection (DB_LISTEN_HOST/DB_LISTEN_PORT) or is skipped.
+PGBOUNCER_MODE = _env_flag('DB_PGBOUNCER')
+LISTEN_PARAMS = dict(DB_PARAMS,
+                     host=os.environ.get('DB_LISTEN_HOST', DB_PARAMS['host']),
+                     port=int(os.environ.get('DB_LISTEN_PORT', DB_PARAMS['port'])))
+LISTEN_ENABLED = not PGBOUNCER_MODE or 'DB_LISTEN_HOST' in os.environ or 'DB_LISTEN_PORT' in os.environ
 
-def get_active_admins():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+# A user counts as online if they made a request within PRESENCE_WINDOW seconds (see PRESENCE below)
+PRESENCE_WINDOW = int(os.environ.get('PRESENCE_WINDOW', 300))
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', 15))
+PRESENCE_RESOLUTION = float(os.environ.get('PRESENCE_RESOLUTION', 60))
+ONLINE_CONDITION = f"last_seen_at >= NOW() - INTERVAL '{PRESENCE_WINDOW} seconds'"
+OFFLINE_CONDITION = f"(last_seen_at IS NULL OR last_seen_at < NOW() - INTERVAL '{PRESENCE_WINDOW} seconds')"
 
-    cursor.execute("""
-        SELECT 'secretary' as role, id, username, is_active 
-        FROM secretary 
-        WHERE is_active = true
-        UNION ALL
-        SELECT 'treasurer' as role, id, username, is_active 
-        FROM treasurer 
-        WHERE is_active = true
-    """)
-    admins = cursor.fetchall()
-    database.putconn(conn)
+def connection_params():
+    """Connection arguments for pooled connections"""
+    params = dict(DB_PARAMS)
+    if STATEMENT_TIMEOUT_MS and not PGBOUNCER_MODE:
+        params['options'] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    return params
 
-    return admins
+# The pool is created lazily, once per process, so forked workers never share sockets
+database = None
+_database_pid = None
+_database_lock = threading.Lock()
 
-def get_current_user_reports():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT community_report.*, secretary.username FROM community_report LEFT JOIN secretary ON community_report.reviewed_by = secretary.id WHERE resident_id = %s ORDER BY posted_at DESC", (session['id'],))
-    reports = cursor.fetchall()
-    database.putconn(conn)
-    return reports
-
-def get_all_reports(category='default'):
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    if category == 'default':
-        cursor.execute("""
-            SELECT 
-                community_report.*,
-                resident.first_name, resident.last_name,
-            CONCAT(resident.first_name, ' ', resident.last_name) as name 
-        FROM community_report 
-        LEFT JOIN resident ON community_report.resident_id = resident.id 
-        ORDER BY posted_at DESC
-        """)
-    reports = cursor.fetchall()
-    database.putconn(conn)
-    return reports
-
-def get_all_requests(filter='Default'):
-    """
-    Fetch all document requests with resident information.
-    Returns a list of requests with resident details.
-    """
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+def get_pool():
+    """Return this process's connection pool, creating it on first use"""
+    global database, _database_pid
+    if database is not None and _database_pid == os.getpid():
+        return database
+    with _database_lock:
+        if database is None or _database_pid != os.getpid():
+            database = pool.ThreadedConnectionPool(
+                minconn=POOL_MIN,
+                maxconn=POOL_MAX,
+                **connection_params()
+            )
+            _database_pid = os.getpid()
+            print(f"Connection pool created successfully (pid {_database_pid}).")
+    return database
+
+def prewarm_pool(count=None):
+    """Open and verify `count` pooled connections up front (default DB_POOL_PREWARM)"""
+    count = min(POOL_PREWARM if count is None else count, POOL_MAX)
+    conns = []
     try:
-        # Join request_document with resident table to get resident information
-        if filter == 'Default':
-            query = """
-                SELECT 
-                    rd.id,
-                rd.document_type,
-                rd.price,
-                rd.requirements,
-                rd.created_at,
-                rd.status,
-                rd.reviewed_by,
-                CONCAT(r.first_name, ' ', r.last_name) as name
-            FROM request_document rd
-            JOIN resident r ON rd.resident_id = r.id
-            ORDER BY rd.created_at DESC
-            """
-            cursor.execute(query)
-        else:
-            query = """
-                SELECT 
-                    rd.id,
-                rd.document_type,
-                rd.price,
-                rd.requirements,
-                rd.created_at,
-                rd.status,
-                rd.reviewed_by,
-                CONCAT(r.first_name, ' ', r.last_name) as name
-            FROM request_document rd
-            JOIN resident r ON rd.resident_id = r.id
-            WHERE rd.status = %s
-            ORDER BY rd.created_at DESC
-            """
-            cursor.execute(query, (filter,))
-        requests = cursor.fetchall()
-        return requests
+        for _ in range(count):
+            conn = checkout_connection('prewarm_pool')
+            conns.append(conn)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
     except Exception as e:
-        print(f"Error fetching requests: {e}")
-        return []
+        print("Error prewarming connection pool:", e)
     finally:
-        database.putconn(conn)
+        for conn in conns:
+            return_connection(conn)
+    return len(conns)
+
+# =================================== POOLED SESSIONS ===================================
+# All database access goes through db_session(), which guarantees the connection is returned
+# to the pool. Checkouts wait up to POOL_CHECKOUT_TIMEOUT for a free connection instead of
+# failing with PoolError, and every checkout is tracked so leaks and long holds are visible.
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within POOL_CHECKOUT_TIMEOUT"""
+
+_pool_slots = threading.BoundedSemaphore(POOL_MAX)
+_pool_lock = threading.Lock()
+_checked_out = {}
+_pool_stats = {
+    'checkouts': 0,
+    'timeouts': 0,
+    'waiters': 0,
+    'wait_ms_total': 0.0,
+    'wait_ms_max': 0.0,
+    'long_held': 0,
+}
 
-def set_inactive_last_login():
+def checkout_connection(caller='unknown'):
+    """Take a connection from the pool, waiting up to POOL_CHECKOUT_TIMEOUT; pair with return_connection"""
+    started = time.perf_counter()
+    with _pool_lock:
+        _pool_stats['waiters'] += 1
     try:
-        conn = database.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(f"UPDATE {session['role']} SET is_active = false WHERE id = %s", (session['id'],))
-        conn.commit()
-        database.putconn(conn)  
-    except Exception as e:
-        print("Error logging out last login:", e)
+        acquired = _pool_slots.acquire(timeout=POOL_CHECKOUT_TIMEOUT)
+    finally:
+        with _pool_lock:
+            _pool_stats['waiters'] -= 1
+
+    wait_ms = (time.perf_counter() - started) * 1000
+    record_pool_wait(wait_ms)
+    if not acquired:
+        with _pool_lock:
+            _pool_stats['timeouts'] += 1
+        raise PoolTimeout(f"No database connection available after {POOL_CHECKOUT_TIMEOUT}s ({caller})")
+
+    try:
+        conn = get_pool().getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+    with _pool_lock:
+        _pool_stats['checkouts'] += 1
+        _pool_stats['wait_ms_total'] += wait_ms
+        _pool_stats['wait_ms_max'] = max(_pool_stats['wait_ms_max'], wait_ms)
+        _checked_out[id(conn)] = {
+            'caller': caller,
+            'thread': threading.current_thread().name,
+            'since': time.monotonic(),
+        }
+    return conn
+
+def return_connection(conn):
+    """Hand a connection back to the pool; warns when it was held for too long"""
+    with _pool_lock:
+        holder = _checked_out.pop(id(conn), None)
+    if holder:
+        held = time.monotonic() - holder['since']
+        if held > POOL_LONG_HELD_SECONDS:
+            with _pool_lock:
+                _pool_stats['long_held'] += 1
+            print(f"Connection held for {held:.1f}s by {holder['caller']} ({holder['thread']})")
+    try:
+        get_pool().putconn(conn, close=conn.closed != 0)
+    finally:
+        _pool_slots.release()
+
+@contextmanager
+def db_session(commit=False):
+    """
+    Check out a pooled connection and yield a RealDictCursor that records every statement.
+    Commits on success when commit=True, rolls back on error, and always returns the connection.
+    """
+    # Frame 2 is the function that entered the with-block (frame 1 is contextlib)
+    frame = sys._getframe(2)
+    caller = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+    conn = checkout_connection(caller)
+    try:
+        cursor = conn.cursor(cursor_factory=InstrumentedCursor)
+        cursor.caller = caller
+        if STATEMENT_TIMEOUT_MS and PGBOUNCER_MODE:
+            cursor.execute("SET LOCAL statement_timeout = %s", (STATEMENT_TIMEOUT_MS,))
+        yield cursor
+        if commit:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
+
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 2000))
+_stream_ids = itertools.count(1)
+
+def stream_rows(query, params=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Iterate over a query's rows through a server-side (named) cursor, batch_size rows at a time.
+    The connection is checked out on the first row and held until the iterator is exhausted or closed.
+    """
+    frame = sys._getframe(1)
+    caller = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+    def rows():
+        conn = checkout_connection(caller)
+        try:
+            with conn.cursor(name=f"stream_{os.getpid()}_{next(_stream_ids)}", cursor_factory=InstrumentedCursor) as cursor:
+                cursor.caller = caller
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                yield from cursor
+        finally:
+            # Read-only, so end the transaction either way; this also drops the cursor
+            if not conn.closed:
+                conn.rollback()
+            return_connection(conn)
+    return rows()
+
+def pool_stats():
+    """Pool usage for sizing: connections in use, waiters, wait times and current long holders"""
+    now = time.monotonic()
+    with _pool_lock:
+        stats = dict(_pool_stats)
+        holders = list(_checked_out.values())
+    stats['size'] = POOL_MAX
+    stats['in_use'] = len(holders)
+    stats['wait_ms_avg'] = stats['wait_ms_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    stats['held_too_long'] = [
+        {'caller': h['caller'], 'thread': h['thread'], 'seconds': round(now - h['since'], 1)}
+        for h in holders if now - h['since'] > POOL_LONG_HELD_SECONDS
+    ]
+    return stats
+
+# =================================== PAGINATION ===================================
+# Listings use keyset (cursor) pagination: each page returns the position of its last row,
+# and the next page continues strictly after it. Cursors are opaque strings in URLs.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COMMENT_PREVIEW_SIZE = 3
+
+def page_limit(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) keyset position"""
+    return f"{timestamp.isoformat()}_{row_id}"
+
+def decode_cursor(cursor):
+    """Decode a (timestamp, id) keyset position; returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+def _keyset_params(before):
+    """before_at/before_id parameters for a keyset cursor, both None on the first page"""
+    position = decode_cursor(before)
+    return {'before_at': position[0], 'before_id': position[1]} if position else {'before_at': None, 'before_id': None}
+
+def get_current_user_info():
+    with db_session() as cursor:
+        cursor.execute(f"SELECT * FROM {session['role']} WHERE id = %s", (session['id'],))
+        return cursor.fetchone()
+
+ACCOUNT_LOOKUP_QUERY = """
+    SELECT
+        accounts.role,
+        accounts.id,
+        accounts.email,
+        accounts.password,
+        active_sanction.reason AS sanction_reason,
+        active_sanction.expires_at AS sanction_expires_at
+    FROM (
+        SELECT 1 AS priority, 'resident' AS role, id, email, password FROM resident WHERE email = %(email)s
+        UNION ALL
+        SELECT 2 AS priority, 'secretary' AS role, id, email, password FROM secretary WHERE email = %(email)s
+        UNION ALL
+        SELECT 3 AS priority, 'treasurer' AS role, id, email, password FROM treasurer WHERE email = %(email)s
+    ) AS accounts
+    LEFT JOIN LATERAL (
+        SELECT reason, expires_at
+        FROM sanctions
+        WHERE accounts.role = 'resident'
+        AND sanctions.resident_id = accounts.id
+        AND sanctions.expires_at > NOW()
+        ORDER BY sanctions.expires_at DESC
+        LIMIT 1
+    ) AS active_sanction ON true
+    ORDER BY accounts.priority
+    LIMIT 1
+"""
+
+def get_account_by_email(email, cursor=None):
+    """
+    Resolve an email to its account across the resident, secretary and treasurer tables.
+    Returns role, id, password hash and any active sanction in one round-trip, or None.
+    Pass an open cursor to run the lookup inside the caller's transaction.
+    """
+    if cursor is not None:
+        cursor.execute(ACCOUNT_LOOKUP_QUERY, {'email': email})
+        return cursor.fetchone()
+
+    with db_session() as cursor:
+        cursor.execute(ACCOUNT_LOOKUP_QUERY, {'email': email})
+        return cursor.fetchone()
+
+# Optional filters and keyset positions are passed as NULL when unused. The planner folds the
+# constant tests away, so each call is planned as if only the conditions in use were written.
+RESIDENTS_PAGE_QUERY = f"""
+    SELECT *, CONCAT(first_name, ' ', last_name) as name, COALESCE({ONLINE_CONDITION}, false) AS is_online 
+    FROM resident 
+    WHERE (%(online)s::boolean IS NOT TRUE OR {ONLINE_CONDITION}) 
+    AND (%(online)s::boolean IS NOT FALSE OR {OFFLINE_CONDITION}) 
+    AND (%(after)s::int IS NULL OR id > %(after)s) 
+    ORDER BY id 
+    LIMIT %(limit)s
+"""
+
+@cached('residents')
+def get_all_resident_info(filter='Default', after=None, limit=PAGE_SIZE):
+    """
+    Fetch one page of residents ordered by id.
+    `after` is the id cursor returned with the previous page. Returns (residents, next_cursor).
+    """
+    limit = page_limit(limit)
+    params = {
+        'online': {'Online': True, 'Offline': False}.get(filter),
+        'after': int(after) if after else None,
+        'limit': limit + 1,
+    }
+    with db_session() as cursor:
+        cursor.execute(RESIDENTS_PAGE_QUERY, params)
+        residents = cursor.fetchall()
+
+    next_cursor = residents[limit - 1]['id'] if len(residents) > limit else None
+    return residents[:limit], next_cursor
+
+# =================================== DASHBOARD SUMMARIES ===================================
+# Dashboards show counts and a few recent rows, so these fetch only that instead of full pages.
+DASHBOARD_RECENT = 5
+
+# The total is kept in resident_counts by triggers on resident (migration 0012); online is a range scan of the last_seen_at index
+RESIDENT_COUNTS_QUERY = f"""
+    SELECT total, online, total - online AS offline 
+    FROM resident_counts, 
+        (SELECT COUNT(*) AS online FROM resident WHERE {ONLINE_CONDITION}) seen
+"""
+
+# Only open requests are counted: settled ones grow without bound and are read from the listings.
+# The IN list is spelled out in the query so it matches the partial index from migration 0008.
+OPEN_REQUEST_STATUSES = ['Pending', 'To Pay', 'To Pick Up']
+
+REQUEST_COUNTS_QUERY = """
+    SELECT status, COUNT(*) AS count 
+    FROM request_document 
+    WHERE status IN ('Pending', 'To Pay', 'To Pick Up') 
+    GROUP BY status
+"""
+
+RECENT_RESIDENTS_QUERY = f"""
+    SELECT id, CONCAT(first_name, ' ', last_name) AS name, email, COALESCE({ONLINE_CONDITION}, false) AS is_online 
+    FROM resident 
+    ORDER BY id DESC 
+    LIMIT %s
+"""
+
+ONLINE_RESIDENTS_QUERY = f"""
+    SELECT id, CONCAT(first_name, ' ', last_name) AS name, last_seen_at 
+    FROM resident 
+    WHERE {ONLINE_CONDITION} 
+    ORDER BY last_seen_at DESC, id 
+    LIMIT %s
+"""
+
+RECENT_REQUESTS_QUERY = """
+    SELECT rd.id, rd.document_type, rd.status, rd.created_at, CONCAT(r.first_name, ' ', r.last_name) AS name 
+    FROM request_document rd 
+    JOIN resident r ON rd.resident_id = r.id 
+    ORDER BY rd.created_at DESC, rd.id DESC 
+    LIMIT %s
+"""
+
+@cached('residents')
+def get_resident_counts():
+    """Total, online and offline resident counts"""
+    with db_session() as cursor:
+        cursor.execute(RESIDENT_COUNTS_QUERY)
+        return cursor.fetchone()
+
+@cached('requests')
+def get_request_counts():
+    """Open document request counts keyed by status (zero for statuses with none), plus 'Total'"""
+    with db_session() as cursor:
+        cursor.execute(REQUEST_COUNTS_QUERY)
+        counts = dict.fromkeys(OPEN_REQUEST_STATUSES, 0)
+        counts.update((row['status'], row['count']) for row in cursor.fetchall())
+    counts['Total'] = sum(counts.values())
+    return counts
+
+@cached('residents')
+def get_recent_residents(limit=DASHBOARD_RECENT):
+    """Most recently registered residents with only the columns the dashboard shows"""
+    with db_session() as cursor:
+        cursor.execute(RECENT_RESIDENTS_QUERY, (limit,))
+        return cursor.fetchall()
+
+@cached('residents')
+def get_online_residents(limit=DASHBOARD_RECENT):
+    """A few of the most recently seen online residents (id, name and last_seen_at)"""
+    with db_session() as cursor:
+        cursor.execute(ONLINE_RESIDENTS_QUERY, (limit,))
+        return cursor.fetchall()
+
+@cached('requests')
+def get_recent_requests(limit=DASHBOARD_RECENT):
+    """Newest document requests with only the columns the dashboard shows"""
+    with db_session() as cursor:
+        cursor.execute(RECENT_REQUESTS_QUERY, (limit,))
+        return cursor.fetchall()
+
+ACTIVE_ADMINS_QUERY = f"""
+    SELECT 'secretary' as role, id, username, last_seen_at 
+    FROM secretary 
+    WHERE {ONLINE_CONDITION}
+    UNION ALL
+    SELECT 'treasurer' as role, id, username, last_seen_at 
+    FROM treasurer 
+    WHERE {ONLINE_CONDITION}
+"""
+
+def get_active_admins():
+    with db_session() as cursor:
+        cursor.execute(ACTIVE_ADMINS_QUERY)
+        return cursor.fetchall()
 
-def set_active_last_login():
+USER_REPORTS_QUERY = "SELECT community_report.*, secretary.username FROM community_report LEFT JOIN secretary ON community_report.reviewed_by = secretary.id WHERE resident_id = %s ORDER BY posted_at DESC"
+
+def get_current_user_reports():
+    with db_session() as cursor:
+        cursor.execute(USER_REPORTS_QUERY, (session['id'],))
+        return cursor.fetchall()
+
+REPORTS_PAGE_QUERY = """
+    SELECT 
+        community_report.*,
+        resident.first_name, resident.last_name,
+        CONCAT(resident.first_name, ' ', resident.last_name) as name 
+    FROM community_report 
+    LEFT JOIN resident ON community_report.resident_id = resident.id 
+    WHERE (%(before_at)s::timestamp IS NULL OR (community_report.posted_at, community_report.id) < (%(before_at)s, %(before_id)s))
+    ORDER BY community_report.posted_at DESC, community_report.id DESC
+    LIMIT %(limit)s
+"""
+
+def get_all_reports(category='default', before=None, limit=PAGE_SIZE):
+    """
+    Fetch one page of community reports, newest first.
+    `before` is the (posted_at, id) cursor returned with the previous page. Returns (reports, next_cursor).
+    """
+    if category != 'default':
+        return [], None
+
+    limit = page_limit(limit)
+    with db_session() as cursor:
+        cursor.execute(REPORTS_PAGE_QUERY, dict(_keyset_params(before), limit=limit + 1))
+        reports = cursor.fetchall()
+
+    next_cursor = None
+    if len(reports) > limit:
+        next_cursor = encode_cursor(reports[limit - 1]['posted_at'], reports[limit - 1]['id'])
+    return reports[:limit], next_cursor
+
+# Joins request_document with resident to get resident information
+REQUESTS_PAGE_QUERY = """
+    SELECT 
+        rd.id,
+        rd.document_type,
+        rd.price,
+        rd.requirements,
+        rd.created_at,
+        rd.status,
+        rd.reviewed_by,
+        CONCAT(r.first_name, ' ', r.last_name) as name
+    FROM request_document rd
+    JOIN resident r ON rd.resident_id = r.id
+    WHERE (%(status)s::text IS NULL OR rd.status = %(status)s)
+    AND (%(before_at)s::timestamp IS NULL OR (rd.created_at, rd.id) < (%(before_at)s, %(before_id)s))
+    ORDER BY rd.created_at DESC, rd.id DESC
+    LIMIT %(limit)s
+"""
+
+@cached('requests')
+def get_all_requests(filter='Default', before=None, limit=PAGE_SIZE):
+    """
+    Fetch one page of document requests with resident information, newest first.
+    `before` is the (created_at, id) cursor returned with the previous page. Returns (requests, next_cursor).
+    """
+    limit = page_limit(limit)
+    params = dict(_keyset_params(before), status=None if filter == 'Default' else filter, limit=limit + 1)
     try:
-        conn = database.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(f"UPDATE {session['role']} SET is_active = true WHERE id = %s", (session['id'],))
-        conn.commit()
-        database.putconn(conn)
+        with db_session() as cursor:
+            cursor.execute(REQUESTS_PAGE_QUERY, params)
+            requests = cursor.fetchall()
     except Exception as e:
-        print("Error logging out last login:", e)
+        print(f"Error fetching requests: {e}")
+        raise Uncacheable(([], None))
 
-def get_all_updates():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("""
-        SELECT 
-            community_update.*, 
-            secretary.username,
-            (SELECT COUNT(*) FROM comments WHERE post_id = community_update.id) as comment_count 
-        FROM community_update 
-        JOIN secretary ON community_update.created_by = secretary.id 
-        ORDER BY created_at DESC
-    """)
-    updates = cursor.fetchall()
-    database.putconn(conn)
-    return updates
-
-
-def get_update_by_id(update_id):
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # get update by id
-    cursor.execute("SELECT community_update.*, secretary.username FROM community_update JOIN secretary ON community_update.created_by = secretary.id WHERE community_update.id = %s ORDER BY created_at DESC ", (update_id,))
-    update = cursor.fetchone()
-
-    # get comments by update id
-    cursor.execute("SELECT comments.*, (SELECT CONCAT(first_name, ' ', last_name) FROM resident WHERE id=comments.created_by) as name FROM comments JOIN resident ON resident.id=comments.created_by WHERE post_id = %s ORDER BY created_at DESC", (update_id,))
-    comments = cursor.fetchall()
-    database.putconn(conn)
-    return update, comments
-
-def get_all_comments():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM comments")
-    comments = cursor.fetchall()
-    database.putconn(conn)
+    next_cursor = None
+    if len(requests) > limit:
+        next_cursor = encode_cursor(requests[limit - 1]['created_at'], requests[limit - 1]['id'])
+    return requests[:limit], next_cursor
+
+UPDATES_PAGE_QUERY = """
+    SELECT 
+        community_update.*, 
+        secretary.username
+    FROM community_update 
+    JOIN secretary ON community_update.created_by = secretary.id 
+    WHERE (%(before_at)s::timestamp IS NULL OR (community_update.created_at, community_update.id) < (%(before_at)s, %(before_id)s))
+    ORDER BY community_update.created_at DESC, community_update.id DESC
+    LIMIT %(limit)s
+"""
+
+def get_all_updates(before=None, limit=PAGE_SIZE):
+    """
+    Fetch one page of community updates, newest first, with their stored comment and vote counters.
+    `before` is the (created_at, id) cursor returned with the previous page. Returns (updates, next_cursor).
+    """
+    limit = page_limit(limit)
+    with db_session() as cursor:
+        cursor.execute(UPDATES_PAGE_QUERY, dict(_keyset_params(before), limit=limit + 1))
+        updates = cursor.fetchall()
+
+    next_cursor = None
+    if len(updates) > limit:
+        next_cursor = encode_cursor(updates[limit - 1]['created_at'], updates[limit - 1]['id'])
+    return updates[:limit], next_cursor
+
+UPDATE_WITH_COMMENTS_QUERY = """
+    WITH page AS (
+        SELECT comments.*, CONCAT(resident.first_name, ' ', resident.last_name) AS name
+        FROM comments 
+        JOIN resident ON resident.id = comments.created_by 
+        WHERE comments.post_id = %(update_id)s
+        AND (%(before_at)s::timestamp IS NULL OR (comments.created_at, comments.id) < (%(before_at)s, %(before_id)s))
+        ORDER BY comments.created_at DESC, comments.id DESC
+        LIMIT %(limit)s
+    )
+    SELECT 
+        community_update.*, 
+        secretary.username,
+        COALESCE((SELECT json_agg(page ORDER BY page.created_at DESC, page.id DESC) FROM page), '[]') AS comment_page
+    FROM community_update 
+    JOIN secretary ON community_update.created_by = secretary.id 
+    WHERE community_update.id = %(update_id)s
+"""
+
+def get_update_by_id(update_id, before=None, limit=PAGE_SIZE):
+    """
+    Fetch an update together with one page of its comments (newest first) in a single statement.
+    `before` is the cursor of an older comments page. Returns (update, comments, next_cursor).
+    """
+    limit = page_limit(limit)
+    with db_session() as cursor:
+        cursor.execute(UPDATE_WITH_COMMENTS_QUERY, dict(_keyset_params(before), update_id=update_id, limit=limit + 1))
+        update = cursor.fetchone()
+
+    if not update:
+        return None, [], None
+
+    comments = update.pop('comment_page')
+    for comment in comments:
+        comment['created_at'] = datetime.fromisoformat(comment['created_at'])
+
+    next_cursor = None
+    if len(comments) > limit:
+        next_cursor = encode_cursor(comments[limit - 1]['created_at'], comments[limit - 1]['id'])
+    return update, comments[:limit], next_cursor
+
+RECENT_COMMENTS_QUERY = """
+    SELECT recent.*, CONCAT(resident.first_name, ' ', resident.last_name) AS name
+    FROM unnest(%s::int[]) AS page(update_id)
+    CROSS JOIN LATERAL (
+        SELECT * FROM comments 
+        WHERE comments.post_id = page.update_id 
+        ORDER BY comments.created_at DESC, comments.id DESC 
+        LIMIT %s
+    ) recent
+    JOIN resident ON resident.id = recent.created_by
+    ORDER BY recent.post_id, recent.created_at DESC, recent.id DESC
+"""
+
+def get_recent_comments(update_ids, per_update=COMMENT_PREVIEW_SIZE):
+    """Fetch the newest `per_update` comments for each of the given updates in one query; returns {update_id: [comments]}"""
+    comments = {update_id: [] for update_id in update_ids}
+    if not comments:
+        return comments
+    with db_session() as cursor:
+        cursor.execute(RECENT_COMMENTS_QUERY, (list(comments), per_update))
+        for comment in cursor.fetchall():
+            comments[comment['post_id']].append(comment)
     return comments
 
+COMMENTS_PAGE_QUERY = """
+    SELECT comments.*, CONCAT(resident.first_name, ' ', resident.last_name) AS name
+    FROM comments 
+    JOIN resident ON resident.id = comments.created_by 
+    WHERE comments.post_id = %(update_id)s
+    AND (%(before_at)s::timestamp IS NULL OR (comments.created_at, comments.id) < (%(before_at)s, %(before_id)s))
+    ORDER BY comments.created_at DESC, comments.id DESC
+    LIMIT %(limit)s
+"""
+
+def get_comments_page(update_id, before=None, limit=PAGE_SIZE):
+    """
+    Fetch one page of an update's comments, newest first.
+    `before` is the (created_at, id) cursor returned with the previous page. Returns (comments, next_cursor).
+    """
+    limit = page_limit(limit)
+    with db_session() as cursor:
+        cursor.execute(COMMENTS_PAGE_QUERY, dict(_keyset_params(before), update_id=update_id, limit=limit + 1))
+        comments = cursor.fetchall()
+
+    next_cursor = None
+    if len(comments) > limit:
+        next_cursor = encode_cursor(comments[limit - 1]['created_at'], comments[limit - 1]['id'])
+    return comments[:limit], next_cursor
+
 def get_all_sanctions():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cursor.execute("SELECT * FROM sanctions")
-    sanctions = cursor.fetchall()
-    database.putconn(conn)
-    return sanctions
-
-def constant_updates():
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("DELETE FROM sanctions WHERE expires_at < NOW()")
-    conn.commit()
-    database.putconn(conn)
-
-def update_sanctions():
-    """Update expired sanctions and resident status"""
-    conn = database.getconn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    print(f"[{datetime.now()}] Sanctions scheduler thread started")
-    try:
-        # Delete expired sanctions
+    with db_session() as cursor:
+        cursor.execute("SELECT * FROM sanctions")
+        return cursor.fetchall()
+
+# =================================== VOTES ===================================
+# Votes live in update_votes, one row per (update, resident) with value 1 or -1.
+# community_update.up_count/down_count are adjusted by the same transaction.
+UP_VOTE = 1
+DOWN_VOTE = -1
+
+def _adjust_vote_counts(cursor, update_id, up_delta, down_delta):
+    if up_delta or down_delta:
         cursor.execute("""
-            DELETE FROM sanctions 
-            WHERE expires_at < NOW()
-        """)
-        
-        conn.commit()
+            UPDATE community_update 
+            SET up_count = up_count + %s, down_count = down_count + %s 
+            WHERE id = %s
+        """, (up_delta, down_delta, update_id))
+
+def cast_vote(cursor, update_id, resident_id, value):
+    """Record an up (1) or down (-1) vote, switching sides if the resident already voted the other way"""
+    cursor.execute("""
+        INSERT INTO update_votes (update_id, resident_id, value) 
+        VALUES (%s, %s, %s)
+        ON CONFLICT (update_id, resident_id) 
+        DO UPDATE SET value = EXCLUDED.value, voted_at = NOW() 
+        WHERE update_votes.value <> EXCLUDED.value
+        RETURNING (xmax = 0) AS inserted
+    """, (update_id, resident_id, value))
+    row = cursor.fetchone()
+    if not row:
+        return  # same vote already recorded
+
+    # A fresh insert only adds to one side; an update moves the vote from the other side
+    previous = 0 if row['inserted'] else -value
+    _adjust_vote_counts(cursor, update_id,
+                        (value == UP_VOTE) - (previous == UP_VOTE),
+                        (value == DOWN_VOTE) - (previous == DOWN_VOTE))
+
+def retract_vote(cursor, update_id, resident_id, value):
+    """Remove the resident's vote if it matches value"""
+    cursor.execute("""
+        DELETE FROM update_votes 
+        WHERE update_id = %s AND resident_id = %s AND value = %s 
+        RETURNING value
+    """, (update_id, resident_id, value))
+    if cursor.fetchone():
+        _adjust_vote_counts(cursor, update_id, -(value == UP_VOTE), -(value == DOWN_VOTE))
+
+MY_VOTES_QUERY = """
+    SELECT update_id, value FROM update_votes 
+    WHERE resident_id = %s AND update_id = ANY(%s)
+"""
+
+def get_my_votes(update_ids, resident_id=None):
+    """Map update id -> 1/-1 for the updates the resident has voted on"""
+    resident_id = resident_id or session.get('id')
+    if not update_ids or not resident_id:
+        return {}
+    with db_session() as cursor:
+        cursor.execute(MY_VOTES_QUERY, (resident_id, list(update_ids)))
+        return {row['update_id']: row['value'] for row in cursor.fetchall()}
+
+# =================================== REVENUE ROLLUP ===================================
+# revenue_daily holds one row per (paid day, document type). Every write that creates, re-stamps
+# or deletes a paid receipt calls record_revenue in the same transaction: -1 for the receipts'
+# old state before the write, +1 for their new state after it.
+def record_revenue(cursor, receipt_ids, sign=1):
+    """Add (sign=1) or remove (sign=-1) the paid receipts among receipt_ids from revenue_daily"""
+    if not receipt_ids:
+        return
+    cursor.execute("""
+        INSERT INTO revenue_daily (day, document_type, amount, count)
+        SELECT r.paid_at::date, rd.document_type, SUM(rd.price) * %(sign)s, COUNT(*) * %(sign)s
+        FROM receipt r
+        JOIN request_document rd ON rd.id = r.request_id
+        WHERE r.id = ANY(%(receipt_ids)s) AND r.paid_at IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (day, document_type) DO UPDATE 
+        SET amount = revenue_daily.amount + EXCLUDED.amount, count = revenue_daily.count + EXCLUDED.count
+    """, {'receipt_ids': list(receipt_ids), 'sign': sign})
+
+def lock_receipts(cursor, request_ids):
+    """Lock the receipts of one request id or a list of them for the rest of the transaction and return their ids"""
+    if not isinstance(request_ids, (list, tuple)):
+        request_ids = [request_ids]
+    cursor.execute("SELECT id FROM receipt WHERE request_id = ANY(%s) ORDER BY id FOR UPDATE",
+                   ([int(request_id) for request_id in request_ids],))
+    return [row['id'] for row in cursor.fetchall()]
+
+# =================================== BULK REQUEST ACTIONS ===================================
+# Secretary and treasurer actions take a list of request ids and apply each step to all of them in
+# one statement (UPDATE ... WHERE id = ANY, INSERT ... ON CONFLICT on the single receipt of a request).
+# They return {request_id: outcome}; ids that match nothing are reported instead of failing the batch.
+BULK_MAX_IDS = int(os.environ.get('BULK_MAX_IDS', 500))
+REQUEST_STATUSES = ('Pending', 'To Pay', 'To Pick Up', 'Released', 'Rejected')
+UPDATED = 'updated'
+NOT_FOUND = 'not found'
+NO_RECEIPT = 'no receipt'
+INVALID_ID = 'invalid id'
+
+def read_bulk_form():
+    """Request ids and fields of a bulk action, from a JSON body ({"ids": [...], ...}) or repeated ids form fields"""
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids') or []
+        return (ids if isinstance(ids, list) else [ids]), data
+    return request.form.getlist('ids'), request.form
+
+def bulk_response(results, redirect_url, noun='request'):
+    """JSON {results, counts} for API callers; otherwise flash a summary and redirect back"""
+    counts = {}
+    for outcome in results.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    if request.is_json:
+        return jsonify({'results': {str(key): outcome for key, outcome in results.items()}, 'counts': counts})
+
+    updated = counts.pop(UPDATED, 0)
+    message = f"{updated} {noun}(s) updated"
+    for outcome in counts:
+        message += f"; {outcome}: " + ', '.join(str(key) for key, value in results.items() if value == outcome)
+    flash(message, 'warning' if counts else 'success')
+    return redirect(redirect_url)
+
+def bulk_error(message, redirect_url):
+    """Reject a whole bulk action (no ids, too many, bad status) before anything is written"""
+    if request.is_json:
+        return jsonify({'error': message}), 400
+    flash(message, 'danger')
+    return redirect(redirect_url)
+
+def parse_request_ids(values):
+    """Split raw id values into unique integer ids, in order, and {value: INVALID_ID} for the rest"""
+    request_ids, invalid = [], {}
+    for value in values:
+        try:
+            request_id = int(value)
+        except (TypeError, ValueError):
+            invalid[str(value)] = INVALID_ID
+            continue
+        if request_id not in request_ids:
+            request_ids.append(request_id)
+    return request_ids, invalid
+
+def _outcomes(request_ids, done, missing=NOT_FOUND):
+    done = set(done)
+    return {request_id: UPDATED if request_id in done else missing for request_id in request_ids}
+
+def set_request_statuses(cursor, request_ids, status, secretary_id):
+    """
+    Review many requests at once and give each exactly one receipt: 'To Pick Up' marks it paid
+    (keeping an earlier payment's date), other statuses leave an existing receipt as it is.
+    """
+    cursor.execute("""
+        UPDATE request_document
+        SET status = %s, reviewed_by = %s, reviewed_at = NOW()
+        WHERE id = ANY(%s)
+        RETURNING id
+    """, (status, secretary_id, list(request_ids)))
+    updated = [row['id'] for row in cursor.fetchall()]
+    if not updated:
+        return _outcomes(request_ids, updated)
+
+    if status == 'To Pick Up':
+        receipt_ids = lock_receipts(cursor, updated)
+        record_revenue(cursor, receipt_ids, -1)
+        cursor.execute("""
+            INSERT INTO receipt (request_id, payment_status, paid_at)
+            SELECT request_id, 'Paid', NOW() FROM unnest(%s::int[]) AS request_id
+            ON CONFLICT (request_id) DO UPDATE
+            SET payment_status = 'Paid', paid_at = COALESCE(receipt.paid_at, EXCLUDED.paid_at)
+            RETURNING id
+        """, (updated,))
+        record_revenue(cursor, [row['id'] for row in cursor.fetchall()])
+    else:
+        cursor.execute("""
+            INSERT INTO receipt (request_id)
+            SELECT request_id FROM unnest(%s::int[]) AS request_id
+            ON CONFLICT (request_id) DO NOTHING
+        """, (updated,))
+    return _outcomes(request_ids, updated)
+
+def mark_requests_paid(cursor, request_ids, treasurer_id):
+    """Mark the receipts of many requests paid now; requests without a receipt are reported, not created"""
+    receipt_ids = lock_receipts(cursor, request_ids)
+    record_revenue(cursor, receipt_ids, -1)
+    cursor.execute("""
+        UPDATE receipt
+        SET payment_status = 'Paid', paid_at = NOW(), issued_by = %s
+        WHERE request_id = ANY(%s)
+        RETURNING request_id
+    """, (treasurer_id, list(request_ids)))
+    paid = [row['request_id'] for row in cursor.fetchall()]
+    record_revenue(cursor, receipt_ids)
+    return _outcomes(request_ids, paid, NO_RECEIPT)
+
+def mark_requests_released(cursor, request_ids, treasurer_id):
+    """Mark many requests released by this treasurer; revenue_daily is unchanged since payment was counted when made"""
+    cursor.execute("""
+        UPDATE request_document
+        SET status = 'Released'
+        WHERE id = ANY(%s)
+        RETURNING id
+    """, (list(request_ids),))
+    released = [row['id'] for row in cursor.fetchall()]
+    cursor.execute("""
+        UPDATE receipt
+        SET issued_by = %s
+        WHERE request_id = ANY(%s)
+    """, (treasurer_id, released))
+    return _outcomes(request_ids, released)
+
+# =================================== SANCTION CACHE ===================================
+# Entries hold the resident's active sanction (or None) and stay valid until the sanction
+# expires or SANCTION_CACHE_TTL passes, whichever is first. Writers publish on
+# SANCTION_CHANNEL so every worker process drops its copy when a sanction changes.
+SANCTION_CACHE_TTL = int(os.environ.get('SANCTION_CACHE_TTL', 300))
+SANCTION_CHANNEL = 'sanctions_changed'
+
+_sanction_cache = {}
+_sanction_cache_lock = threading.Lock()
+_sanction_listener_pid = None
+
+ACTIVE_SANCTION_QUERY = """
+    SELECT reason, expires_at, EXTRACT(EPOCH FROM expires_at - NOW()) AS remaining
+    FROM sanctions
+    WHERE resident_id = %s
+    AND expires_at > NOW()
+    ORDER BY expires_at DESC
+    LIMIT 1
+"""
+
+def get_active_sanction(resident_id):
+    """Return the resident's active sanction (reason, expires_at) or None, served from cache when fresh"""
+    _start_sanction_listener()
+    resident_id = int(resident_id)
+
+    with _sanction_cache_lock:
+        entry = _sanction_cache.get(resident_id)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    with db_session() as cursor:
+        cursor.execute(ACTIVE_SANCTION_QUERY, (resident_id,))
+        sanction = cursor.fetchone()
+
+    valid_until = time.monotonic() + SANCTION_CACHE_TTL
+    if sanction:
+        valid_until = min(valid_until, time.monotonic() + float(sanction.pop('remaining')))
+
+    with _sanction_cache_lock:
+        _sanction_cache[resident_id] = (sanction, valid_until)
+    return sanction
+
+def invalidate_sanction(resident_id=None):
+    """Drop one resident's cached sanction, or the whole cache when resident_id is None"""
+    with _sanction_cache_lock:
+        if resident_id is None:
+            _sanction_cache.clear()
+        else:
+            _sanction_cache.pop(int(resident_id), None)
+
+def notify_sanction_change(cursor, resident_id):
+    """Queue a cross-worker invalidation; Postgres delivers it when the caller's transaction commits"""
+    cursor.execute("SELECT pg_notify(%s, %s)", (SANCTION_CHANNEL, str(resident_id)))
+
+def _start_sanction_listener():
+    """Start the LISTEN thread once per (forked) worker process"""
+    global _sanction_listener_pid
+    if _sanction_listener_pid == os.getpid() or not LISTEN_ENABLED:
+        return
+    with _sanction_cache_lock:
+        if _sanction_listener_pid == os.getpid():
+            return
+        _sanction_listener_pid = os.getpid()
+    threading.Thread(target=_listen_for_sanction_changes, daemon=True).start()
+
+def _listen_for_sanction_changes():
+    """Invalidate cached sanctions on NOTIFY; clear everything whenever the listener reconnects"""
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**LISTEN_PARAMS)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {SANCTION_CHANNEL}")
+            # Anything could have changed while we were not listening
+            invalidate_sanction()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    invalidate_sanction(notify.payload or None)
+                    wake_sanction_scheduler()
+        except Exception as e:
+            print(f"Sanction listener error: {e}")
+            invalidate_sanction()
+            time.sleep(5)
+        finally:
+            if conn:
+                conn.close()
+
+# =================================== SANCTIONS SCHEDULER ===================================
+# Expired sanctions are only housekeeping (every read already filters on expires_at > NOW()),
+# so instead of polling we keep a min-heap of upcoming expiries and sleep until the next one.
+# The sweep takes a transaction-scoped advisory lock so only one process deletes at a time.
+SANCTION_SWEEP_LOCK_KEY = 72420001
+SANCTION_RESYNC_INTERVAL = int(os.environ.get('SANCTION_RESYNC_INTERVAL', 600))
+SANCTION_EXPIRY_BATCH = 100
+
+_expiry_heap = []
+_expiry_lock = threading.Lock()
+_scheduler_wakeup = threading.Event()
+_scheduler_stats = {
+    'runs': 0,
+    'skipped': 0,
+    'errors': 0,
+    'deleted': 0,
+    'last_run_at': None,
+    'last_duration_ms': 0.0,
+    'total_duration_ms': 0.0,
+}
+
+def wake_sanction_scheduler():
+    """Ask the scheduler to reload upcoming expiries, e.g. after a sanction was added"""
+    _scheduler_wakeup.set()
+
+SANCTION_EXPIRIES_QUERY = """
+    SELECT EXTRACT(EPOCH FROM expires_at - NOW()) AS remaining
+    FROM sanctions
+    WHERE expires_at > NOW()
+    ORDER BY expires_at
+    LIMIT %s
+"""
+
+def load_sanction_expiries():
+    """Rebuild the heap from the nearest upcoming expiries, as monotonic deadlines"""
+    with db_session() as cursor:
+        cursor.execute(SANCTION_EXPIRIES_QUERY, (SANCTION_EXPIRY_BATCH,))
+        now = time.monotonic()
+        deadlines = [now + float(row['remaining']) for row in cursor.fetchall()]
+
+    heapq.heapify(deadlines)
+    with _expiry_lock:
+        _expiry_heap[:] = deadlines
+
+def sweep_expired_sanctions():
+    """Delete expired sanctions if no other process holds the sweep lock"""
+    started = time.perf_counter()
+    try:
+        with db_session(commit=True) as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (SANCTION_SWEEP_LOCK_KEY,))
+            if cursor.fetchone()['locked']:
+                cursor.execute("DELETE FROM sanctions WHERE expires_at <= NOW()")
+                _scheduler_stats['runs'] += 1
+                _scheduler_stats['deleted'] += cursor.rowcount
+            else:
+                _scheduler_stats['skipped'] += 1
     except Exception as e:
-        print(f"Error updating sanctions: {e}")
-    finally:
-        database.putconn(conn)
+        _scheduler_stats['errors'] += 1
+        print(f"Error sweeping sanctions: {e}")
+
+    duration_ms = (time.perf_counter() - started) * 1000
+    _scheduler_stats['last_run_at'] = datetime.now()
+    _scheduler_stats['last_duration_ms'] = duration_ms
+    _scheduler_stats['total_duration_ms'] += duration_ms
+
+def get_scheduler_stats():
+    """Snapshot of sweep counts and durations plus the next scheduled expiry"""
+    stats = dict(_scheduler_stats)
+    with _expiry_lock:
+        stats['pending_expiries'] = len(_expiry_heap)
+        stats['next_expiry_in'] = max(_expiry_heap[0] - time.monotonic(), 0) if _expiry_heap else None
+    stats['alive'] = scheduler_thread is not None and scheduler_thread.is_alive()
+    return stats
 
 def run_scheduler():
-    """Run the scheduler in a separate thread"""
-    schedule.every(5).seconds.do(update_sanctions)
+    """Sleep until the next sanction expiry (or a wake-up), sweep, and repeat"""
+    print(f"[{datetime.now()}] Sanctions scheduler thread started")
+    next_resync = 0
+    while True:
+        try:
+            if time.monotonic() >= next_resync:
+                # Periodic catch-up for expiries this process never heard about
+                sweep_expired_sanctions()
+            if _scheduler_wakeup.is_set() or time.monotonic() >= next_resync:
+                _scheduler_wakeup.clear()
+                load_sanction_expiries()
+                next_resync = time.monotonic() + SANCTION_RESYNC_INTERVAL
+
+            due = False
+            with _expiry_lock:
+                while _expiry_heap and _expiry_heap[0] <= time.monotonic():
+                    heapq.heappop(_expiry_heap)
+                    due = True
+            if due:
+                sweep_expired_sanctions()
+                load_sanction_expiries()
+
+            with _expiry_lock:
+                next_deadline = _expiry_heap[0] if _expiry_heap else next_resync
+            _scheduler_wakeup.wait(max(min(next_deadline, next_resync) - time.monotonic(), 0))
+        except Exception as e:
+            print(f"Sanctions scheduler error: {e}")
+            _scheduler_wakeup.wait(30)
+
+scheduler_thread = None
+
+def start_scheduler():
+    """Start the scheduler thread once per (forked) worker process"""
+    global scheduler_thread
+    with _expiry_lock:
+        if scheduler_thread is not None and scheduler_thread.is_alive():
+            return scheduler_thread
+        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+        scheduler_thread.start()
+    return scheduler_thread
+
+# =================================== PRESENCE ===================================
+# Requests only record a heartbeat in memory; a background thread writes the newest heartbeat of
+# each user to last_seen_at with one UPDATE per role every PRESENCE_FLUSH_INTERVAL seconds, and
+# skips users already written within PRESENCE_RESOLUTION seconds. Online means seen within
+# PRESENCE_WINDOW, so sessions that simply expire drop off without anyone writing a flag.
+PRESENCE_ROLES = ('resident', 'secretary', 'treasurer')
+
+_presence_lock = threading.Lock()
+_heartbeats = {}        # (role, id) -> unix time of the newest unflushed request
+_logouts = set()        # (role, id) to mark offline on the next flush
+_last_written = {}      # (role, id) -> heartbeat time last written to the database
+_presence_wakeup = threading.Event()
+_presence_stats = {'flushes': 0, 'rows_written': 0, 'errors': 0, 'last_flush_at': None}
+
+def record_heartbeat(role, user_id):
+    """Note that a signed-in user made a request; the next flush writes it to last_seen_at"""
+    if role not in PRESENCE_ROLES:
+        return
+    key = (role, int(user_id))
+    now = time.time()
+    with _presence_lock:
+        _logouts.discard(key)
+        if now - _last_written.get(key, 0) >= PRESENCE_RESOLUTION:
+            _heartbeats[key] = now
+
+def record_logout(role, user_id):
+    """Mark a user offline on the next flush instead of waiting for PRESENCE_WINDOW to pass"""
+    if role not in PRESENCE_ROLES:
+        return
+    key = (role, int(user_id))
+    with _presence_lock:
+        _heartbeats.pop(key, None)
+        _last_written.pop(key, None)
+        _logouts.add(key)
+
+def flush_presence():
+    """Write pending heartbeats and logouts in one transaction; returns the number of rows updated"""
+    with _presence_lock:
+        heartbeats, logouts = dict(_heartbeats), set(_logouts)
+        _heartbeats.clear()
+        _logouts.clear()
+    if not heartbeats and not logouts:
+        return 0
+
+    now = time.time()
+    written = 0
+    try:
+        with db_session(commit=True) as cursor:
+            for role in PRESENCE_ROLES:
+                seen = [(user_id, now - at) for (key_role, user_id), at in heartbeats.items() if key_role == role]
+                if seen:
+                    # Ages rather than timestamps, so the database clock decides what "now" is
+                    cursor.execute(f"""
+                        UPDATE {role} AS account
+                        SET last_seen_at = NOW() - seen.age * INTERVAL '1 second'
+                        FROM unnest(%s::int[], %s::float8[]) AS seen(id, age)
+                        WHERE account.id = seen.id
+                    """, ([user_id for user_id, _ in seen], [age for _, age in seen]))
+                    written += cursor.rowcount
+                gone = [user_id for key_role, user_id in logouts if key_role == role]
+                if gone:
+                    cursor.execute(f"UPDATE {role} SET last_seen_at = NULL WHERE id = ANY(%s)", (gone,))
+                    written += cursor.rowcount
+    except Exception as e:
+        # Requeue for the next flush; anything recorded meanwhile is newer and wins
+        with _presence_lock:
+            for key, at in heartbeats.items():
+                if key not in _logouts:
+                    _heartbeats[key] = max(at, _heartbeats.get(key, 0))
+            _logouts.update(key for key in logouts if key not in _heartbeats)
+        _presence_stats['errors'] += 1
+        print(f"Error flushing presence: {e}")
+        return 0
+
+    with _presence_lock:
+        _last_written.update(heartbeats)
+        # Forget users who have gone quiet so the map only holds recently active users
+        cutoff = now - max(PRESENCE_WINDOW, PRESENCE_RESOLUTION)
+        for key in [key for key, at in _last_written.items() if at < cutoff]:
+            del _last_written[key]
+    _presence_stats['flushes'] += 1
+    _presence_stats['rows_written'] += written
+    _presence_stats['last_flush_at'] = datetime.now()
+    return written
+
+def get_presence_stats():
+    """Flush counters plus the heartbeats and logouts waiting for the next flush"""
+    stats = dict(_presence_stats)
+    with _presence_lock:
+        stats['pending_heartbeats'] = len(_heartbeats)
+        stats['pending_logouts'] = len(_logouts)
+        stats['tracked_users'] = len(_last_written)
+    stats['alive'] = presence_thread is not None and presence_thread.is_alive()
+    return stats
+
+def run_presence_flusher():
+    """Flush presence every PRESENCE_FLUSH_INTERVAL seconds"""
+    print(f"[{datetime.now()}] Presence flusher thread started")
     while True:
-        schedule.run_pending()
-        time.sleep(1)
+        _presence_wakeup.wait(PRESENCE_FLUSH_INTERVAL)
+        _presence_wakeup.clear()
+        try:
+            flush_presence()
+        except Exception as e:
+            print(f"Presence flusher error: {e}")
+
+presence_thread = None
+
+def start_presence_flusher():
+    """Start the presence flusher thread once per (forked) worker process"""
+    global presence_thread
+    with _presence_lock:
+        if presence_thread is not None and presence_thread.is_alive():
+            return presence_thread
+        presence_thread = threading.Thread(target=run_presence_flusher, daemon=True)
+        presence_thread.start()
+    return presence_thread
 
-# Start the scheduler in a background thread when the module is imported
-scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
\ No newline at end of file
+# Heartbeats still in memory when the worker exits are written on the way out
+atexit.register(flush_presence)
@@ -0,0 +1,193 @@
+from helpers import db_session
+from cache import invalidate
+from storage import store_upload, copy_object, file_url, backend
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # without Pillow uploads are still hashed and sized, just not resized
+    Image = None
+
+# =================================== CONFIGURATION ===================================
+# After a document request is saved, a 'process_images' job (see jobs.py) reads each uploaded requirement
+# back from storage. Images get a review rendition and a thumbnail, both re-encoded as JPEG without EXIF.
+# An original that carries EXIF or XMP (camera, GPS) is stored again without it, keeping only its
+# orientation, and the upload as received is deleted once no request refers to it. The requirement
+# entry in request_document.requirements then records the uploaded file's hash, size and dimensions
+# plus the keys of the stripped original and the renditions. IMAGE_WORKERS caps how many of these
+# jobs run at once.
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 80_000_000))
+REVIEW_MAX_SIZE = int(os.environ.get('IMAGE_REVIEW_MAX_SIZE', 1600))
+REVIEW_QUALITY = 80
+THUMBNAIL_SIZE = int(os.environ.get('IMAGE_THUMBNAIL_SIZE', 320))
+THUMBNAIL_QUALITY = 70
+
+# EXIF orientations that rotate the picture by 90 degrees
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+_ORIENTATION_TAG = 0x0112
+
+# Formats an original is rewritten in when its metadata is stripped; anything else becomes a PNG
+_STRIPPED_FORMATS = {'JPEG': 'JPEG', 'MPO': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP'}
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+_stats_lock = threading.Lock()
+_stats = {
+    'processed': 0,
+    'skipped': 0,
+    'failed': 0,
+    'process_ms_total': 0.0,
+    'process_ms_max': 0.0,
+}
+
+# =================================== PROCESSING ===================================
+def _rendition(image, max_size, quality, name):
+    """Store a JPEG copy of image no larger than max_size on either side; saving without exif= drops it"""
+    copy = image.copy()
+    copy.thumbnail((max_size, max_size))
+    if copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    output = io.BytesIO()
+    copy.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    output.seek(0)
+    return store_upload(output, prefix='renditions', filename=name)
+
+def _strip_metadata(key, data):
+    """Store the original again without EXIF and XMP (orientation kept) and return its key; key if it has none"""
+    with Image.open(io.BytesIO(data)) as image:
+        exif = image.getexif()
+        if all(tag == _ORIENTATION_TAG for tag in exif) and not any('xmp' in name.lower() for name in image.info):
+            return key
+        options = {}
+        if exif.get(_ORIENTATION_TAG):
+            kept = Image.Exif()
+            kept[_ORIENTATION_TAG] = exif[_ORIENTATION_TAG]
+            options['exif'] = kept
+        output_format = _STRIPPED_FORMATS.get(image.format, 'PNG')
+        if output_format == 'JPEG':
+            options['quality'] = 'keep'  # reuse the upload's quantization tables instead of re-compressing
+        elif output_format == 'WEBP':
+            options['lossless'] = True
+        output = io.BytesIO()
+        image.save(output, output_format, **options)
+    output.seek(0)
+    filename = os.path.basename(key) if image.format in _STRIPPED_FORMATS else 'original.png'
+    return store_upload(output, prefix=key.split('/')[0], filename=filename)
+
+def process_file(key):
+    """Hash and measure one stored upload and, for images, store its review and thumbnail renditions"""
+    source = io.BytesIO()
+    copy_object(key, source)
+    data = source.getvalue()
+    info = {'key': key, 'sha256': hashlib.sha256(data).hexdigest(), 'bytes': len(data)}
+    if Image is None:
+        info['status'] = 'skipped'
+        return info
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in _ROTATED_ORIENTATIONS:
+                width, height = height, width
+            # For JPEGs this decodes at a reduced scale straight away instead of at full size
+            image.draft('RGB', (REVIEW_MAX_SIZE, REVIEW_MAX_SIZE))
+            upright = ImageOps.exif_transpose(image)
+            info.update({
+                'width': width,
+                'height': height,
+                'format': image.format,
+                'review': _rendition(upright, REVIEW_MAX_SIZE, REVIEW_QUALITY, 'review.jpg'),
+                'thumbnail': _rendition(upright, THUMBNAIL_SIZE, THUMBNAIL_QUALITY, 'thumbnail.jpg'),
+                'status': 'ready',
+            })
+        info['key'] = _strip_metadata(key, data)
+    except UnidentifiedImageError:
+        info['status'] = 'skipped'  # PDFs and other documents are kept as uploaded
+    except (Image.DecompressionBombError, OSError, ValueError) as e:
+        print(f"Error processing image {key}: {e}")
+        info['status'] = 'failed'
+    return info
+
+def process_request(request_id, fields):
+    """Process the uploaded files of one document request and merge the results into its requirements"""
+    results = {}
+    for field, key in fields.items():
+        started = time.perf_counter()
+        try:
+            results[field] = process_file(key)
+        except Exception as e:
+            print(f"Error processing requirement {key}: {e}")
+            results[field] = {'key': key, 'status': 'failed'}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            _stats['processed' if results[field]['status'] == 'ready' else results[field]['status']] += 1
+            _stats['process_ms_total'] += elapsed_ms
+            _stats['process_ms_max'] = max(_stats['process_ms_max'], elapsed_ms)
+
+    with db_session(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE request_document
+            SET requirements = requirements || %s::jsonb
+            WHERE id = %s
+        """, (json.dumps(results), request_id))
+    invalidate('requests')
+
+    for field, key in fields.items():
+        if results[field]['key'] != key:
+            _delete_unreferenced(key)
+    return results
+
+def _delete_unreferenced(key):
+    """Delete an upload replaced by its stripped copy, unless another request still refers to it"""
+    with db_session() as cursor:
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM request_document
+                WHERE jsonb_path_exists(requirements, '$.* ? (@.key == $key)', jsonb_build_object('key', %s::text))
+            ) AS referenced
+        """, (key,))
+        if cursor.fetchone()['referenced']:
+            return
+    try:
+        backend.delete(key)
+    except Exception as e:
+        print(f"Error deleting original {key}: {e}")
+
+# =================================== PUBLIC API ===================================
+def pending_entry(key):
+    """Requirement entry saved with the request until the pipeline fills in the rest"""
+    return {'key': key, 'status': 'pending'}
+
+def thumbnail_url(value):
+    """Thumbnail for a requirement entry, falling back to the uploaded file while it is being processed"""
+    if isinstance(value, dict) and value.get('thumbnail'):
+        return file_url(value['thumbnail'])
+    return file_url(value)
+
+def review_url(value):
+    """Review-sized copy of a requirement entry, falling back to the uploaded file"""
+    if isinstance(value, dict) and value.get('review'):
+        return file_url(value['review'])
+    return file_url(value)
+
+def get_image_stats():
+    """Snapshot of processing counters and latency for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats['processed'] + stats['skipped'] + stats['failed']
+    stats['process_ms_avg'] = stats['process_ms_total'] / completed if completed else 0.0
+    stats['workers'] = IMAGE_WORKERS
+    stats['pillow'] = Image is not None
+    return stats
+
+def init_app(app):
+    """Expose thumbnail_url() and review_url() to templates"""
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url
+    app.jinja_env.globals['review_url'] = review_url
@@ -0,0 +1,140 @@
+from flask import g, has_request_context, request
+from psycopg2.extras import RealDictCursor
+from collections import deque
+import logging
+import os
+import re
+import threading
+import time
+
+# =================================== CONFIGURATION ===================================
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+SLOW_QUERY_HISTORY = int(os.environ.get('SLOW_QUERY_HISTORY', 50))
+
+logger = logging.getLogger('barangay.sql')
+
+_stats_lock = threading.Lock()
+_query_stats = {}
+_endpoint_stats = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+
+def _statement(query):
+    """Collapse a SQL template to one line for logs (parameters are never included)"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return re.sub(r'\s+', ' ', str(query)).strip()[:500]
+
+# =================================== QUERY RECORDING ===================================
+def record_query(caller, query, duration_ms, rows):
+    """Add one executed statement to the per-caller totals and the current request"""
+    slow = duration_ms >= SLOW_QUERY_MS
+    with _stats_lock:
+        stats = _query_stats.get(caller)
+        if stats is None:
+            stats = _query_stats[caller] = {'calls': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0}
+        stats['calls'] += 1
+        stats['rows'] += max(rows, 0)
+        stats['total_ms'] += duration_ms
+        stats['max_ms'] = max(stats['max_ms'], duration_ms)
+        stats['slow'] += slow
+
+    in_request = has_request_context() and 'db_stats' in g
+    if in_request:
+        g.db_stats['queries'] += 1
+        g.db_stats['db_ms'] += duration_ms
+
+    if slow:
+        entry = {
+            'caller': caller,
+            'endpoint': request.endpoint if in_request else None,
+            'ms': round(duration_ms, 1),
+            'rows': rows,
+            'sql': _statement(query),
+            'at': time.time(),
+        }
+        with _stats_lock:
+            _slow_queries.append(entry)
+        logger.warning("Slow query (%.1f ms, %d rows) in %s: %s", duration_ms, rows, caller, entry['sql'])
+
+def record_pool_wait(wait_ms):
+    """Charge time spent waiting for a pooled connection to the current request"""
+    if has_request_context() and 'db_stats' in g:
+        g.db_stats['pool_wait_ms'] += wait_ms
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that times every statement; `caller` is set by db_session"""
+    caller = 'unknown'
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(self.caller, query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(self.caller, query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+# =================================== REQUEST ROLL-UP ===================================
+def _start_request():
+    g.db_stats = {'queries': 0, 'db_ms': 0.0, 'pool_wait_ms': 0.0, 'started': time.perf_counter()}
+
+def _finish_request(response):
+    stats = g.pop('db_stats', None)
+    if stats is None:
+        return response
+    request_ms = (time.perf_counter() - stats['started']) * 1000
+    endpoint = request.endpoint or 'unmatched'
+    with _stats_lock:
+        totals = _endpoint_stats.get(endpoint)
+        if totals is None:
+            totals = _endpoint_stats[endpoint] = {
+                'requests': 0, 'queries': 0, 'queries_max': 0,
+                'db_ms_total': 0.0, 'db_ms_max': 0.0,
+                'pool_wait_ms_total': 0.0, 'request_ms_total': 0.0,
+            }
+        totals['requests'] += 1
+        totals['queries'] += stats['queries']
+        totals['queries_max'] = max(totals['queries_max'], stats['queries'])
+        totals['db_ms_total'] += stats['db_ms']
+        totals['db_ms_max'] = max(totals['db_ms_max'], stats['db_ms'])
+        totals['pool_wait_ms_total'] += stats['pool_wait_ms']
+        totals['request_ms_total'] += request_ms
+    logger.debug("%s %s: %d queries, %.1f ms db, %.1f ms pool wait, %.1f ms total",
+                 request.method, request.path, stats['queries'], stats['db_ms'], stats['pool_wait_ms'], request_ms)
+    return response
+
+def init_app(app):
+    """Roll query counts and database time up per request for every blueprint"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+# =================================== REPORTING ===================================
+def get_query_stats():
+    """Per-caller statement totals for this process, slowest total time first"""
+    with _stats_lock:
+        rows = [dict(stats, caller=caller) for caller, stats in _query_stats.items()]
+    for row in rows:
+        row['avg_ms'] = row['total_ms'] / row['calls'] if row['calls'] else 0.0
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+def get_endpoint_stats():
+    """Per-endpoint request totals for this process: queries, database time and pool wait"""
+    with _stats_lock:
+        rows = [dict(stats, endpoint=endpoint) for endpoint, stats in _endpoint_stats.items()]
+    for row in rows:
+        count = row['requests']
+        row['queries_avg'] = row['queries'] / count if count else 0.0
+        row['db_ms_avg'] = row['db_ms_total'] / count if count else 0.0
+        row['pool_wait_ms_avg'] = row['pool_wait_ms_total'] / count if count else 0.0
+        row['request_ms_avg'] = row['request_ms_total'] / count if count else 0.0
+    return sorted(rows, key=lambda row: row['db_ms_total'], reverse=True)
+
+def get_slow_queries():
+    """The most recent statements that exceeded SLOW_QUERY_MS, newest first"""
+    with _stats_lock:
+        return list(reversed(_slow_queries))
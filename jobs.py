@@ -0,0 +1,296 @@
+from helpers import db_session, LISTEN_ENABLED, LISTEN_PARAMS
+import certificates
+import images
+from datetime import datetime
+import json
+import os
+import psycopg2
+import random
+import select
+import socket
+import threading
+import time
+
+# =================================== CONFIGURATION ===================================
+# Follow-up work of web requests is stored in the jobs table by enqueue(), inside the caller's
+# transaction, so a job exists exactly when the change that caused it was committed. Workers
+# (python worker.py) claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, delete them when they
+# succeed, retry failures with exponential backoff and leave them as status 'dead' after
+# max_attempts. A job type may cap how many of its jobs run at once across all workers.
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 5))
+JOB_BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 3600))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+JOB_STALL_SECONDS = int(os.environ.get('JOB_STALL_SECONDS', 600))
+JOB_CLAIM_BATCH = 10
+JOB_CHANNEL = 'jobs_ready'
+JOB_TYPE_LOCK_KEY = 72420003
+
+class UnknownJobType(Exception):
+    """Raised when enqueuing a job type no handler is registered for"""
+
+# =================================== HANDLERS ===================================
+# job_type -> {'handler': fn(payload), 'concurrency': int or None, 'max_attempts': int}
+HANDLERS = {}
+
+def job_handler(job_type, concurrency=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Register fn(payload) as the handler of job_type; concurrency caps running jobs of this type"""
+    def decorator(fn):
+        HANDLERS[job_type] = {'handler': fn, 'concurrency': concurrency, 'max_attempts': max_attempts}
+        return fn
+    return decorator
+
+# =================================== ENQUEUE ===================================
+def enqueue(cursor, job_type, payload=None, delay=0):
+    """Add a job in the caller's transaction; workers are woken when it commits. Returns the job id."""
+    if job_type not in HANDLERS:
+        raise UnknownJobType(job_type)
+    cursor.execute("""
+        INSERT INTO jobs (job_type, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second')
+        RETURNING id
+    """, (job_type, json.dumps(payload or {}), HANDLERS[job_type]['max_attempts'], delay))
+    job_id = cursor.fetchone()['id']
+    cursor.execute("SELECT pg_notify(%s, %s)", (JOB_CHANNEL, job_type))
+    return job_id
+
+def enqueue_many(cursor, job_type, payloads):
+    """Add one job per payload with a single INSERT in the caller's transaction. Returns the job ids."""
+    if job_type not in HANDLERS:
+        raise UnknownJobType(job_type)
+    if not payloads:
+        return []
+    cursor.execute("""
+        INSERT INTO jobs (job_type, payload, max_attempts)
+        SELECT %s, payload, %s FROM jsonb_array_elements(%s::jsonb) AS payload
+        RETURNING id
+    """, (job_type, HANDLERS[job_type]['max_attempts'], json.dumps(list(payloads))))
+    job_ids = [row['id'] for row in cursor.fetchall()]
+    cursor.execute("SELECT pg_notify(%s, %s)", (JOB_CHANNEL, job_type))
+    return job_ids
+
+# =================================== CLAIMING ===================================
+_stats_lock = threading.Lock()
+_stats = {'claimed': 0, 'succeeded': 0, 'retried': 0, 'dead': 0, 'requeued_stalled': 0, 'run_ms_total': 0.0}
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+def claim_job(worker_id, job_types):
+    """
+    Claim the next due job of one of job_types, respecting per-type concurrency, and mark it running.
+    Returns the job row or None when nothing can run right now.
+    """
+    with db_session(commit=True) as cursor:
+        cursor.execute("""
+            SELECT id, job_type, payload, attempts, max_attempts
+            FROM jobs
+            WHERE status = 'queued' AND run_at <= NOW() AND job_type = ANY(%s)
+            ORDER BY run_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (list(job_types), JOB_CLAIM_BATCH))
+        candidates = cursor.fetchall()
+
+        full = set()
+        for job in candidates:
+            job_type = job['job_type']
+            if job_type in full:
+                continue
+            limit = HANDLERS[job_type]['concurrency']
+            if limit:
+                # Serialises claims of this type until commit, so the count below cannot go stale
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (JOB_TYPE_LOCK_KEY, job_type))
+                cursor.execute("SELECT COUNT(*) AS running FROM jobs WHERE status = 'running' AND job_type = %s", (job_type,))
+                if cursor.fetchone()['running'] >= limit:
+                    full.add(job_type)
+                    continue
+
+            cursor.execute("""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_at = NOW(), locked_by = %s
+                WHERE id = %s
+            """, (worker_id, job['id']))
+            job['attempts'] += 1
+            _count('claimed')
+            return job
+    return None
+
+def complete_job(job):
+    """Delete a job that finished successfully"""
+    with db_session(commit=True) as cursor:
+        cursor.execute("DELETE FROM jobs WHERE id = %s", (job['id'],))
+    _count('succeeded')
+
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts`: exponential, capped at JOB_BACKOFF_MAX, with jitter"""
+    delay = min(JOB_BACKOFF_BASE * 2 ** max(attempts - 1, 0), JOB_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+def fail_job(job, error):
+    """Schedule a retry with backoff, or dead-letter the job once it has used up its attempts"""
+    dead = job['attempts'] >= job['max_attempts']
+    with db_session(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE jobs
+            SET status = %s, run_at = NOW() + %s * INTERVAL '1 second',
+                locked_at = NULL, locked_by = NULL, last_error = %s
+            WHERE id = %s
+        """, ('dead' if dead else 'queued', 0 if dead else backoff_seconds(job['attempts']), str(error)[:2000], job['id']))
+    _count('dead' if dead else 'retried')
+
+def requeue_stalled():
+    """Give running jobs whose worker stopped answering (locked longer than JOB_STALL_SECONDS) back to the queue"""
+    with db_session(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+                run_at = NOW(), locked_at = NULL, locked_by = NULL,
+                last_error = 'Worker stopped while running the job'
+            WHERE status = 'running' AND locked_at < NOW() - %s * INTERVAL '1 second'
+        """, (JOB_STALL_SECONDS,))
+        stalled = cursor.rowcount
+    if stalled:
+        _count('requeued_stalled', stalled)
+    return stalled
+
+def retry_dead(job_type=None):
+    """Put dead-lettered jobs (optionally of one type) back in the queue with fresh attempts"""
+    with db_session(commit=True) as cursor:
+        cursor.execute("""
+            UPDATE jobs
+            SET status = 'queued', attempts = 0, run_at = NOW(), last_error = NULL
+            WHERE status = 'dead' AND (%s::text IS NULL OR job_type = %s)
+        """, (job_type, job_type))
+        retried = cursor.rowcount
+        if retried:
+            cursor.execute("SELECT pg_notify(%s, %s)", (JOB_CHANNEL, job_type or ''))
+    return retried
+
+def get_job_stats():
+    """Queue depth per job type and status, plus this process's worker counters"""
+    with db_session() as cursor:
+        cursor.execute("""
+            SELECT job_type, status, COUNT(*) AS count, MIN(run_at) AS oldest
+            FROM jobs
+            GROUP BY job_type, status
+            ORDER BY job_type, status
+        """)
+        queue = cursor.fetchall()
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats['succeeded'] + stats['retried'] + stats['dead']
+    stats['run_ms_avg'] = stats['run_ms_total'] / completed if completed else 0.0
+    stats['queue'] = [dict(row, oldest=row['oldest'].isoformat() if row['oldest'] else None) for row in queue]
+    stats['limits'] = {job_type: spec['concurrency'] for job_type, spec in HANDLERS.items()}
+    return stats
+
+# =================================== WORKER ===================================
+def run_job(job):
+    """Run one claimed job and record its outcome; returns True if it succeeded"""
+    started = time.perf_counter()
+    try:
+        HANDLERS[job['job_type']]['handler'](job['payload'])
+    except Exception as e:
+        print(f"[{datetime.now()}] Job {job['id']} ({job['job_type']}) failed on attempt {job['attempts']}: {e}")
+        fail_job(job, e)
+        return False
+    finally:
+        _count('run_ms_total', (time.perf_counter() - started) * 1000)
+    complete_job(job)
+    return True
+
+def _listen_for_jobs(wakeup, stop):
+    """Wake idle worker threads on NOTIFY; they still poll every JOB_POLL_INTERVAL without it"""
+    while not stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(**LISTEN_PARAMS)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {JOB_CHANNEL}")
+            while not stop.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    wakeup.set()
+        except Exception as e:
+            print(f"Job listener error: {e}")
+            stop.wait(5)
+        finally:
+            if conn:
+                conn.close()
+
+def _work(worker_id, job_types, wakeup, stop, once):
+    while not stop.is_set():
+        try:
+            job = claim_job(worker_id, job_types)
+        except Exception as e:
+            print(f"Job claim error: {e}")
+            stop.wait(JOB_POLL_INTERVAL)
+            continue
+        if job is not None:
+            try:
+                run_job(job)
+            except Exception as e:
+                # Left 'running' (e.g. the database went away); requeue_stalled queues it again after JOB_STALL_SECONDS
+                print(f"Job run error ({job['job_type']} {job['id']}): {e}")
+                stop.wait(JOB_POLL_INTERVAL)
+            continue
+        if once:
+            return
+        wakeup.wait(JOB_POLL_INTERVAL)
+        wakeup.clear()
+
+def run_worker(threads=4, job_types=None, once=False, stop=None):
+    """
+    Process jobs on `threads` threads until stop is set (or, with once, until nothing is due).
+    job_types limits the worker to some registered types.
+    """
+    job_types = [job_type for job_type in (job_types or HANDLERS) if job_type in HANDLERS]
+    stop = stop or threading.Event()
+    wakeup = threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[{datetime.now()}] Job worker {worker_id} started with {threads} thread(s) for {', '.join(job_types)}")
+
+    requeue_stalled()
+    if LISTEN_ENABLED and not once:
+        threading.Thread(target=_listen_for_jobs, args=(wakeup, stop), daemon=True).start()
+    workers = [threading.Thread(target=_work, args=(f"{worker_id}:{i}", job_types, wakeup, stop, once), daemon=True)
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+
+    next_stall_check = time.monotonic() + JOB_STALL_SECONDS / 2
+    while any(worker.is_alive() for worker in workers):
+        if stop.wait(1):
+            break
+        if time.monotonic() >= next_stall_check:
+            try:
+                requeue_stalled()
+            except Exception as e:
+                print(f"Job stall check error: {e}")
+            next_stall_check = time.monotonic() + JOB_STALL_SECONDS / 2
+
+    # Let running jobs finish so they are not left to the stall check; idle threads are woken to exit
+    wakeup.set()
+    for worker in workers:
+        worker.join()
+    print(f"[{datetime.now()}] Job worker {worker_id} stopped")
+
+# =================================== JOB TYPES ===================================
+@job_handler('render_certificate', concurrency=certificates.CERTIFICATE_WORKERS)
+def render_certificate(payload):
+    """Render (or find already rendered) the certificate of an approved request"""
+    try:
+        certificates.get_certificate(payload['request_id'])
+    except certificates.CertificateError as e:
+        # Not a certificate type, or no longer approved: nothing to retry
+        print(f"Skipping certificate for request {payload['request_id']}: {e}")
+
+@job_handler('process_images', concurrency=images.IMAGE_WORKERS)
+def process_images(payload):
+    """Make review copies and thumbnails of a request's uploaded requirements"""
+    images.process_request(payload['request_id'], payload['fields'])
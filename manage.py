@@ -0,0 +1,768 @@
+"""
+Command line tools for the Barangay Management System database.
+
+    python manage.py migrate status
+    python manage.py migrate up [--to VERSION]
+    python manage.py migrate down [--to VERSION]
+    python manage.py check-plans [--residents N]
+    python manage.py repair-counters [--dry-run]
+    python manage.py revenue verify|rebuild
+    python manage.py check-export [--rows N] [--budget-mb MB]
+    python manage.py benchmark-dashboards [--residents N] [--iterations N]
+    python manage.py check-storage [--size-mb MB]
+    python manage.py process-images [--limit N]
+    python manage.py render-certificates [--date YYYY-MM-DD] [--force]
+    python manage.py jobs status|retry-dead [--type TYPE]
+    python manage.py check-metrics [--requests N] [--threads N] [--budget-ms MS]
+"""
+import argparse
+import glob
+import io
+import os
+import re
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+import helpers
+from helpers import DB_PARAMS, STREAM_BATCH_SIZE
+import exports
+import storage
+import images
+import certificates
+import jobs
+import resident_bp
+import secretary_bp
+import treasurer_bp
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_KEY = 72420002
+
+# =================================== MIGRATIONS ===================================
+def load_migrations():
+    """Return {version: {'name', 'up', 'down'}} for every migrations/NNNN_name.up.sql file"""
+    migrations = {}
+    for path in glob.glob(os.path.join(MIGRATIONS_DIR, '*.up.sql')):
+        match = re.match(r'(\d+)_(.+)\.up\.sql$', os.path.basename(path))
+        if not match:
+            continue
+        version = int(match.group(1))
+        down_path = path[:-len('.up.sql')] + '.down.sql'
+        migrations[version] = {
+            'name': match.group(2),
+            'up': path,
+            'down': down_path if os.path.exists(down_path) else None,
+        }
+    return dict(sorted(migrations.items()))
+
+def applied_versions(cursor):
+    """Create the bookkeeping table if needed and return the applied versions"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+def read_sql(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def migrate_up(conn, target=None):
+    """Apply pending migrations in order, each in its own transaction"""
+    migrations = load_migrations()
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        applied = set(applied_versions(cursor))
+        conn.commit()
+        for version, migration in migrations.items():
+            if version in applied or (target is not None and version > target):
+                continue
+            print(f"Applying {version:04d}_{migration['name']}")
+            try:
+                cursor.execute(read_sql(migration['up']))
+                cursor.execute("INSERT INTO schema_migrations(version, name) VALUES (%s, %s)", (version, migration['name']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+def migrate_down(conn, target=None):
+    """Revert applied migrations newer than target (default: only the latest one)"""
+    migrations = load_migrations()
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        applied = applied_versions(cursor)
+        conn.commit()
+        if not applied:
+            print("Nothing to revert")
+            return
+        if target is None:
+            target = applied[-2] if len(applied) > 1 else 0
+        for version in reversed(applied):
+            if version <= target:
+                break
+            migration = migrations.get(version)
+            if not migration or not migration['down']:
+                raise RuntimeError(f"Migration {version:04d} has no down script")
+            print(f"Reverting {version:04d}_{migration['name']}")
+            try:
+                cursor.execute(read_sql(migration['down']))
+                cursor.execute("DELETE FROM schema_migrations WHERE version = %s", (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+def migrate_status(conn):
+    """Print every known migration and whether it is applied"""
+    cursor = conn.cursor()
+    applied = set(applied_versions(cursor))
+    conn.commit()
+    for version, migration in load_migrations().items():
+        state = 'applied' if version in applied else 'pending'
+        print(f"{version:04d}_{migration['name']:<40} {state}")
+
+# =================================== QUERY PLAN CHECK ===================================
+# The hot queries of helpers.py and the blueprints, referenced from the modules that run them so
+# the check cannot drift from the code. check_plans() fails if any of them plans a sequential scan over a table that
+# grows with usage. secretary and treasurer are tiny lookup tables and may be scanned.
+# revenue_daily is bounded by days x document types, so a scan of it is expected
+SMALL_TABLES = {'secretary', 'treasurer', 'schema_migrations', 'revenue_daily', 'jobs', 'resident_counts'}
+
+# The statements the app executes, with sample parameters. Optional filters and keyset positions are
+# exercised both unset (first page) and set, since each is planned separately.
+SAMPLE_BEFORE = {'before_at': datetime.now() - timedelta(days=1), 'before_id': 2147483647}
+FIRST_PAGE = {'before_at': None, 'before_id': None}
+SAMPLE_IDS = list(range(1, 51))
+
+HOT_QUERIES = [
+    ('helpers.get_account_by_email', helpers.ACCOUNT_LOOKUP_QUERY, {'email': 'seed-42@example.com'}),
+    ('helpers.get_active_sanction', helpers.ACTIVE_SANCTION_QUERY, (42,)),
+    ('helpers.load_sanction_expiries', helpers.SANCTION_EXPIRIES_QUERY, (helpers.SANCTION_EXPIRY_BATCH,)),
+    ('helpers.get_all_resident_info', helpers.RESIDENTS_PAGE_QUERY, {'online': None, 'after': None, 'limit': 51}),
+    ('helpers.get_all_resident_info(Online)', helpers.RESIDENTS_PAGE_QUERY, {'online': True, 'after': 1000, 'limit': 51}),
+    ('helpers.get_all_resident_info(Offline)', helpers.RESIDENTS_PAGE_QUERY, {'online': False, 'after': 1000, 'limit': 51}),
+    ('helpers.get_active_admins', helpers.ACTIVE_ADMINS_QUERY, None),
+    ('helpers.get_all_requests', helpers.REQUESTS_PAGE_QUERY, dict(FIRST_PAGE, status=None, limit=51)),
+    ('helpers.get_all_requests(status, cursor)', helpers.REQUESTS_PAGE_QUERY, dict(SAMPLE_BEFORE, status='To Pay', limit=51)),
+    ('helpers.get_all_reports', helpers.REPORTS_PAGE_QUERY, dict(FIRST_PAGE, limit=51)),
+    ('helpers.get_all_reports(cursor)', helpers.REPORTS_PAGE_QUERY, dict(SAMPLE_BEFORE, limit=51)),
+    ('helpers.get_current_user_reports', helpers.USER_REPORTS_QUERY, (42,)),
+    ('helpers.get_all_updates', helpers.UPDATES_PAGE_QUERY, dict(FIRST_PAGE, limit=51)),
+    ('helpers.get_all_updates(cursor)', helpers.UPDATES_PAGE_QUERY, dict(SAMPLE_BEFORE, limit=51)),
+    ('helpers.get_update_by_id', helpers.UPDATE_WITH_COMMENTS_QUERY, dict(FIRST_PAGE, update_id=7, limit=51)),
+    ('helpers.get_recent_comments', helpers.RECENT_COMMENTS_QUERY, (SAMPLE_IDS, helpers.COMMENT_PREVIEW_SIZE)),
+    ('helpers.get_comments_page', helpers.COMMENTS_PAGE_QUERY, dict(SAMPLE_BEFORE, update_id=7, limit=51)),
+    ('helpers.get_resident_counts', helpers.RESIDENT_COUNTS_QUERY, None),
+    ('helpers.get_request_counts', helpers.REQUEST_COUNTS_QUERY, None),
+    ('helpers.get_recent_residents', helpers.RECENT_RESIDENTS_QUERY, (helpers.DASHBOARD_RECENT,)),
+    ('helpers.get_online_residents', helpers.ONLINE_RESIDENTS_QUERY, (helpers.DASHBOARD_RECENT,)),
+    ('helpers.get_recent_requests', helpers.RECENT_REQUESTS_QUERY, (helpers.DASHBOARD_RECENT,)),
+    ('helpers.get_my_votes', helpers.MY_VOTES_QUERY, (42, SAMPLE_IDS)),
+    ('resident_bp.get_my_requests', resident_bp.MY_REQUESTS_QUERY, {'resident_id': 42, 'status': None}),
+    ('resident_bp.get_my_requests(status)', resident_bp.MY_REQUESTS_QUERY, {'resident_id': 42, 'status': 'Pending'}),
+    ('secretary_bp.get_my_updates', secretary_bp.MY_UPDATES_QUERY, (1,)),
+    ('secretary_bp.get_all_released_by', secretary_bp.RELEASED_BY_QUERY, (list(range(100, 151)),)),
+    ('treasurer_bp.get_financial_data', treasurer_bp.FINANCIAL_DATA_QUERY, (date.today().replace(month=1, day=1), date.today().replace(month=12, day=31))),
+    ('treasurer_bp.get_all_collections', treasurer_bp.COLLECTED_QUERY, None),
+    ('treasurer_bp.get_all_collections(pending)', treasurer_bp.PENDING_COLLECTIONS_QUERY, None),
+    ('treasurer_bp.get_recent_payments', treasurer_bp.RECENT_PAYMENTS_QUERY, (8,)),
+]
+
+def seed_large_dataset(cursor, residents):
+    """Insert a synthetic dataset sized from the resident count, then ANALYZE it"""
+    cursor.execute("INSERT INTO secretary(username, email, password) VALUES ('seed', 'seed-secretary@example.com', 'x') RETURNING id")
+    secretary_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO resident(first_name, last_name, email, password, last_seen_at)
+        SELECT 'Seed', 'Resident ' || g, 'seed-' || g || '@example.com', 'x',
+            CASE WHEN g %% 10 = 0 THEN NOW() - (g %% 3600) * INTERVAL '1 second' END
+        FROM generate_series(1, %(n)s) g
+    """, {'n': residents})
+    # Requests older than a month have been settled; only recent ones are still in progress
+    cursor.execute("""
+        INSERT INTO request_document(resident_id, document_type, price, status, created_at)
+        SELECT resident_id, 'barangay-clearance', 50,
+            CASE WHEN created_at < NOW() - INTERVAL '30 days'
+                THEN (ARRAY['Released', 'Released', 'Released', 'Rejected'])[1 + g % 4]
+                ELSE (ARRAY['Pending', 'To Pay', 'To Pick Up', 'Released', 'Rejected'])[1 + g % 5]
+            END,
+            created_at
+        FROM (
+            SELECT r.id AS resident_id, g, NOW() - ((r.id * 7 + g * 131) % 525600 || ' minutes')::interval AS created_at
+            FROM resident r, generate_series(1, 4) g
+        ) seeded
+    """)
+    cursor.execute("""
+        INSERT INTO receipt(request_id, payment_status, paid_at)
+        SELECT id, 'Paid', created_at + INTERVAL '1 hour' FROM request_document
+        WHERE status IN ('To Pick Up', 'Released')
+        ON CONFLICT (request_id) DO NOTHING
+    """)
+    cursor.execute("DELETE FROM revenue_daily")
+    cursor.execute(REVENUE_REBUILD_QUERY)
+    cursor.execute("""
+        INSERT INTO sanctions(resident_id, issued_by, expires_at, reason)
+        SELECT id, %(secretary_id)s, NOW() + (id %% 30 || ' days')::interval, 'Seed'
+        FROM resident WHERE id %% 50 = 0
+    """, {'secretary_id': secretary_id})
+    cursor.execute("""
+        INSERT INTO community_report(resident_id, title, content, posted_at)
+        SELECT id, 'Seed report', 'Seed', NOW() - (id % 525600 || ' minutes')::interval FROM resident
+    """)
+    cursor.execute("""
+        INSERT INTO community_update(title, content, created_by, created_at)
+        SELECT 'Seed update ' || g, 'Seed', %(secretary_id)s, NOW() - (g || ' hours')::interval
+        FROM generate_series(1, GREATEST(%(n)s / 20, 1)) g
+    """, {'secretary_id': secretary_id, 'n': residents})
+    cursor.execute("""
+        INSERT INTO comments(post_id, created_by, content, created_at)
+        SELECT u.id, r.id, 'Seed', NOW() - (r.id || ' seconds')::interval
+        FROM resident r
+        JOIN (SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM community_update) u ON u.n = r.id % 50
+    """)
+    cursor.execute("""
+        INSERT INTO update_votes(update_id, resident_id, value)
+        SELECT u.id, r.id, CASE WHEN (r.id + u.id) % 4 = 0 THEN -1 ELSE 1 END
+        FROM resident r
+        JOIN (SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n FROM community_update) u ON u.n = r.id % 200
+        ON CONFLICT (update_id, resident_id) DO NOTHING
+    """)
+    cursor.execute("ANALYZE")
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+def check_plans(conn, residents):
+    """Seed a large dataset in a transaction, EXPLAIN every hot query, then roll everything back"""
+    cursor = conn.cursor()
+    failures = []
+    try:
+        seed_large_dataset(cursor, residents)
+        for name, query, params in HOT_QUERIES:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cursor.fetchone()[0][0]['Plan']
+            scanned = sorted({
+                node['Relation Name'] for node in plan_nodes(plan)
+                if node['Node Type'] == 'Seq Scan' and node['Relation Name'] not in SMALL_TABLES
+            })
+            if scanned:
+                failures.append(name)
+                print(f"FAIL {name}: sequential scan on {', '.join(scanned)}")
+            else:
+                print(f"ok   {name}")
+    finally:
+        conn.rollback()
+    return failures
+
+# =================================== COUNTERS ===================================
+COUNTER_DRIFT_QUERY = """
+    SELECT u.id, u.comment_count, u.up_count, u.down_count,
+        COALESCE(c.total, 0) AS actual_comments,
+        COALESCE(v.up, 0) AS actual_up,
+        COALESCE(v.down, 0) AS actual_down
+    FROM community_update u
+    LEFT JOIN (SELECT post_id, COUNT(*) AS total FROM comments GROUP BY post_id) c ON c.post_id = u.id
+    LEFT JOIN (
+        SELECT update_id,
+            COUNT(*) FILTER (WHERE value = 1) AS up,
+            COUNT(*) FILTER (WHERE value = -1) AS down
+        FROM update_votes GROUP BY update_id
+    ) v ON v.update_id = u.id
+    WHERE u.comment_count <> COALESCE(c.total, 0)
+        OR u.up_count <> COALESCE(v.up, 0)
+        OR u.down_count <> COALESCE(v.down, 0)
+    ORDER BY u.id
+"""
+
+RESIDENT_COUNT_REBUILD_QUERY = "UPDATE resident_counts SET total = (SELECT COUNT(*) FROM resident)"
+
+def repair_counters(conn, dry_run=False):
+    """Recount the stored resident total and the comment and vote counters of every update that has drifted"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("LOCK TABLE resident IN SHARE MODE")
+        cursor.execute("SELECT total, (SELECT COUNT(*) FROM resident) FROM resident_counts")
+        total, actual_total = cursor.fetchone()
+        if total != actual_total:
+            print(f"resident total: {total}->{actual_total}")
+            cursor.execute(RESIDENT_COUNT_REBUILD_QUERY)
+
+        cursor.execute("LOCK TABLE community_update IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(COUNTER_DRIFT_QUERY)
+        drifted = cursor.fetchall()
+        for update_id, comments, up, down, actual_comments, actual_up, actual_down in drifted:
+            print(f"update {update_id}: comments {comments}->{actual_comments}, up {up}->{actual_up}, down {down}->{actual_down}")
+        if drifted and not dry_run:
+            cursor.execute("""
+                UPDATE community_update u
+                SET comment_count = (SELECT COUNT(*) FROM comments WHERE post_id = u.id),
+                    up_count = (SELECT COUNT(*) FROM update_votes WHERE update_id = u.id AND value = 1),
+                    down_count = (SELECT COUNT(*) FROM update_votes WHERE update_id = u.id AND value = -1)
+                WHERE u.id = ANY(%s)
+            """, ([row[0] for row in drifted],))
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"{len(drifted)} update(s) {'would be' if dry_run else 'were'} repaired")
+    return len(drifted)
+
+# =================================== REVENUE ROLLUP ===================================
+REVENUE_ACTUAL_QUERY = """
+    SELECT r.paid_at::date AS day, rd.document_type, SUM(rd.price) AS amount, COUNT(*) AS count
+    FROM receipt r JOIN request_document rd ON rd.id = r.request_id
+    WHERE r.paid_at IS NOT NULL
+    GROUP BY 1, 2
+"""
+
+REVENUE_REBUILD_QUERY = "INSERT INTO revenue_daily (day, document_type, amount, count) " + REVENUE_ACTUAL_QUERY
+
+def verify_revenue(conn):
+    """Compare revenue_daily with totals recomputed from receipts; returns the mismatched rows"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT COALESCE(a.day, r.day), COALESCE(a.document_type, r.document_type),
+                r.amount, r.count, a.amount, a.count
+            FROM ({REVENUE_ACTUAL_QUERY}) a
+            FULL OUTER JOIN revenue_daily r ON r.day = a.day AND r.document_type = a.document_type
+            WHERE r.amount IS DISTINCT FROM a.amount AND NOT (a.day IS NULL AND r.count = 0 AND r.amount = 0)
+                OR r.count IS DISTINCT FROM a.count AND NOT (a.day IS NULL AND r.count = 0)
+            ORDER BY 1, 2
+        """)
+        mismatches = cursor.fetchall()
+    finally:
+        conn.rollback()
+    for day, document_type, amount, count, actual_amount, actual_count in mismatches:
+        print(f"{day} {document_type}: rollup {amount or 0} ({count or 0}) != receipts {actual_amount or 0} ({actual_count or 0})")
+    print(f"{len(mismatches)} revenue_daily row(s) out of step with receipts")
+    return mismatches
+
+def rebuild_revenue(conn):
+    """Recompute revenue_daily from receipts, blocking receipt writes while it runs"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("LOCK TABLE receipt IN SHARE MODE")
+        cursor.execute("LOCK TABLE revenue_daily IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM revenue_daily")
+        cursor.execute(REVENUE_REBUILD_QUERY)
+        rows = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Rebuilt revenue_daily with {rows} row(s)")
+
+# =================================== EXPORTS ===================================
+def check_export(conn, rows, budget_mb):
+    """Export a synthetic dataset through a named cursor and fail if Python memory peaks above the budget"""
+    cursor = conn.cursor()
+    failures = []
+    try:
+        cursor.execute("INSERT INTO resident(first_name, last_name, email, password) VALUES ('Export', 'Check', 'export-check@example.com', 'x') RETURNING id")
+        resident_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO request_document(resident_id, document_type, price, status, created_at)
+            SELECT %(resident_id)s,
+                (ARRAY['barangay-clearance', 'certificate-of-residency', 'business-permit', 'indigency-certificate'])[1 + g %% 4],
+                50, 'Released', NOW() - (g %% 43200 || ' minutes')::interval
+            FROM generate_series(1, %(rows)s) g
+        """, {'resident_id': resident_id, 'rows': rows})
+        cursor.execute("""
+            INSERT INTO receipt(request_id, payment_status, paid_at)
+            SELECT id, 'Paid', created_at FROM request_document WHERE resident_id = %s
+        """, (resident_id,))
+
+        writers = [('csv', lambda data, columns, name: sum(len(chunk) for chunk in exports.iter_csv(data, columns)))]
+        if exports.xlsxwriter is not None:
+            writers.append(('xlsx', lambda data, columns, name: sum(len(chunk) for chunk in exports.iter_xlsx(data, columns, name))))
+
+        exports_to_check = [
+            ('financial-report', exports.FINANCIAL_EXPORT_QUERY, (date.today() - timedelta(days=31), date.today() + timedelta(days=1)), exports.FINANCIAL_COLUMNS),
+            ('receipts', exports.RECEIPTS_EXPORT_QUERY, None, exports.RECEIPT_COLUMNS),
+        ]
+        for name, query, params, columns in exports_to_check:
+            for export_format, write in writers:
+                named = conn.cursor(name='export_check', cursor_factory=RealDictCursor)
+                named.itersize = STREAM_BATCH_SIZE
+                named.execute(query, params)
+                tracemalloc.start()
+                try:
+                    written = write(named, columns, name)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                    named.close()
+                peak_mb = peak / (1024 * 1024)
+                if peak_mb > budget_mb:
+                    failures.append(f"{name}.{export_format}")
+                print(f"{'ok  ' if peak_mb <= budget_mb else 'FAIL'} {name}.{export_format}: "
+                      f"{written / (1024 * 1024):.1f} MB written, peak {peak_mb:.1f} MB (budget {budget_mb} MB)")
+    finally:
+        conn.rollback()
+    return failures
+
+# =================================== DASHBOARD BENCHMARK ===================================
+# What each dashboard queried before the summary helpers (the unbounded listings of the original
+# get_all_resident_info / get_all_requests) and after. The original online listing used a login flag
+# that is no longer maintained, so "before" selects the same rows by last_seen_at.
+RECENT_LIMIT = (helpers.DASHBOARD_RECENT,)
+
+DASHBOARD_BENCHMARKS = {
+    'secretary.dashboard': {
+        'before': [
+            ("SELECT *, CONCAT(first_name, ' ', last_name) as name FROM resident ORDER BY id", None),
+            ("""
+                SELECT rd.id, rd.document_type, rd.price, rd.requirements, rd.created_at, rd.status, rd.reviewed_by,
+                    CONCAT(r.first_name, ' ', r.last_name) as name
+                FROM request_document rd JOIN resident r ON rd.resident_id = r.id
+                ORDER BY rd.created_at DESC
+            """, None),
+        ],
+        'after': [
+            (helpers.RESIDENT_COUNTS_QUERY, None),
+            (helpers.RECENT_RESIDENTS_QUERY, RECENT_LIMIT),
+            (helpers.REQUEST_COUNTS_QUERY, None),
+            (helpers.RECENT_REQUESTS_QUERY, RECENT_LIMIT),
+        ],
+    },
+    'treasurer.dashboard': {
+        'before': [
+            (f"SELECT *, CONCAT(first_name, ' ', last_name) as name FROM resident WHERE {helpers.ONLINE_CONDITION} ORDER BY id", None),
+        ],
+        'after': [
+            (helpers.RESIDENT_COUNTS_QUERY, None),
+            (helpers.ONLINE_RESIDENTS_QUERY, RECENT_LIMIT),
+        ],
+    },
+}
+
+def measure_queries(conn, queries, iterations):
+    """Bytes of row data returned by the queries, and mean ms to run and materialize them all"""
+    sizes = conn.cursor()
+    total_bytes = 0
+    for query, params in queries:
+        sizes.execute(f"SELECT COALESCE(SUM(pg_column_size(result.*)), 0) FROM ({query}) result", params)
+        total_bytes += sizes.fetchone()[0]
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for query, params in queries:
+            cursor.execute(query, params)
+            cursor.fetchall()
+    return total_bytes, (time.perf_counter() - started) * 1000 / iterations
+
+def benchmark_dashboards(conn, residents, iterations):
+    """Seed a large dataset in a transaction and compare dashboard queries before and after, then roll back"""
+    try:
+        seed_large_dataset(conn.cursor(), residents)
+        for dashboard, variants in DASHBOARD_BENCHMARKS.items():
+            before_bytes, before_ms = measure_queries(conn, variants['before'], iterations)
+            after_bytes, after_ms = measure_queries(conn, variants['after'], iterations)
+            print(f"{dashboard}")
+            print(f"    before: {before_bytes / 1024:8.1f} KiB  {before_ms:7.2f} ms")
+            print(f"    after:  {after_bytes / 1024:8.1f} KiB  {after_ms:7.2f} ms")
+    finally:
+        conn.rollback()
+
+# =================================== STORAGE CHECK ===================================
+def check_storage(size_mb):
+    """
+    Round-trip an upload through the configured storage backend (set STORAGE_BACKEND=s3 and
+    STORAGE_S3_ENDPOINT to check a MinIO or other S3-compatible server): store, dedupe, read back,
+    reject an oversized file, then delete the test object.
+    """
+    failures = []
+    payload = os.urandom(int(size_mb * 1024 * 1024))
+    backend_name = type(storage.backend).__name__
+
+    def check(name, passed, detail=''):
+        print(f"{'ok  ' if passed else 'FAIL'} {name}{': ' + detail if detail else ''}")
+        if not passed:
+            failures.append(name)
+
+    class Upload:
+        def __init__(self, data, filename):
+            self.stream = io.BytesIO(data)
+            self.filename = filename
+
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        key = storage.store_upload(Upload(payload, 'check.PDF'), prefix='storage-check', max_bytes=len(payload))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    try:
+        check('store', storage.backend.exists(key), f"{backend_name} {key} in {elapsed_ms:.0f} ms, "
+              f"peak {peak / 1024:.0f} KiB allocated while storing")
+        check('dedupe', storage.store_upload(Upload(payload, 'again.pdf'), prefix='storage-check', max_bytes=len(payload)) == key)
+
+        copy = io.BytesIO()
+        storage.copy_object(key, copy)
+        check('read back', copy.getvalue() == payload)
+
+        try:
+            storage.store_upload(Upload(payload, 'big.pdf'), prefix='storage-check', max_bytes=len(payload) - 1)
+            check('size limit', False, 'oversized upload was stored')
+        except storage.UploadTooLarge:
+            check('size limit', True)
+    finally:
+        storage.backend.delete(key)
+    return failures
+
+# =================================== IMAGE CATCH-UP ===================================
+def process_pending_images(conn, limit):
+    """Process requirement uploads still marked pending, e.g. because a worker exited with jobs queued"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute("""
+            SELECT id, requirements FROM request_document
+            WHERE jsonb_path_exists(requirements, '$.* ? (@.status == "pending")')
+            ORDER BY id
+            LIMIT %s
+        """, (limit,))
+        pending = cursor.fetchall()
+    conn.rollback()
+
+    for row in pending:
+        fields = {field: entry['key'] for field, entry in row['requirements'].items()
+                  if isinstance(entry, dict) and entry.get('status') == 'pending'}
+        results = images.process_request(row['id'], fields)
+        print(f"request {row['id']}: " + ', '.join(f"{field} {result['status']}" for field, result in results.items()))
+    print(f"{len(pending)} request(s) processed")
+
+# =================================== METRICS CHECK ===================================
+METRICS_CHECK_PATHS = ['/', '/au/login', '/au/register', '/metrics-check-missing-page']
+METRICS_SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+METRICS_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse_metrics(text):
+    """Samples of a Prometheus text exposition as {(name, ((label, value), ...)): value}"""
+    samples = {}
+    for line in text.splitlines():
+        match = METRICS_SAMPLE.match(line)
+        if match:
+            labels = tuple(METRICS_LABEL.findall(match.group(2) or ''))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+def request_totals(samples):
+    """http_requests_total summed per endpoint, and the request histogram's count per endpoint"""
+    totals, counts = {}, {}
+    for (name, labels), value in samples.items():
+        endpoint = dict(labels).get('endpoint')
+        if name == 'http_requests_total':
+            totals[endpoint] = totals.get(endpoint, 0) + value
+        elif name == 'http_request_duration_seconds_count':
+            counts[endpoint] = value
+    return totals, counts
+
+def check_metrics(requests, threads, budget_ms):
+    """
+    Drive concurrent requests through the Flask test client while another thread scrapes /metrics,
+    and fail if a scrape is slower than the budget or the request counters disagree: a counter that
+    goes backwards, a histogram count that differs from http_requests_total, or a final total that
+    does not match the requests sent. Counts the workers sharing METRICS_DIR, so run it while they are idle.
+    Without METRICS_TOKEN it scrapes with a token made up for this run.
+    """
+    import secrets
+    import threading
+    import telemetry
+    from app import app
+
+    failures = []
+    if not telemetry.METRICS_TOKEN and not telemetry.METRICS_PUBLIC:
+        telemetry.METRICS_TOKEN = secrets.token_urlsafe()  # this process only, so the check can scrape
+    headers = {'Authorization': f'Bearer {telemetry.METRICS_TOKEN}'} if telemetry.METRICS_TOKEN else {}
+    scraper = app.test_client()
+
+    def check(name, passed, detail=''):
+        print(f"{'ok  ' if passed else 'FAIL'} {name}{': ' + detail if detail else ''}")
+        if not passed:
+            failures.append(name)
+
+    if not telemetry.METRICS_PUBLIC:
+        status = scraper.get('/metrics').status_code
+        check('scrape without token refused', status in (403, 404), f"answered {status}")
+
+    def scrape():
+        started = time.perf_counter()
+        response = scraper.get('/metrics', headers=headers)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise RuntimeError(f"/metrics answered {response.status_code}")
+        return parse_metrics(response.get_data(as_text=True)), elapsed_ms
+
+    def drive(count):
+        client = app.test_client()
+        for i in range(count):
+            client.get(METRICS_CHECK_PATHS[i % len(METRICS_CHECK_PATHS)])
+
+    baseline, _ = scrape()
+    previous = baseline
+    latencies, backwards, mismatched = [], set(), set()
+    workers = [threading.Thread(target=drive, args=(requests // threads + (i < requests % threads),))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    while True:
+        busy = any(worker.is_alive() for worker in workers)
+        samples, elapsed_ms = scrape()
+        latencies.append(elapsed_ms)
+        for key, value in previous.items():
+            if key[0].endswith(('_total', '_count', '_bucket')) and samples.get(key, 0) < value:
+                backwards.add(key[0])
+        totals, counts = request_totals(samples)
+        mismatched.update(endpoint for endpoint, total in totals.items() if counts.get(endpoint) != total)
+        previous = samples
+        if not busy:
+            break
+    for worker in workers:
+        worker.join()
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    check('scrape latency', latencies[-1] <= budget_ms,
+          f"{len(latencies)} scrapes, p95 {p95:.1f} ms, max {latencies[-1]:.1f} ms (budget {budget_ms} ms)")
+    check('counters only grow', not backwards, ', '.join(sorted(backwards)))
+    check('histogram counts match request totals', not mismatched, ', '.join(sorted(mismatched)))
+
+    before, _ = request_totals(baseline)
+    after, _ = request_totals(previous)
+    sent = sum(after.values()) - sum(before.values())
+    check('every request counted', sent == requests, f"{sent:.0f} of {requests} requests")
+    return failures
+
+# =================================== CLI ===================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate', help='apply, revert or list schema migrations')
+    migrate.add_argument('action', choices=['up', 'down', 'status'])
+    migrate.add_argument('--to', type=int, help='target version (up: apply through it, down: revert to it)')
+
+    plans = commands.add_parser('check-plans', help='fail if a hot query uses a sequential scan on a large dataset')
+    plans.add_argument('--residents', type=int, default=50000, help='residents to seed (other tables scale with it)')
+
+    counters = commands.add_parser('repair-counters', help='recompute stored comment and vote counts for community updates')
+    counters.add_argument('--dry-run', action='store_true', help='report drifted counters without fixing them')
+
+    revenue = commands.add_parser('revenue', help='reconcile the revenue_daily rollup with receipts')
+    revenue.add_argument('action', choices=['verify', 'rebuild'])
+
+    export = commands.add_parser('check-export', help='fail if streaming exports of a large dataset exceed a memory budget')
+    export.add_argument('--rows', type=int, default=100000, help='paid documents to seed')
+    export.add_argument('--budget-mb', type=float, default=32, help='peak Python memory allowed per export')
+
+    bench = commands.add_parser('benchmark-dashboards', help='compare dashboard query bytes and time before and after the summary helpers')
+    bench.add_argument('--residents', type=int, default=50000, help='residents to seed (other tables scale with it)')
+    bench.add_argument('--iterations', type=int, default=50, help='runs to average the timings over')
+
+    upload = commands.add_parser('check-storage', help='round-trip a test upload through the configured storage backend')
+    upload.add_argument('--size-mb', type=float, default=8, help='size of the test upload')
+
+    pending = commands.add_parser('process-images', help='make thumbnails and review copies for uploads still marked pending')
+    pending.add_argument('--limit', type=int, default=500, help='requests to process in this run')
+
+    render = commands.add_parser('render-certificates', help="render every 'To Pick Up' certificate approved on a day")
+    render.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(), help='day to render (default today)')
+    render.add_argument('--force', action='store_true', help='re-render certificates already in storage')
+
+    queue = commands.add_parser('jobs', help='show the background job queue or retry dead-lettered jobs')
+    queue.add_argument('action', choices=['status', 'retry-dead'])
+    queue.add_argument('--type', choices=sorted(jobs.HANDLERS), help='only jobs of this type')
+
+    scrape = commands.add_parser('check-metrics', help='fail if /metrics is slow or its request counters drift under concurrent load')
+    scrape.add_argument('--requests', type=int, default=2000, help='requests to send through the test client')
+    scrape.add_argument('--threads', type=int, default=8, help='threads sending them')
+    scrape.add_argument('--budget-ms', type=float, default=250, help='slowest scrape allowed')
+
+    args = parser.parse_args(argv)
+    if args.command == 'check-storage':
+        failures = check_storage(args.size_mb)
+        if failures:
+            print(f"{len(failures)} storage check(s) failed")
+            return 1
+        return 0
+    if args.command == 'check-metrics':
+        failures = check_metrics(args.requests, args.threads, args.budget_ms)
+        if failures:
+            print(f"{len(failures)} metrics check(s) failed")
+            return 1
+        return 0
+    if args.command == 'render-certificates':
+        result = certificates.render_day(args.date, args.force)
+        print(f"{result['day']}: {result['requests']} request(s), {result['rendered']} rendered, "
+              f"{result['cached']} already in storage, {result['seconds']:.2f}s "
+              f"({result['documents_per_second']} documents/s)")
+        return 0
+    if args.command == 'jobs':
+        if args.action == 'retry-dead':
+            print(f"{jobs.retry_dead(args.type)} dead job(s) queued again")
+            return 0
+        for row in jobs.get_job_stats()['queue']:
+            if args.type in (None, row['job_type']):
+                print(f"{row['job_type']:<20} {row['status']:<8} {row['count']:>6}  oldest {row['oldest']}")
+        return 0
+
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        if args.command == 'migrate':
+            if args.action == 'up':
+                migrate_up(conn, args.to)
+            elif args.action == 'down':
+                migrate_down(conn, args.to)
+            else:
+                migrate_status(conn)
+        elif args.command == 'check-plans':
+            failures = check_plans(conn, args.residents)
+            if failures:
+                print(f"{len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} fell back to a sequential scan")
+                return 1
+        elif args.command == 'repair-counters':
+            repair_counters(conn, args.dry_run)
+        elif args.command == 'check-export':
+            failures = check_export(conn, args.rows, args.budget_mb)
+            if failures:
+                print(f"{len(failures)} export(s) went over the memory budget")
+                return 1
+        elif args.command == 'benchmark-dashboards':
+            benchmark_dashboards(conn, args.residents, args.iterations)
+        elif args.command == 'process-images':
+            process_pending_images(conn, args.limit)
+        elif args.command == 'revenue':
+            if args.action == 'rebuild':
+                rebuild_revenue(conn)
+            elif verify_revenue(conn):
+                return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+from flask import Blueprint, session, jsonify
+from helpers import pool_stats, get_scheduler_stats, get_presence_stats
+from passwords import get_password_stats
+from cache import get_cache_stats
+from images import get_image_stats
+from certificates import get_certificate_stats
+from jobs import get_job_stats
+from instrumentation import get_query_stats, get_endpoint_stats, get_slow_queries, SLOW_QUERY_MS
+import os
+
+metrics = Blueprint('metrics', __name__)
+
+ADMIN_ROLES = ('secretary', 'treasurer')
+
+@metrics.before_request
+def restrict_to_admins():
+    """Middleware to ensure only secretaries and treasurers can read metrics"""
+    if session.get('role') not in ADMIN_ROLES:
+        return jsonify({'error': 'Forbidden'}), 403
+
+# =================================== ROUTES ===================================
+@metrics.route('/')
+def overview():
+    """Query, request, pool, scheduler, presence, password-hashing, cache, image, certificate and job queue aggregates for this worker process"""
+    return jsonify({
+        'pid': os.getpid(),
+        'slow_query_ms': SLOW_QUERY_MS,
+        'endpoints': get_endpoint_stats(),
+        'queries': get_query_stats(),
+        'slow_queries': get_slow_queries(),
+        'pool': pool_stats(),
+        'scheduler': get_scheduler_stats(),
+        'presence': get_presence_stats(),
+        'passwords': get_password_stats(),
+        'cache': get_cache_stats(),
+        'images': get_image_stats(),
+        'certificates': get_certificate_stats(),
+        'jobs': get_job_stats(),
+    })
@@ -0,0 +1,9 @@
+DROP TABLE IF EXISTS comments;
+DROP TABLE IF EXISTS community_update;
+DROP TABLE IF EXISTS community_report;
+DROP TABLE IF EXISTS receipt;
+DROP TABLE IF EXISTS request_document;
+DROP TABLE IF EXISTS sanctions;
+DROP TABLE IF EXISTS treasurer;
+DROP TABLE IF EXISTS secretary;
+DROP TABLE IF EXISTS resident;
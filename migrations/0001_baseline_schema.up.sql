@@ -0,0 +1,91 @@
+-- Baseline schema, reconstructed from the queries in helpers.py and the blueprints.
+-- Uses IF NOT EXISTS so it can be applied to a database created before migrations existed.
+
+CREATE TABLE IF NOT EXISTS resident (
+    id SERIAL PRIMARY KEY,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100) NOT NULL,
+    age INTEGER,
+    gender VARCHAR(20),
+    birth_date DATE,
+    contact_number VARCHAR(20),
+    civil_status VARCHAR(20),
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    address TEXT,
+    is_active BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS secretary (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(100) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS treasurer (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(100) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS sanctions (
+    id SERIAL PRIMARY KEY,
+    resident_id INTEGER NOT NULL REFERENCES resident(id) ON DELETE CASCADE,
+    issued_by INTEGER REFERENCES secretary(id) ON DELETE SET NULL,
+    issued_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL,
+    reason TEXT
+);
+
+CREATE TABLE IF NOT EXISTS request_document (
+    id SERIAL PRIMARY KEY,
+    resident_id INTEGER NOT NULL REFERENCES resident(id) ON DELETE CASCADE,
+    document_type VARCHAR(50) NOT NULL,
+    price INTEGER NOT NULL DEFAULT 0,
+    requirements JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(20) NOT NULL DEFAULT 'Pending',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    reviewed_by INTEGER REFERENCES secretary(id) ON DELETE SET NULL,
+    reviewed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS receipt (
+    id SERIAL PRIMARY KEY,
+    request_id INTEGER NOT NULL REFERENCES request_document(id) ON DELETE CASCADE,
+    payment_status VARCHAR(20) NOT NULL DEFAULT 'Unpaid',
+    paid_at TIMESTAMP,
+    issued_by INTEGER REFERENCES treasurer(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS community_report (
+    id SERIAL PRIMARY KEY,
+    resident_id INTEGER NOT NULL REFERENCES resident(id) ON DELETE CASCADE,
+    title VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    category VARCHAR(50),
+    status VARCHAR(20) NOT NULL DEFAULT 'Pending',
+    posted_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    reviewed_by INTEGER REFERENCES secretary(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS community_update (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    created_by INTEGER REFERENCES secretary(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    up_vote JSONB NOT NULL DEFAULT '[]'::jsonb,
+    down_vote JSONB NOT NULL DEFAULT '[]'::jsonb
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id SERIAL PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES community_update(id) ON DELETE CASCADE,
+    created_by INTEGER NOT NULL REFERENCES resident(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,13 @@
+DROP INDEX IF EXISTS community_update_created_by_created_at_idx;
+DROP INDEX IF EXISTS community_update_created_at_idx;
+DROP INDEX IF EXISTS community_report_resident_id_posted_at_idx;
+DROP INDEX IF EXISTS community_report_posted_at_id_idx;
+DROP INDEX IF EXISTS comments_post_id_created_at_idx;
+DROP INDEX IF EXISTS receipt_paid_at_idx;
+DROP INDEX IF EXISTS receipt_request_id_idx;
+DROP INDEX IF EXISTS request_document_resident_id_created_at_idx;
+DROP INDEX IF EXISTS request_document_status_created_at_id_idx;
+DROP INDEX IF EXISTS request_document_created_at_id_idx;
+DROP INDEX IF EXISTS sanctions_expires_at_idx;
+DROP INDEX IF EXISTS sanctions_resident_id_expires_at_idx;
+DROP INDEX IF EXISTS resident_is_active_id_idx;
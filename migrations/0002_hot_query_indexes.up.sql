@@ -0,0 +1,43 @@
+-- Indexes for the filters and sort orders of the hot queries in helpers.py and the blueprints.
+
+-- get_all_resident_info('Online' / 'Offline'): filter on is_active, page by id
+CREATE INDEX IF NOT EXISTS resident_is_active_id_idx
+    ON resident (is_active, id);
+
+-- get_active_sanction, the account lookup and the sanctions sweep
+CREATE INDEX IF NOT EXISTS sanctions_resident_id_expires_at_idx
+    ON sanctions (resident_id, expires_at);
+CREATE INDEX IF NOT EXISTS sanctions_expires_at_idx
+    ON sanctions (expires_at);
+
+-- get_all_requests(): newest first, optionally filtered by status
+CREATE INDEX IF NOT EXISTS request_document_created_at_id_idx
+    ON request_document (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS request_document_status_created_at_id_idx
+    ON request_document (status, created_at DESC, id DESC);
+
+-- resident.get_my_requests(): one resident's requests, newest first
+CREATE INDEX IF NOT EXISTS request_document_resident_id_created_at_idx
+    ON request_document (resident_id, created_at DESC);
+
+-- receipt joins from request_document, and recent payments / financial reports by paid_at
+CREATE INDEX IF NOT EXISTS receipt_request_id_idx
+    ON receipt (request_id);
+CREATE INDEX IF NOT EXISTS receipt_paid_at_idx
+    ON receipt (paid_at);
+
+-- Comment threads and comment counts per update
+CREATE INDEX IF NOT EXISTS comments_post_id_created_at_idx
+    ON comments (post_id, created_at DESC);
+
+-- get_all_reports(): newest first; get_current_user_reports(): one resident's reports
+CREATE INDEX IF NOT EXISTS community_report_posted_at_id_idx
+    ON community_report (posted_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS community_report_resident_id_posted_at_idx
+    ON community_report (resident_id, posted_at DESC);
+
+-- get_all_updates(): newest first; secretary.get_my_updates(): one secretary's updates
+CREATE INDEX IF NOT EXISTS community_update_created_at_idx
+    ON community_update (created_at DESC);
+CREATE INDEX IF NOT EXISTS community_update_created_by_created_at_idx
+    ON community_update (created_by, created_at DESC);
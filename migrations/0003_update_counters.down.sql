@@ -0,0 +1,8 @@
+DROP INDEX IF EXISTS community_update_created_at_id_idx;
+CREATE INDEX IF NOT EXISTS community_update_created_at_idx
+    ON community_update (created_at DESC);
+
+ALTER TABLE community_update
+    DROP COLUMN IF EXISTS down_count,
+    DROP COLUMN IF EXISTS up_count,
+    DROP COLUMN IF EXISTS comment_count;
@@ -0,0 +1,19 @@
+-- Denormalized counters on community_update so the updates feed no longer counts
+-- comments per row or ships vote arrays to the templates to be counted client-side.
+-- Kept in step by resident.comment_update / resident.vote_update; repair with
+-- `python manage.py repair-counters`.
+
+ALTER TABLE community_update
+    ADD COLUMN IF NOT EXISTS comment_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS up_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS down_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE community_update SET
+    comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = community_update.id),
+    up_count = jsonb_array_length(up_vote),
+    down_count = jsonb_array_length(down_vote);
+
+-- The feed is now keyset-paginated on (created_at, id)
+DROP INDEX IF EXISTS community_update_created_at_idx;
+CREATE INDEX IF NOT EXISTS community_update_created_at_id_idx
+    ON community_update (created_at DESC, id DESC);
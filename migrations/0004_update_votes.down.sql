@@ -0,0 +1,9 @@
+ALTER TABLE community_update
+    ADD COLUMN IF NOT EXISTS up_vote JSONB NOT NULL DEFAULT '[]'::jsonb,
+    ADD COLUMN IF NOT EXISTS down_vote JSONB NOT NULL DEFAULT '[]'::jsonb;
+
+UPDATE community_update u SET
+    up_vote = COALESCE((SELECT jsonb_agg(resident_id ORDER BY voted_at) FROM update_votes WHERE update_id = u.id AND value = 1), '[]'::jsonb),
+    down_vote = COALESCE((SELECT jsonb_agg(resident_id ORDER BY voted_at) FROM update_votes WHERE update_id = u.id AND value = -1), '[]'::jsonb);
+
+DROP TABLE IF EXISTS update_votes;
@@ -0,0 +1,45 @@
+-- One row per (update, resident) vote instead of JSONB arrays on community_update.
+-- value is 1 for an up vote and -1 for a down vote; the primary key makes a second
+-- vote from the same resident an upsert rather than a duplicate.
+
+CREATE TABLE IF NOT EXISTS update_votes (
+    update_id INTEGER NOT NULL REFERENCES community_update(id) ON DELETE CASCADE,
+    resident_id INTEGER NOT NULL REFERENCES resident(id) ON DELETE CASCADE,
+    value SMALLINT NOT NULL CHECK (value IN (-1, 1)),
+    voted_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (update_id, resident_id)
+);
+
+CREATE INDEX IF NOT EXISTS update_votes_resident_idx ON update_votes (resident_id, update_id);
+
+-- Convert the existing arrays. Up votes win if a resident somehow ended up in both,
+-- and ids that no longer belong to a resident are dropped.
+INSERT INTO update_votes (update_id, resident_id, value)
+SELECT DISTINCT u.id, r.id, 1
+FROM community_update u
+CROSS JOIN LATERAL jsonb_array_elements_text(u.up_vote) AS elem(value)
+JOIN resident r ON r.id = elem.value::int
+ON CONFLICT (update_id, resident_id) DO NOTHING;
+
+INSERT INTO update_votes (update_id, resident_id, value)
+SELECT DISTINCT u.id, r.id, -1
+FROM community_update u
+CROSS JOIN LATERAL jsonb_array_elements_text(u.down_vote) AS elem(value)
+JOIN resident r ON r.id = elem.value::int
+ON CONFLICT (update_id, resident_id) DO NOTHING;
+
+UPDATE community_update u SET
+    up_count = COALESCE(v.up, 0),
+    down_count = COALESCE(v.down, 0)
+FROM community_update c
+LEFT JOIN (
+    SELECT update_id,
+        COUNT(*) FILTER (WHERE value = 1) AS up,
+        COUNT(*) FILTER (WHERE value = -1) AS down
+    FROM update_votes GROUP BY update_id
+) v ON v.update_id = c.id
+WHERE u.id = c.id;
+
+ALTER TABLE community_update
+    DROP COLUMN IF EXISTS up_vote,
+    DROP COLUMN IF EXISTS down_vote;
@@ -0,0 +1,5 @@
+-- Comment threads are keyset-paginated on (created_at, id) per post, both for the
+-- per-update previews on the updates feed and the paginated comments endpoint.
+DROP INDEX IF EXISTS comments_post_id_created_at_idx;
+CREATE INDEX IF NOT EXISTS comments_post_id_created_at_id_idx
+    ON comments (post_id, created_at DESC, id DESC);
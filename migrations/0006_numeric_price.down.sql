@@ -0,0 +1,2 @@
+ALTER TABLE request_document
+    ALTER COLUMN price TYPE INTEGER USING round(price)::integer;
@@ -0,0 +1,3 @@
+-- Money is stored and summed as numeric so reports never round-trip through float.
+ALTER TABLE request_document
+    ALTER COLUMN price TYPE NUMERIC(12, 2) USING price::numeric(12, 2);
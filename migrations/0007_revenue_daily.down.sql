@@ -0,0 +1 @@
+DROP TABLE IF EXISTS revenue_daily;
@@ -0,0 +1,20 @@
+-- Daily revenue per document type, keyed on the day a receipt was paid. Maintained by
+-- helpers.record_revenue alongside every receipt write; reconcile with
+-- `python manage.py revenue verify` / `python manage.py revenue rebuild`.
+
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    day DATE NOT NULL,
+    document_type VARCHAR(50) NOT NULL,
+    amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, document_type)
+);
+
+INSERT INTO revenue_daily (day, document_type, amount, count)
+SELECT r.paid_at::date, rd.document_type, SUM(rd.price), COUNT(*)
+FROM receipt r
+JOIN request_document rd ON rd.id = r.request_id
+WHERE r.paid_at IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (day, document_type) DO UPDATE
+    SET amount = EXCLUDED.amount, count = EXCLUDED.count;
@@ -0,0 +1 @@
+DROP INDEX IF EXISTS request_document_open_status_idx;
@@ -0,0 +1,5 @@
+-- Dashboard widgets count only the open requests; they are a small slice of request_document
+-- once released and rejected requests pile up, so a partial index keeps the count off the table.
+CREATE INDEX IF NOT EXISTS request_document_open_status_idx
+    ON request_document (status)
+    WHERE status IN ('Pending', 'To Pay', 'To Pick Up');
@@ -0,0 +1,5 @@
+CREATE INDEX IF NOT EXISTS resident_is_active_id_idx ON resident (is_active, id);
+DROP INDEX IF EXISTS resident_last_seen_at_idx;
+ALTER TABLE treasurer DROP COLUMN IF EXISTS last_seen_at;
+ALTER TABLE secretary DROP COLUMN IF EXISTS last_seen_at;
+ALTER TABLE resident DROP COLUMN IF EXISTS last_seen_at;
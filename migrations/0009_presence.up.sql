@@ -0,0 +1,15 @@
+-- Presence is tracked by recency instead of an is_active flag written on login and logout:
+-- helpers.flush_presence batches heartbeats into last_seen_at, and "online" means seen within
+-- PRESENCE_WINDOW. Accounts flagged active today start out as just seen and age out normally.
+ALTER TABLE resident ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+ALTER TABLE secretary ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+ALTER TABLE treasurer ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+
+UPDATE resident SET last_seen_at = NOW() WHERE is_active;
+UPDATE secretary SET last_seen_at = NOW() WHERE is_active;
+UPDATE treasurer SET last_seen_at = NOW() WHERE is_active;
+
+CREATE INDEX IF NOT EXISTS resident_last_seen_at_idx ON resident (last_seen_at DESC);
+
+-- Nothing filters on is_active any more; stop paying for its index on every resident write
+DROP INDEX IF EXISTS resident_is_active_id_idx;
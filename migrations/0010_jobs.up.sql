@@ -0,0 +1,20 @@
+-- Durable queue for follow-up work of web requests (see jobs.py). Rows are inserted in the same
+-- transaction as the change that needs them, claimed by workers with FOR UPDATE SKIP LOCKED and
+-- deleted on success; 'dead' rows keep the last error until retried with manage.py jobs retry-dead.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMP,
+    locked_by VARCHAR(100),
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Claiming scans due queued jobs in order; concurrency limits and the stall check count running ones
+CREATE INDEX IF NOT EXISTS jobs_queued_run_at_idx ON jobs (run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_running_type_idx ON jobs (job_type, locked_at) WHERE status = 'running';
@@ -0,0 +1,3 @@
+-- Duplicate receipts removed by the up migration are not restored
+CREATE INDEX IF NOT EXISTS receipt_request_id_idx ON receipt (request_id);
+ALTER TABLE receipt DROP CONSTRAINT IF EXISTS receipt_request_id_key;
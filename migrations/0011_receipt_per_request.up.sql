@@ -0,0 +1,29 @@
+-- A document request has at most one receipt, so status changes can upsert it with
+-- INSERT ... ON CONFLICT (request_id). Requests updated more than once collected extra receipts;
+-- keep the paid one (or else the oldest) and take the removed paid duplicates, which were
+-- counted twice, out of revenue_daily.
+WITH ranked AS (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY request_id ORDER BY paid_at IS NULL, id) AS rank
+    FROM receipt
+),
+removed AS (
+    DELETE FROM receipt r
+    USING ranked
+    WHERE r.id = ranked.id AND ranked.rank > 1
+    RETURNING r.request_id, r.paid_at
+),
+totals AS (
+    SELECT removed.paid_at::date AS day, rd.document_type, SUM(rd.price) AS amount, COUNT(*) AS count
+    FROM removed
+    JOIN request_document rd ON rd.id = removed.request_id
+    WHERE removed.paid_at IS NOT NULL
+    GROUP BY 1, 2
+)
+UPDATE revenue_daily
+SET amount = revenue_daily.amount - totals.amount, count = revenue_daily.count - totals.count
+FROM totals
+WHERE revenue_daily.day = totals.day AND revenue_daily.document_type = totals.document_type;
+
+-- The unique constraint's index replaces the plain one from 0002
+ALTER TABLE receipt ADD CONSTRAINT receipt_request_id_key UNIQUE (request_id);
+DROP INDEX IF EXISTS receipt_request_id_idx;
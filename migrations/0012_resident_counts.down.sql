@@ -0,0 +1,7 @@
+DROP TRIGGER IF EXISTS resident_counts_truncate ON resident;
+DROP TRIGGER IF EXISTS resident_counts_delete ON resident;
+DROP TRIGGER IF EXISTS resident_counts_insert ON resident;
+DROP FUNCTION IF EXISTS resident_counts_truncated();
+DROP FUNCTION IF EXISTS resident_counts_deleted();
+DROP FUNCTION IF EXISTS resident_counts_inserted();
+DROP TABLE IF EXISTS resident_counts;
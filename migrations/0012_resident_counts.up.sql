@@ -0,0 +1,50 @@
+-- Stored resident total for the dashboards, so they no longer count the whole resident table.
+-- Kept in step by statement-level triggers on resident, so every insert, delete and truncate
+-- (registration, cascades, manual SQL) is counted once per statement; repair with `python manage.py repair-counters`.
+-- Online residents are counted from the last_seen_at index and offline is the total minus online.
+CREATE TABLE IF NOT EXISTS resident_counts (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO resident_counts (id, total)
+SELECT TRUE, COUNT(*) FROM resident
+ON CONFLICT (id) DO UPDATE SET total = EXCLUDED.total;
+
+CREATE OR REPLACE FUNCTION resident_counts_inserted() RETURNS trigger AS $$
+BEGIN
+    UPDATE resident_counts SET total = total + (SELECT COUNT(*) FROM inserted_residents);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resident_counts_deleted() RETURNS trigger AS $$
+BEGIN
+    UPDATE resident_counts SET total = total - (SELECT COUNT(*) FROM deleted_residents);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resident_counts_truncated() RETURNS trigger AS $$
+BEGIN
+    UPDATE resident_counts SET total = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS resident_counts_insert ON resident;
+CREATE TRIGGER resident_counts_insert
+    AFTER INSERT ON resident
+    REFERENCING NEW TABLE AS inserted_residents
+    FOR EACH STATEMENT EXECUTE FUNCTION resident_counts_inserted();
+
+DROP TRIGGER IF EXISTS resident_counts_delete ON resident;
+CREATE TRIGGER resident_counts_delete
+    AFTER DELETE ON resident
+    REFERENCING OLD TABLE AS deleted_residents
+    FOR EACH STATEMENT EXECUTE FUNCTION resident_counts_deleted();
+
+DROP TRIGGER IF EXISTS resident_counts_truncate ON resident;
+CREATE TRIGGER resident_counts_truncate
+    AFTER TRUNCATE ON resident
+    FOR EACH STATEMENT EXECUTE FUNCTION resident_counts_truncated();
@@ -0,0 +1,124 @@
+from bcrypt import checkpw, hashpw, gensalt
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import multiprocessing
+import os
+import threading
+import time
+
+# =================================== CONFIGURATION ===================================
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', HASH_WORKERS * 4))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 5))
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing pool is saturated; retry_after is a hint in seconds"""
+
+    def __init__(self, retry_after=HASH_RETRY_AFTER):
+        super().__init__(f"Password service is busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+# =================================== WORKER POOL ===================================
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_DEPTH)
+
+_stats_lock = threading.Lock()
+_stats = {
+    'hashes': 0,
+    'checks': 0,
+    'rejected': 0,
+    'timeouts': 0,
+    'in_flight': 0,
+    'hash_ms_total': 0.0,
+    'hash_ms_max': 0.0,
+    'wait_ms_total': 0.0,
+    'wait_ms_max': 0.0,
+}
+
+def _get_executor():
+    """Create the process pool lazily, once per (forked) worker process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # Spawned, not forked: a fork of this multi-threaded process could inherit a lock held
+            # by the scheduler or pool threads and hang with a hashing slot taken
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+def _hash(password, rounds):
+    started = time.time()
+    result = hashpw(password, gensalt(rounds))
+    return result, started, time.time()
+
+def _check(password, hashed):
+    started = time.time()
+    result = checkpw(password, hashed)
+    return result, started, time.time()
+
+def _release(future=None):
+    """Give back a queue slot once its hash has really finished, even if the caller stopped waiting"""
+    with _stats_lock:
+        _stats['in_flight'] -= 1
+    _slots.release()
+
+def _run(kind, fn, *args):
+    """Submit fn to the pool, rejecting immediately when the queue is full"""
+    if not _slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise PasswordServiceBusy()
+
+    with _stats_lock:
+        _stats['in_flight'] += 1
+    submitted = time.time()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _release()
+        raise
+    # A timed-out hash keeps its pool process busy, so its slot stays taken until the future is done
+    future.add_done_callback(_release)
+
+    try:
+        result, started, finished = future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        with _stats_lock:
+            _stats['timeouts'] += 1
+        raise PasswordServiceBusy()
+
+    wait_ms = max(started - submitted, 0) * 1000
+    hash_ms = (finished - started) * 1000
+    with _stats_lock:
+        _stats[kind] += 1
+        _stats['hash_ms_total'] += hash_ms
+        _stats['hash_ms_max'] = max(_stats['hash_ms_max'], hash_ms)
+        _stats['wait_ms_total'] += wait_ms
+        _stats['wait_ms_max'] = max(_stats['wait_ms_max'], wait_ms)
+    return result
+
+# =================================== PUBLIC API ===================================
+def hash_password(password):
+    """Hash a plain-text password with the configured bcrypt cost factor"""
+    return _run('hashes', _hash, password.encode('utf-8'), BCRYPT_ROUNDS).decode('utf-8')
+
+def verify_password(password, password_hash):
+    """Check a plain-text password against a stored bcrypt hash"""
+    return _run('checks', _check, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def get_password_stats():
+    """Snapshot of hashing counters, latency and queue wait for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats['hashes'] + stats['checks']
+    stats['hash_ms_avg'] = stats['hash_ms_total'] / completed if completed else 0.0
+    stats['wait_ms_avg'] = stats['wait_ms_total'] / completed if completed else 0.0
+    stats['workers'] = HASH_WORKERS
+    stats['queue_depth'] = HASH_QUEUE_DEPTH
+    stats['rounds'] = BCRYPT_ROUNDS
+    return stats
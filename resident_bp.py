@@ -1,7 +1,10 @@
 from flask import Blueprint, session, redirect, url_for, render_template, request, flash, jsonify
-from helpers import database as db, RealDictCursor, get_current_user_info, get_current_user_reports, get_all_updates, get_update_by_id, get_all_comments, get_active_admins, get_all_sanctions
-import os
-from werkzeug.utils import secure_filename
+from helpers import db_session, PAGE_SIZE, get_current_user_info, get_current_user_reports, get_all_updates, get_update_by_id, get_recent_comments, get_comments_page, get_active_admins, get_all_sanctions, get_active_sanction, get_my_votes, cast_vote, retract_vote, UP_VOTE, DOWN_VOTE, lock_receipts, record_revenue
+from cache import invalidate
+from storage import store_upload, UploadTooLarge, UPLOAD_MAX_FILE_BYTES
+from images import pending_entry
+from jobs import enqueue
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime
 import json
 
@@ -18,18 +21,9 @@ def restrict_to_resident():
     if session.get('role') != 'resident':
         return redirect(url_for('auth.login'))
     
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Check for active sanctions
-        cursor.execute("""
-            SELECT * FROM sanctions 
-            WHERE resident_id = %s 
-            AND expires_at > NOW()
-        """, (session['id'],))
-        sanction = cursor.fetchone()
+        # Check for active sanctions (cached per resident, see helpers.get_active_sanction)
+        sanction = get_active_sanction(session['id'])
         
         if sanction:
             session.clear()
@@ -39,16 +33,14 @@ def restrict_to_resident():
         flash('An error occurred while checking sanctions', 'danger')
         print(f"Sanction check error: {e}")
         return redirect(url_for('auth.login'))
-    finally:
-        if conn:
-            db.putconn(conn)
 
 # =================================== ROUTES =================================== 
 @resident.route('/dashboard')
 def dashboard():
     """Render dashboard with user info, reports, updates and requests"""
     try:
-        latest_update = get_all_updates()
+        latest_update, _ = get_all_updates()
+        my_votes = get_my_votes([update['id'] for update in latest_update])
         resident = get_current_user_info()
         active_admins = get_active_admins()
 
@@ -59,6 +51,7 @@ def dashboard():
         return render_template('resident/dashboard.html', 
                             resident=resident,  
                             latest_update=latest_update, 
+                            my_votes=my_votes, 
                             greeting=greeting, 
                             active_admins=active_admins)
     except Exception as e:
@@ -100,9 +93,13 @@ def report_page():
 def updates():
     """Render community updates page"""
     try:
-        all_updates = get_all_updates()
-        all_comments = get_all_comments()
-        return render_template('resident/updates.html', all_updates=all_updates, all_comments=all_comments)
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', PAGE_SIZE)
+        all_updates, next_cursor = get_all_updates(cursor, limit)
+        update_ids = [update['id'] for update in all_updates]
+        recent_comments = get_recent_comments(update_ids)
+        my_votes = get_my_votes(update_ids)
+        return render_template('resident/updates.html', all_updates=all_updates, recent_comments=recent_comments, my_votes=my_votes, next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading updates', 'danger')
         print(f"Updates error: {e}")
@@ -110,15 +107,33 @@ def updates():
 
 @resident.route('/comments/<int:update_id>')
 def comments(update_id):
-    """Render comments for a specific update"""
+    """Render an update with a page of its comments; ?cursor= shows older comments"""
     try:
-        current_update, comments = get_update_by_id(update_id)
-        return render_template('resident/comments.html', current_update=current_update, comments=comments)
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', PAGE_SIZE)
+        current_update, comments, next_cursor = get_update_by_id(update_id, cursor, limit)
+        if not current_update:
+            flash('Update not found', 'danger')
+            return redirect(url_for('resident.updates'))
+        my_vote = get_my_votes([update_id]).get(update_id)
+        return render_template('resident/comments.html', current_update=current_update, comments=comments, my_vote=my_vote, next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading comments', 'danger')
         print(f"Comments error: {e}")
         return redirect(url_for('resident.updates'))
 
+@resident.route('/comments/<int:update_id>/page')
+def comments_page(update_id):
+    """Return one page of an update's comments as JSON, newest first"""
+    try:
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', PAGE_SIZE)
+        comments, next_cursor = get_comments_page(update_id, cursor, limit)
+        return jsonify({'comments': comments, 'next_cursor': next_cursor})
+    except Exception as e:
+        print(f"Comments page error: {e}")
+        return jsonify({'error': 'Error loading comments'}), 500
+
 @resident.route('/account')
 def account():
     """Render user account page"""
@@ -149,13 +164,11 @@ def report_submit():
         content = request.form['report-description']
         resident_id = session['id']
         
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            INSERT INTO community_report (resident_id, title, content, category) 
-            VALUES (%s, %s, %s, %s)
-        """, (resident_id, title, content, category))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO community_report (resident_id, title, content, category) 
+                VALUES (%s, %s, %s, %s)
+            """, (resident_id, title, content, category))
         
         flash('Report submitted successfully!', 'success')
         return redirect(url_for('resident.report_page'))
@@ -163,9 +176,6 @@ def report_submit():
         flash('An error occurred while submitting your report', 'danger')
         print(f"Report submission error: {e}")
         return redirect(url_for('resident.report_page'))
-    finally:
-        if conn:
-            db.putconn(conn)
 
 @resident.route('/report-delete', methods=['POST'])
 def report_delete():
@@ -178,19 +188,13 @@ def report_delete():
         flash('Invalid report ID', 'danger')
         return redirect(url_for('resident.report_page'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("DELETE FROM community_report WHERE id = %s", (report_id,))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            cursor.execute("DELETE FROM community_report WHERE id = %s", (report_id,))
         flash('Report deleted successfully!', 'success')
     except Exception as e:
         flash('An error occurred while deleting your report', 'danger')
         print(f"Report deletion error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
     return redirect(url_for('resident.report_page'))
 
 @resident.route('/request-submit', methods=['POST'])
@@ -203,22 +207,15 @@ def request_submit():
         document_type = request.form['document-type']
         resident_id = session['id']
         
-        # Create uploads directory
-        upload_dir = os.path.join('static', 'uploads', 'documents', str(resident_id))
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Handle requirements based on document type
+        # Handle requirements based on document type; files are stored by content hash (see storage.py)
         requirements = {}
+        uploads = {}
         if document_type != 'indigency-certificate':
             for file_key in request.files:
                 file = request.files[file_key]
                 if file and file.filename:
-                    filename = secure_filename(file.filename)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"{timestamp}_{filename}"
-                    file_path = os.path.join(upload_dir, filename)
-                    file.save(file_path)
-                    requirements[file_key] = os.path.join('uploads', 'documents', str(resident_id), filename)
+                    uploads[file_key] = store_upload(file)
+                    requirements[file_key] = pending_entry(uploads[file_key])
         else:
             requirements['purpose'] = request.form.get('purpose', '')
         
@@ -232,24 +229,28 @@ def request_submit():
         price = prices.get(document_type, 0)
         
         # Save to database
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            INSERT INTO request_document 
-            (resident_id, document_type, price, requirements)
-            VALUES (%s, %s, %s, %s)
-        """, (resident_id, document_type, price, json.dumps(requirements)))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO request_document 
+                (resident_id, document_type, price, requirements)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            """, (resident_id, document_type, price, json.dumps(requirements)))
+            request_id = cursor.fetchone()['id']
+            # Thumbnails and review copies are made by a job worker (see images.py)
+            if uploads:
+                enqueue(cursor, 'process_images', {'request_id': request_id, 'fields': uploads})
         
+        invalidate('requests')
         flash('Document request submitted successfully!', 'success')
         return redirect(url_for('resident.my_request'))
+    except (UploadTooLarge, RequestEntityTooLarge):
+        flash(f'Each uploaded file must be smaller than {UPLOAD_MAX_FILE_BYTES // (1024 * 1024)} MB', 'danger')
+        return redirect(url_for('resident.request_page'))
     except Exception as e:
         flash('An error occurred while submitting your request', 'danger')
         print(f"Request submission error: {e}")
         return redirect(url_for('resident.request_page'))
-    finally:
-        if conn:
-            db.putconn(conn)
 
 @resident.route('/vote-update', methods=['POST'])
 def vote_update():
@@ -265,33 +266,19 @@ def vote_update():
         flash('Invalid vote parameters', 'danger')
         return redirect(url_for('resident.updates'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
         # Handle different vote types
-        vote_queries = {
-            'add_up_vote': [
-                "UPDATE community_update SET up_vote = up_vote || %s::jsonb WHERE id = %s",
-                "UPDATE community_update SET down_vote = COALESCE((SELECT jsonb_agg(value) FROM jsonb_array_elements_text(down_vote) AS elem(value) WHERE value::int != %s), '[]'::jsonb) WHERE id = %s"
-            ],
-            'remove_up_vote': [
-                "UPDATE community_update SET up_vote = COALESCE((SELECT jsonb_agg(value) FROM jsonb_array_elements_text(up_vote) AS elem(value) WHERE value::int != %s), '[]'::jsonb) WHERE id = %s"
-            ],
-            'add_down_vote': [
-                "UPDATE community_update SET down_vote = down_vote || %s::jsonb WHERE id = %s",
-                "UPDATE community_update SET up_vote = COALESCE((SELECT jsonb_agg(value) FROM jsonb_array_elements_text(up_vote) AS elem(value) WHERE value::int != %s), '[]'::jsonb) WHERE id = %s"
-            ],
-            'remove_down_vote': [
-                "UPDATE community_update SET down_vote = COALESCE((SELECT jsonb_agg(value) FROM jsonb_array_elements_text(down_vote) AS elem(value) WHERE value::int != %s), '[]'::jsonb) WHERE id = %s"
-            ]
+        vote_actions = {
+            'add_up_vote': (cast_vote, UP_VOTE),
+            'remove_up_vote': (retract_vote, UP_VOTE),
+            'add_down_vote': (cast_vote, DOWN_VOTE),
+            'remove_down_vote': (retract_vote, DOWN_VOTE)
         }
 
-        if vote in vote_queries:
-            for query in vote_queries[vote]:
-                cursor.execute(query, (session['id'], update_id))
-            conn.commit()
+        if vote in vote_actions:
+            action, value = vote_actions[vote]
+            with db_session(commit=True) as cursor:
+                action(cursor, update_id, session['id'], value)
             flash('Vote recorded successfully', 'success')
         else:
             flash('Invalid vote type', 'danger')
@@ -299,9 +286,6 @@ def vote_update():
     except Exception as e:
         flash('An error occurred while processing your vote', 'danger')
         print(f"Vote error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('resident.comments', update_id=update_id) if source_page == 'comments' else url_for('resident.updates'))
 
@@ -318,21 +302,19 @@ def comment_update():
         flash('Invalid comment parameters', 'danger')
         return redirect(url_for('resident.updates'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
         if submit_type == 'add_comment':
             comment = request.form.get('comment')
             if not comment:
                 flash('Comment cannot be empty', 'danger')
                 return redirect(url_for('resident.comments', update_id=post_id))
 
-            cursor.execute("""
-                INSERT INTO comments (post_id, created_by, content) 
-                VALUES (%s, %s, %s)
-            """, (post_id, session['id'], comment))
+            with db_session(commit=True) as cursor:
+                cursor.execute("""
+                    INSERT INTO comments (post_id, created_by, content) 
+                    VALUES (%s, %s, %s)
+                """, (post_id, session['id'], comment))
+                cursor.execute("UPDATE community_update SET comment_count = comment_count + 1 WHERE id = %s", (post_id,))
             flash('Comment added successfully', 'success')
 
         elif submit_type == 'delete_comment':
@@ -341,16 +323,16 @@ def comment_update():
                 flash('Invalid comment ID', 'danger')
                 return redirect(url_for('resident.comments', update_id=post_id))
 
-            cursor.execute("DELETE FROM comments WHERE id = %s", (comment_id,))
+            with db_session(commit=True) as cursor:
+                cursor.execute("DELETE FROM comments WHERE id = %s RETURNING post_id", (comment_id,))
+                deleted = cursor.fetchone()
+                if deleted:
+                    cursor.execute("UPDATE community_update SET comment_count = comment_count - 1 WHERE id = %s", (deleted['post_id'],))
             flash('Comment deleted successfully', 'success')
 
-        conn.commit()
     except Exception as e:
         flash('An error occurred while processing your comment', 'danger')
         print(f"Comment error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('resident.comments', update_id=post_id))
 
@@ -365,52 +347,36 @@ def delete_request():
         flash('Invalid request ID', 'danger')
         return redirect(url_for('resident.my_request'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("DELETE FROM request_document WHERE id = %s", (request_id,))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            # Paid receipts go with the request, so take them out of the revenue rollup first
+            record_revenue(cursor, lock_receipts(cursor, request_id), -1)
+            cursor.execute("DELETE FROM request_document WHERE id = %s", (request_id,))
+        invalidate('requests', 'collections', 'payments')
         flash('Request deleted successfully!', 'success')
     except Exception as e:
         flash('An error occurred while deleting your request', 'danger')
         print(f"Request deletion error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
     return redirect(url_for('resident.my_request'))
 
 # =================================== HELPER FUNCTIONS =================================== 
+MY_REQUESTS_QUERY = """
+    SELECT request_document.*, secretary.username 
+    FROM request_document 
+    LEFT JOIN secretary ON request_document.reviewed_by = secretary.id 
+    WHERE resident_id = %(resident_id)s 
+    AND (%(status)s::text IS NULL OR request_document.status = %(status)s) 
+    ORDER BY created_at DESC
+"""
+
 def get_my_requests(filter='Default'):
     """Get user's document requests with optional filtering"""
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if filter == 'Default':
-            cursor.execute("""
-                SELECT request_document.*, secretary.username 
-                FROM request_document 
-                LEFT JOIN secretary ON request_document.reviewed_by = secretary.id 
-                WHERE resident_id = %s 
-                ORDER BY created_at DESC
-            """, (session['id'],))
-        else:
-            cursor.execute("""
-                SELECT request_document.*, secretary.username 
-                FROM request_document 
-                LEFT JOIN secretary ON request_document.reviewed_by = secretary.id 
-                WHERE resident_id = %s AND request_document.status = %s 
-                ORDER BY created_at DESC
-            """, (session['id'], filter))
-        
-        return cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(MY_REQUESTS_QUERY, {'resident_id': session['id'], 'status': None if filter == 'Default' else filter})
+            return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching requests: {e}")
         return []
-    finally:
-        if conn:
-            db.putconn(conn)
 
     
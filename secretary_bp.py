@@ -1,7 +1,8 @@
-from bcrypt import hashpw, gensalt
+from passwords import hash_password
+from cache import invalidate
 from flask import Blueprint, render_template, url_for, redirect, session, request, flash
-from helpers import database as db, get_all_resident_info, get_current_user_info, get_all_requests, get_all_reports, get_all_sanctions
-from psycopg2.extras import RealDictCursor
+from helpers import db_session, PAGE_SIZE, get_account_by_email, get_all_resident_info, get_current_user_info, get_all_requests, get_all_reports, get_all_sanctions, invalidate_sanction, notify_sanction_change, wake_sanction_scheduler, get_resident_counts, get_recent_residents, get_request_counts, get_recent_requests, REQUEST_STATUSES, BULK_MAX_IDS, UPDATED, parse_request_ids, set_request_statuses, read_bulk_form, bulk_response, bulk_error
+from jobs import enqueue_many
 from datetime import datetime
 
 secretary = Blueprint('secretary', __name__)
@@ -16,15 +17,15 @@ def restrict_to_secretary():
 # =================================== ROUTES ===================================
 @secretary.route('/dashboard')
 def dashboard():
-    """Render secretary dashboard with resident info and requests"""
+    """Render secretary dashboard with resident and request summaries"""
     try:
         secretary = get_current_user_info()
-        residents = get_all_resident_info()
-        requests = get_all_requests()
         return render_template('secretary/dashboard.html', 
                              secretary=secretary, 
-                             residents=residents, 
-                             requests=requests)
+                             resident_counts=get_resident_counts(), 
+                             recent_residents=get_recent_residents(), 
+                             request_counts=get_request_counts(), 
+                             recent_requests=get_recent_requests())
     except Exception as e:
         flash('Error loading dashboard', 'danger')
         print(f"Dashboard error: {e}")
@@ -35,12 +36,13 @@ def requests_sec():
     """Render requests page with optional filtering"""
     try:
         filter = request.args.get('filter', 'Default')
-        released_by = get_all_released_by()
-        requests = get_all_requests(filter)
+        requests, next_cursor = get_all_requests(filter, request.args.get('cursor'), request.args.get('limit', PAGE_SIZE))
+        released_by = get_all_released_by([r['id'] for r in requests])
         return render_template('secretary/requests.html', 
                              requests=requests, 
                              flask_request=request, 
-                             released_by=released_by)
+                             released_by=released_by,
+                             next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading requests', 'danger')
         print(f"Requests error: {e}")
@@ -52,10 +54,11 @@ def residents_sec():
     try:
         filter = request.args.get('filter', 'Default')
         sanctions = get_all_sanctions()
-        residents = get_all_resident_info(filter)
+        residents, next_cursor = get_all_resident_info(filter, request.args.get('cursor', type=int), request.args.get('limit', PAGE_SIZE))
         return render_template('secretary/residents.html', 
                             residents=residents, 
-                            sanctions=sanctions)
+                            sanctions=sanctions,
+                            next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading residents', 'danger')
         print(f"Residents error: {e}")
@@ -66,8 +69,8 @@ def reports_sec():
     """Render community reports page"""
     flash('Error loading reports', 'danger')
     try:
-        reports = get_all_reports(category='default')
-        return render_template('secretary/reports.html', reports=reports)
+        reports, next_cursor = get_all_reports('default', request.args.get('cursor'), request.args.get('limit', PAGE_SIZE))
+        return render_template('secretary/reports.html', reports=reports, next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading reports', 'danger')
         print(f"Reports error: {e}")
@@ -78,10 +81,11 @@ def updates_sec():
     """Render community updates page"""
     try:
         my_updates = get_my_updates()
-        residents = get_all_resident_info()
+        residents, next_cursor = get_all_resident_info('Default', request.args.get('cursor', type=int), request.args.get('limit', PAGE_SIZE))
         return render_template('secretary/updates.html', 
                              my_updates=my_updates, 
-                             residents=residents)
+                             residents=residents,
+                             next_cursor=next_cursor)
     except Exception as e:
         flash('Error loading updates', 'danger')
         print(f"Updates error: {e}")
@@ -109,45 +113,44 @@ def update_request():
     status = request.form.get('status')
     filter = request.form.get('filter')
 
-    if not all([request_id, status]):
+    if not all([request_id, status]) or status not in REQUEST_STATUSES:
         flash('Invalid request parameters', 'danger')
         return redirect(url_for('secretary.requests_sec'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Update request status
-        cursor.execute("""
-            UPDATE request_document 
-            SET status = %s, reviewed_by = %s, reviewed_at = NOW() 
-            WHERE id = %s
-        """, (status, session.get('id'), request_id))
-
-        # Handle receipt creation based on status
-        if status == 'To Pick Up':
-            cursor.execute("""
-                INSERT INTO receipt(request_id, payment_status, paid_at) 
-                VALUES(%s, 'Paid', NOW())
-            """, (request_id,))
+        request_ids, invalid = parse_request_ids([request_id])
+        outcome = invalid.get(request_id) or apply_request_status(request_ids, status)[request_ids[0]]
+        if outcome != UPDATED:
+            flash(f'Could not update request status: {outcome}', 'danger')
         else:
-            cursor.execute("""
-                INSERT INTO receipt(request_id) 
-                VALUES(%s)
-            """, (request_id,))
-
-        conn.commit()
-        flash('Request status updated successfully', 'success')
+            flash('Request status updated successfully', 'success')
     except Exception as e:
         flash('Error updating request status', 'danger')
         print(f"Request update error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('secretary.requests_sec', filter=filter))
 
+@secretary.route('/bulk-update-requests', methods=['POST'])
+def bulk_update_requests():
+    """Set the status of many document requests in one transaction and report the outcome per id"""
+    values, form = read_bulk_form()
+    status = form.get('status')
+    back = url_for('secretary.requests_sec', filter=form.get('filter'))
+
+    if not values or status not in REQUEST_STATUSES:
+        return bulk_error('Select at least one request and a valid status', back)
+    if len(values) > BULK_MAX_IDS:
+        return bulk_error(f'At most {BULK_MAX_IDS} requests can be updated at once', back)
+
+    try:
+        request_ids, results = parse_request_ids(values)
+        if request_ids:
+            results.update(apply_request_status(request_ids, status))
+        return bulk_response(results, back)
+    except Exception as e:
+        print(f"Bulk request update error: {e}")
+        return bulk_error('Error updating request statuses', back)
+
 @secretary.route('/add_update', methods=['POST'])
 def add_update():
     """Handle adding new community updates"""
@@ -161,22 +164,16 @@ def add_update():
         flash('Title and content are required', 'danger')
         return redirect(url_for('secretary.updates_sec'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            INSERT INTO community_update(title, content, created_by) 
-            VALUES (%s, %s, %s)
-        """, (title.title(), content.capitalize(), session.get('id')))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO community_update(title, content, created_by) 
+                VALUES (%s, %s, %s)
+            """, (title.title(), content.capitalize(), session.get('id')))
         flash('Update added successfully', 'success')
     except Exception as e:
         flash('Error adding update', 'danger')
         print(f"Add update error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('secretary.updates_sec'))
 
@@ -195,32 +192,22 @@ def add_sanction():
         flash('All sanction fields are required', 'danger')
         return redirect(url_for('secretary.residents_sec'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Add sanction
-        cursor.execute("""
-            INSERT INTO sanctions (resident_id, issued_by, issued_at, expires_at, reason) 
-            VALUES (%s, %s, %s, %s, %s)
-        """, (resident_id, session.get('id'), issued_at, expires_at, reason.capitalize()))
-        
-        # Deactivate resident
-        cursor.execute("""
-            UPDATE resident 
-            SET is_active = FALSE 
-            WHERE id = %s
-        """, (resident_id,))
+        with db_session(commit=True) as cursor:
+            # Add sanction
+            cursor.execute("""
+                INSERT INTO sanctions (resident_id, issued_by, issued_at, expires_at, reason) 
+                VALUES (%s, %s, %s, %s, %s)
+            """, (resident_id, session.get('id'), issued_at, expires_at, reason.capitalize()))
         
-        conn.commit()
+            notify_sanction_change(cursor, resident_id)
+        invalidate_sanction(resident_id)
+        invalidate('residents')
+        wake_sanction_scheduler()
         flash('Sanction added successfully', 'success')
     except Exception as e:
         flash('Error adding sanction', 'danger')
         print(f"Add sanction error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('secretary.residents_sec'))
 
@@ -235,32 +222,21 @@ def remove_sanction():
         flash('Invalid resident ID', 'danger')
         return redirect(url_for('secretary.residents_sec'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Remove sanction
-        cursor.execute("""
-            DELETE FROM sanctions 
-            WHERE resident_id = %s
-        """, (resident_id,))
-        
-        # Reactivate resident
-        cursor.execute("""
-            UPDATE resident 
-            SET is_active = TRUE 
-            WHERE id = %s
-        """, (resident_id,))
+        with db_session(commit=True) as cursor:
+            # Remove sanction
+            cursor.execute("""
+                DELETE FROM sanctions 
+                WHERE resident_id = %s
+            """, (resident_id,))
         
-        conn.commit()
+            notify_sanction_change(cursor, resident_id)
+        invalidate_sanction(resident_id)
+        invalidate('residents')
         flash('Sanction removed successfully', 'success')
     except Exception as e:
         flash('Error removing sanction', 'danger')
         print(f"Remove sanction error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('secretary.residents_sec'))
 
@@ -275,74 +251,74 @@ def resolve_report():
         flash('Invalid report ID', 'danger')
         return redirect(url_for('secretary.reports_sec'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            UPDATE community_report 
-            SET status = 'Resolved', reviewed_by = %s 
-            WHERE id = %s
-        """, (session.get('id'), report_id))
-        conn.commit()
+        with db_session(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE community_report 
+                SET status = 'Resolved', reviewed_by = %s 
+                WHERE id = %s
+            """, (session.get('id'), report_id))
         flash('Report resolved successfully', 'success')
     except Exception as e:
         flash('Error resolving report', 'danger')
         print(f"Resolve report error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('secretary.reports_sec'))
 
 # =================================== HELPER FUNCTIONS ===================================
+def apply_request_status(request_ids, status):
+    """Set the status of request_ids in one transaction, queueing certificates for approved ones; returns the outcome per id"""
+    with db_session(commit=True) as cursor:
+        results = set_request_statuses(cursor, request_ids, status, session.get('id'))
+        if status == 'To Pick Up':
+            # Certificates are rendered by a job worker so they are ready at pick-up
+            enqueue_many(cursor, 'render_certificate',
+                         [{'request_id': request_id} for request_id, outcome in results.items() if outcome == UPDATED])
+    invalidate('requests', 'collections', 'payments')
+    return results
+
+MY_UPDATES_QUERY = """
+    SELECT * FROM community_update 
+    WHERE created_by = %s 
+    ORDER BY created_at DESC
+"""
+
 def get_my_updates():
     """Get updates created by current secretary"""
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT * FROM community_update 
-            WHERE created_by = %s 
-            ORDER BY created_at DESC
-        """, (session.get('id'),))
-        return cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(MY_UPDATES_QUERY, (session.get('id'),))
+            return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching updates: {e}")
         return []
-    finally:
-        if conn:
-            db.putconn(conn)
 
-def get_all_released_by():
-    """Get information about who released each request"""
-    conn = None
+RELEASED_BY_QUERY = """
+    SELECT 
+        rd.id as request_id,
+        rd.status,
+        CASE 
+            WHEN rd.status = 'Released' THEN t.username
+            WHEN rd.status = 'To Pay' THEN 'Pending Payment'
+            WHEN rd.status = 'Rejected' THEN 'Rejected'
+            ELSE 'Pending Review'
+        END as released_by
+    FROM request_document rd
+    LEFT JOIN receipt r ON rd.id = r.request_id
+    LEFT JOIN treasurer t ON r.issued_by = t.id
+    WHERE rd.id = ANY(%s)
+    ORDER BY rd.id DESC
+"""
+
+def get_all_released_by(request_ids):
+    """Get information about who released each of the given requests"""
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT 
-                rd.id as request_id,
-                rd.status,
-                CASE 
-                    WHEN rd.status = 'Released' THEN t.username
-                    WHEN rd.status = 'To Pay' THEN 'Pending Payment'
-                    WHEN rd.status = 'Rejected' THEN 'Rejected'
-                    ELSE 'Pending Review'
-                END as released_by
-            FROM request_document rd
-            LEFT JOIN receipt r ON rd.id = r.request_id
-            LEFT JOIN treasurer t ON r.issued_by = t.id
-            ORDER BY rd.id DESC
-        """)
-        return cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(RELEASED_BY_QUERY, (list(request_ids),))
+            return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching released by info: {e}")
         return []
-    finally:
-        if conn:
-            db.putconn(conn)
 
 # =================================== ADMIN FUNCTIONS ===================================
 def add():
@@ -355,29 +331,21 @@ def add():
         print("All fields are required")
         return
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        password_hash = hashpw(password.encode('utf-8'), gensalt()).decode('utf-8')
-
-        # Check for existing users
-        roles = ['secretary', 'resident', 'treasurer']
-        for role in roles:
-            cursor.execute(f"SELECT * FROM {role} WHERE email = %s", (email,))
-            if cursor.fetchone():
-                print(f"User with email {email} already exists in {role} role")
+        password_hash = hash_password(password)
+
+        with db_session(commit=True) as cursor:
+            # Check for existing users
+            existing = get_account_by_email(email, cursor)
+            if existing:
+                print(f"User with email {email} already exists in {existing['role']} role")
                 return
 
-        # Add new secretary
-        cursor.execute("""
-            INSERT INTO secretary(email, password, username) 
-            VALUES (%s, %s, %s)
-        """, (email, password_hash, username))
-        conn.commit()
+            # Add new secretary
+            cursor.execute("""
+                INSERT INTO secretary(email, password, username) 
+                VALUES (%s, %s, %s)
+            """, (email, password_hash, username))
         print("Secretary account created successfully")
     except Exception as e:
-        print(f"Error creating secretary account: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
\ No newline at end of file
+        print(f"Error creating secretary account: {e}")
\ No newline at end of file
@@ -0,0 +1,199 @@
+from flask import session, redirect, send_from_directory, abort, url_for
+from werkzeug.utils import secure_filename
+import hashlib
+import os
+import shutil
+import tempfile
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # the S3 backend is optional; local storage needs nothing
+    boto3 = None
+
+# =================================== CONFIGURATION ===================================
+# Uploads are streamed in UPLOAD_CHUNK_SIZE pieces into a spool file while their SHA-256 is computed,
+# then stored once under <prefix>/<aa>/<bb>/<sha256><ext>, so resubmitting the same file stores nothing
+# new and no directory grows past 256 entries per level. Local objects live outside static/ and are
+# served to signed-in users by /files/<key>. UPLOAD_MAX_REQUEST_BYTES becomes Flask's
+# MAX_CONTENT_LENGTH, which rejects oversized bodies before they are read.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+STORAGE_ROOT = os.environ.get('STORAGE_ROOT', 'uploads')
+STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET', 'barangay-uploads')
+STORAGE_S3_ENDPOINT = os.environ.get('STORAGE_S3_ENDPOINT')
+STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION', 'us-east-1')
+STORAGE_URL_EXPIRES = int(os.environ.get('STORAGE_URL_EXPIRES', 300))
+UPLOAD_MAX_FILE_BYTES = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', 4 * UPLOAD_MAX_FILE_BYTES))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Requirement paths stored before this module existed point into static/
+LEGACY_PREFIX = 'uploads/'
+# Objects under these prefixes have guessable keys and are only served by views that check ownership
+PRIVATE_PREFIXES = ('certificates/',)
+
+class UploadTooLarge(Exception):
+    """Raised when a single uploaded file exceeds UPLOAD_MAX_FILE_BYTES"""
+
+    def __init__(self, filename, limit=UPLOAD_MAX_FILE_BYTES):
+        super().__init__(f"{filename} is larger than {limit // (1024 * 1024)} MB")
+        self.filename = filename
+        self.limit = limit
+
+# =================================== BACKENDS ===================================
+class LocalBackend:
+    """Objects as files under STORAGE_ROOT; spool files live in the same filesystem so storing is a rename"""
+
+    def __init__(self, root=STORAGE_ROOT):
+        self.root = root
+        self.spool_dir = os.path.join(root, '.spool')
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def put_file(self, path, key):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+    def serve(self, key):
+        return send_from_directory(os.path.abspath(self.root), key)
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket (AWS, or MinIO via STORAGE_S3_ENDPOINT); served through presigned URLs"""
+
+    def __init__(self, bucket=STORAGE_S3_BUCKET, endpoint=STORAGE_S3_ENDPOINT, region=STORAGE_S3_REGION):
+        self.bucket = bucket
+        self.spool_dir = None
+        self._client = boto3.client('s3', endpoint_url=endpoint, region_name=region)
+
+    def exists(self, key):
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, path, key):
+        self._client.upload_file(path, self.bucket, key)
+        os.remove(path)
+
+    def open(self, key):
+        return self._client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def delete(self, key):
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+
+    def serve(self, key):
+        return redirect(self._client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=STORAGE_URL_EXPIRES))
+
+
+def _create_backend():
+    if STORAGE_BACKEND == 's3':
+        if boto3 is None:
+            print("STORAGE_BACKEND=s3 but the boto3 package is not installed; storing uploads locally")
+        else:
+            return S3Backend()
+    return LocalBackend()
+
+backend = _create_backend()
+
+# =================================== STORING ===================================
+def object_key(digest, filename, prefix='documents'):
+    """Fanned-out key for content with the given SHA-256 hex digest"""
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+def store_upload(file, prefix='documents', max_bytes=UPLOAD_MAX_FILE_BYTES, filename=None):
+    """
+    Stream an uploaded file (a werkzeug FileStorage or any object with .stream/.read) into storage.
+    Returns the object key; identical content is stored only once. Raises UploadTooLarge past max_bytes.
+    """
+    stream = getattr(file, 'stream', file)
+    filename = filename or getattr(file, 'filename', '') or ''
+    digest = hashlib.sha256()
+    size = 0
+
+    handle, spool_path = tempfile.mkstemp(dir=backend.spool_dir)
+    try:
+        with os.fdopen(handle, 'wb') as spool:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(filename, max_bytes)
+                digest.update(chunk)
+                spool.write(chunk)
+
+        key = object_key(digest.hexdigest(), filename, prefix)
+        if not backend.exists(key):
+            backend.put_file(spool_path, key)
+        return key
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+def put_object(key, data):
+    """Store bytes under an explicit key (for derived files whose key is not their content hash)"""
+    handle, spool_path = tempfile.mkstemp(dir=backend.spool_dir)
+    try:
+        with os.fdopen(handle, 'wb') as spool:
+            spool.write(data)
+        backend.put_file(spool_path, key)
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+    return key
+
+def copy_object(key, output):
+    """Write a stored object to a binary file object, chunk by chunk"""
+    source = backend.open(key)
+    try:
+        shutil.copyfileobj(source, output, UPLOAD_CHUNK_SIZE)
+    finally:
+        source.close()
+
+# =================================== SERVING ===================================
+def file_url(value):
+    """URL for a stored requirement: an entry with a 'key', an object key, or a legacy path under static/"""
+    if isinstance(value, dict):
+        value = value.get('key')
+    if not value:
+        return ''
+    if value.startswith(LEGACY_PREFIX):
+        return url_for('static', filename=value)
+    return url_for('stored_file', key=value)
+
+def serve_file(key):
+    """
+    Serve a stored upload to signed-in users. Upload keys are content hashes, so only someone who already
+    has the file can name it; certificates have predictable keys and go through download_certificate instead.
+    """
+    if 'id' not in session or '..' in key.split('/') or key.startswith(PRIVATE_PREFIXES):
+        abort(404)
+    if not backend.exists(key):
+        abort(404)
+    return backend.serve(key)
+
+def init_app(app):
+    """Cap request bodies, serve stored objects at /files/<key> and expose file_url() to templates"""
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUEST_BYTES
+    app.add_url_rule('/files/<path:key>', 'stored_file', serve_file)
+    app.jinja_env.globals['file_url'] = file_url
@@ -0,0 +1,233 @@
+from flask import Response, request, abort
+from helpers import pool_stats, get_scheduler_stats
+from bisect import bisect_left
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+
+# =================================== CONFIGURATION ===================================
+# Each worker keeps its samples in memory and writes them to METRICS_DIR/<pid>.json at most
+# every METRICS_FLUSH_INTERVAL seconds; /metrics merges every file, so any worker can answer a
+# scrape for the whole gunicorn server. Empty METRICS_DIR before starting the server.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+# /metrics answers 404 unless METRICS_TOKEN is set (scrapers then send it as a bearer token) or
+# METRICS_PUBLIC explicitly opens it to anyone who can reach the app.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'false').strip().lower() in ('1', 'true', 'yes', 'on')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, how gauges from several workers combine)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests handled, by endpoint, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint', None),
+    'db_pool_size': ('gauge', 'Connections each worker may hold, summed over live workers', 'sum'),
+    'db_pool_in_use': ('gauge', 'Connections currently checked out', 'sum'),
+    'db_pool_waiters': ('gauge', 'Threads waiting for a pooled connection', 'sum'),
+    'db_pool_checkouts_total': ('counter', 'Connections checked out of the pool', None),
+    'db_pool_timeouts_total': ('counter', 'Checkouts that gave up after DB_POOL_TIMEOUT', None),
+    'db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a pooled connection', None),
+    'db_pool_long_held_total': ('counter', 'Connections held longer than DB_POOL_LONG_HELD_SECONDS', None),
+    'sanction_scheduler_alive': ('gauge', 'Workers whose sanction scheduler thread is running', 'sum'),
+    'sanction_scheduler_pending_expiries': ('gauge', 'Sanction expiries queued in the scheduler heap', 'max'),
+    'sanction_scheduler_last_run_timestamp_seconds': ('gauge', 'Unix time of the most recent sweep', 'max'),
+    'sanction_scheduler_runs_total': ('counter', 'Sweeps that took the advisory lock', None),
+    'sanction_scheduler_skipped_total': ('counter', 'Sweeps skipped because another worker held the lock', None),
+    'sanction_scheduler_errors_total': ('counter', 'Sweeps that failed', None),
+    'sanction_scheduler_deleted_total': ('counter', 'Expired sanctions deleted', None),
+    'sanction_scheduler_duration_seconds_total': ('counter', 'Time spent sweeping', None),
+}
+
+_lock = threading.Lock()
+_values = {}        # (name, labels) -> value, for counters and gauges
+_histograms = {}    # (name, labels) -> [bucket counts..., +Inf count, sum]
+_last_flush = 0.0
+
+# =================================== RECORDING ===================================
+def _observe(name, labels, seconds):
+    index = bisect_left(LATENCY_BUCKETS, seconds)
+    series = _histograms.get((name, labels))
+    if series is None:
+        series = _histograms[(name, labels)] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    series[index] += 1
+    series[-1] += seconds
+
+def _inc(name, labels, amount=1):
+    _values[(name, labels)] = _values.get((name, labels), 0) + amount
+
+def _record_request(endpoint, method, status, seconds):
+    """Count and time one request under a single lock, so a scrape never sees one without the other"""
+    with _lock:
+        _inc('http_requests_total', (('endpoint', endpoint), ('method', method), ('status', status)))
+        _observe('http_request_duration_seconds', (('endpoint', endpoint),), seconds)
+
+def _collect_process_stats():
+    """Copy the pool and scheduler counters of this worker into the sample store"""
+    pool = pool_stats()
+    scheduler = get_scheduler_stats()
+    last_run = scheduler['last_run_at']
+    samples = {
+        'db_pool_size': pool['size'],
+        'db_pool_in_use': pool['in_use'],
+        'db_pool_waiters': pool['waiters'],
+        'db_pool_checkouts_total': pool['checkouts'],
+        'db_pool_timeouts_total': pool['timeouts'],
+        'db_pool_wait_seconds_total': pool['wait_ms_total'] / 1000,
+        'db_pool_long_held_total': pool['long_held'],
+        'sanction_scheduler_alive': int(scheduler['alive']),
+        'sanction_scheduler_pending_expiries': scheduler['pending_expiries'],
+        'sanction_scheduler_last_run_timestamp_seconds': last_run.timestamp() if last_run else 0,
+        'sanction_scheduler_runs_total': scheduler['runs'],
+        'sanction_scheduler_skipped_total': scheduler['skipped'],
+        'sanction_scheduler_errors_total': scheduler['errors'],
+        'sanction_scheduler_deleted_total': scheduler['deleted'],
+        'sanction_scheduler_duration_seconds_total': scheduler['total_duration_ms'] / 1000,
+    }
+    with _lock:
+        for name, value in samples.items():
+            _values[(name, ())] = value
+
+def _snapshot():
+    with _lock:
+        return {
+            'values': [[name, list(labels), value] for (name, labels), value in _values.items()],
+            'histograms': [[name, list(labels), list(series)] for (name, labels), series in _histograms.items()],
+        }
+
+def flush(force=False):
+    """Write this worker's samples to METRICS_DIR, at most once per METRICS_FLUSH_INTERVAL"""
+    global _last_flush
+    now = time.monotonic()
+    if not METRICS_DIR or (not force and now - _last_flush < METRICS_FLUSH_INTERVAL):
+        return
+    _last_flush = now
+    try:
+        _collect_process_stats()
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(_snapshot(), handle)
+        os.replace(path + '.tmp', path)
+    except Exception as e:
+        print(f"Metrics flush error: {e}")
+
+atexit.register(flush, True)
+
+# =================================== REQUEST HOOKS ===================================
+def _start_request():
+    request.environ['telemetry.started'] = time.perf_counter()
+
+def _finish_request(response):
+    started = request.environ.get('telemetry.started')
+    if started is not None and request.endpoint != 'telemetry_metrics':
+        endpoint = request.endpoint or 'unmatched'
+        _record_request(endpoint, request.method, str(response.status_code), time.perf_counter() - started)
+        flush()
+    return response
+
+# =================================== EXPOSITION ===================================
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _load_samples():
+    """Samples of every worker: this process from memory, the others from METRICS_DIR"""
+    _collect_process_stats()
+    workers = [(os.getpid(), _snapshot())]
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+            pid = int(os.path.basename(path).split('.')[0])
+            if pid == os.getpid():
+                continue
+            try:
+                with open(path) as handle:
+                    workers.append((pid, json.load(handle)))
+            except (OSError, ValueError):
+                continue  # replaced or half-written by its worker; picked up on the next scrape
+    return workers
+
+def _merge(workers):
+    values, histograms = {}, {}
+    for pid, samples in workers:
+        alive = None
+        for name, labels, value in samples['values']:
+            kind, _, mode = METRICS.get(name, ('counter', '', None))
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if kind == 'gauge':
+                # Gauges of exited workers no longer describe anything; their counters still count
+                if alive is None:
+                    alive = pid == os.getpid() or _pid_alive(pid)
+                if not alive:
+                    continue
+                if mode == 'max':
+                    values[key] = max(values.get(key, value), value)
+                    continue
+            values[key] = values.get(key, 0) + value
+        for name, labels, series in samples['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [0] * len(series))
+            for i, count in enumerate(series):
+                merged[i] += count
+    return values, histograms
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+def render_metrics():
+    """Render the merged samples of all workers in the Prometheus text exposition format"""
+    values, histograms = _merge(_load_samples())
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(series[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        else:
+            for (series_name, labels), value in sorted(values.items()):
+                if series_name == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+def metrics_endpoint():
+    """Serve /metrics to requests with `Authorization: Bearer <METRICS_TOKEN>`, or to anyone with METRICS_PUBLIC"""
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+            abort(403)
+    elif not METRICS_PUBLIC:
+        abort(404)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    """Count and time every request and serve the merged metrics at /metrics"""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'telemetry_metrics', metrics_endpoint)
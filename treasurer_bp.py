@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, redirect, url_for, request, session, flash
-from helpers import database as db, RealDictCursor, get_all_resident_info
-from bcrypt import hashpw, checkpw, gensalt
+from helpers import db_session, get_account_by_email, get_resident_counts, get_online_residents, stream_rows, BULK_MAX_IDS, UPDATED, parse_request_ids, mark_requests_paid, mark_requests_released, read_bulk_form, bulk_response, bulk_error
+from exports import export_response, FINANCIAL_COLUMNS, FINANCIAL_EXPORT_QUERY, RECEIPT_COLUMNS, RECEIPTS_EXPORT_QUERY
+from passwords import hash_password
+from cache import cached, invalidate, Uncacheable
+from jobs import enqueue_many
 from datetime import datetime, date, timedelta
-from collections import defaultdict
+from decimal import Decimal
 
 treasurer = Blueprint('treasurer', __name__)
 
@@ -19,12 +22,12 @@ def dashboard():
     """Render treasurer dashboard with collections and recent payments"""
     try:
         collections, pending = get_all_collections()
-        active_residents = get_all_resident_info('Online')
         recent_payments = get_recent_payments(8)
         return render_template('treasurer/dashboard.html', 
                              collections=collections, 
                              pending=pending, 
-                             active_residents=active_residents, 
+                             resident_counts=get_resident_counts(), 
+                             active_residents=get_online_residents(), 
                              recent_payments=recent_payments)
     except Exception as e:
         flash('Error loading dashboard', 'danger')
@@ -35,18 +38,7 @@ def dashboard():
 def financial_reports_treas():
     """Render financial reports with optional date filtering"""
     try:
-        # Get query params
-        report_type = request.args.get('report_type', 'monthly')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        # Set default date range based on report type
-        today = date.today()
-        if not start_date or not end_date:
-            start_date, end_date = get_default_date_range(today, report_type)
-        else:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        report_type, start_date, end_date = get_report_range(request.args)
 
         # Get financial data
         total_income, income_breakdown = get_financial_data(start_date, end_date)
@@ -75,6 +67,31 @@ def receipts_treas():
         print(f"Receipts error: {e}")
         return redirect(url_for('treasurer.dashboard'))
 
+@treasurer.route('/export/financial-report')
+def export_financial_report():
+    """Download every paid document in the report range as CSV or XLSX, with per-document subtotals"""
+    try:
+        _, start_date, end_date = get_report_range(request.args)
+        rows = stream_rows(FINANCIAL_EXPORT_QUERY, (start_date, end_date + timedelta(days=1)))
+        filename = f"financial-report_{start_date}_{end_date}"
+        return export_response(rows, FINANCIAL_COLUMNS, filename, request.args.get('format', 'csv'))
+    except Exception as e:
+        flash('Error exporting financial report', 'danger')
+        print(f"Financial report export error: {e}")
+        return redirect(url_for('treasurer.financial_reports_treas'))
+
+@treasurer.route('/export/receipts')
+def export_receipts():
+    """Download the receipts listing as CSV or XLSX, with per-document subtotals"""
+    try:
+        rows = stream_rows(RECEIPTS_EXPORT_QUERY)
+        filename = f"receipts_{date.today()}"
+        return export_response(rows, RECEIPT_COLUMNS, filename, request.args.get('format', 'csv'))
+    except Exception as e:
+        flash('Error exporting receipts', 'danger')
+        print(f"Receipts export error: {e}")
+        return redirect(url_for('treasurer.receipts_treas'))
+
 @treasurer.route('/account')
 def account_treas():
     """Render treasurer account page"""
@@ -92,23 +109,16 @@ def mark_paid():
         flash('Invalid request ID', 'danger')
         return redirect(url_for('treasurer.receipts_treas'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            UPDATE receipt 
-            SET payment_status = 'Paid', paid_at = NOW(), issued_by = %s 
-            WHERE request_id = %s
-        """, (session.get('id'), request_id))
-        conn.commit()
-        flash('Payment marked as paid successfully', 'success')
+        request_ids, invalid = parse_request_ids([request_id])
+        outcome = invalid.get(request_id) or apply_paid(request_ids)[request_ids[0]]
+        if outcome != UPDATED:
+            flash(f'Could not mark payment as paid: {outcome}', 'danger')
+        else:
+            flash('Payment marked as paid successfully', 'success')
     except Exception as e:
         flash('Error marking payment as paid', 'danger')
         print(f"Mark paid error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('treasurer.receipts_treas'))
 
@@ -123,37 +133,79 @@ def mark_released():
         flash('Invalid request ID', 'danger')
         return redirect(url_for('treasurer.receipts_treas'))
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Update document status
-        cursor.execute("""
-            UPDATE request_document 
-            SET status = 'Released' 
-            WHERE id = %s
-        """, (request_id,))
-        
-        # Update receipt
-        cursor.execute("""
-            UPDATE receipt 
-            SET issued_by = %s 
-            WHERE request_id = %s
-        """, (session.get('id'), request_id))
-        
-        conn.commit()
-        flash('Document marked as released successfully', 'success')
+        request_ids, invalid = parse_request_ids([request_id])
+        outcome = invalid.get(request_id) or apply_released(request_ids)[request_ids[0]]
+        if outcome != UPDATED:
+            flash(f'Could not mark document as released: {outcome}', 'danger')
+        else:
+            flash('Document marked as released successfully', 'success')
     except Exception as e:
         flash('Error marking document as released', 'danger')
         print(f"Mark released error: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 
     return redirect(url_for('treasurer.receipts_treas'))
 
+@treasurer.route('/bulk-mark-paid', methods=['POST'])
+def bulk_mark_paid():
+    """Mark the receipts of many requests paid in one transaction and report the outcome per id"""
+    return bulk_action(apply_paid, 'Error marking payments as paid')
+
+@treasurer.route('/bulk-mark-released', methods=['POST'])
+def bulk_mark_released():
+    """Mark many documents released in one transaction and report the outcome per id"""
+    return bulk_action(apply_released, 'Error marking documents as released')
+
 # =================================== HELPER FUNCTIONS ===================================
+def apply_paid(request_ids):
+    """Mark the receipts of request_ids paid in one transaction; returns the outcome per id"""
+    with db_session(commit=True) as cursor:
+        results = mark_requests_paid(cursor, request_ids, session.get('id'))
+    invalidate('collections', 'payments')
+    return results
+
+def apply_released(request_ids):
+    """Mark request_ids released in one transaction, queueing their certificates; returns the outcome per id"""
+    with db_session(commit=True) as cursor:
+        results = mark_requests_released(cursor, request_ids, session.get('id'))
+        # Renders certificates of requests that skipped 'To Pick Up' or whose job has not run yet
+        enqueue_many(cursor, 'render_certificate',
+                     [{'request_id': request_id} for request_id, outcome in results.items() if outcome == UPDATED])
+    invalidate('requests', 'collections')
+    return results
+
+def bulk_action(apply, error_message):
+    """Run a bulk receipts action on the posted ids and respond with the outcome per id"""
+    values, _ = read_bulk_form()
+    back = url_for('treasurer.receipts_treas')
+    if not values:
+        return bulk_error('Select at least one request', back)
+    if len(values) > BULK_MAX_IDS:
+        return bulk_error(f'At most {BULK_MAX_IDS} requests can be updated at once', back)
+
+    try:
+        request_ids, results = parse_request_ids(values)
+        if request_ids:
+            results.update(apply(request_ids))
+        return bulk_response(results, back)
+    except Exception as e:
+        print(f"Bulk receipts error: {e}")
+        return bulk_error(error_message, back)
+
+def get_report_range(args):
+    """Read report_type/start_date/end_date from query args, defaulting the range from the report type"""
+    report_type = args.get('report_type', 'monthly')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+
+    # Set default date range based on report type
+    if not start_date or not end_date:
+        start_date, end_date = get_default_date_range(date.today(), report_type)
+    else:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+    return report_type, start_date, end_date
+
 def get_default_date_range(today, report_type):
     """Get default date range based on report type"""
     if report_type == 'monthly':
@@ -178,131 +230,109 @@ def get_default_date_range(today, report_type):
     
     return start_date, end_date
 
+# At most one row per day and document type in the range
+FINANCIAL_DATA_QUERY = """
+    SELECT document_type, SUM(amount) AS amount
+    FROM revenue_daily
+    WHERE day BETWEEN %s AND %s
+    GROUP BY document_type
+    HAVING SUM(count) > 0
+    ORDER BY amount DESC
+"""
+
 def get_financial_data(start_date, end_date):
-    """Get financial data for the specified date range"""
-    conn = None
+    """Get total income and per-document breakdown for the specified date range (inclusive)"""
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get all paid documents in date range
-        cursor.execute("""
-            SELECT rd.document_type, rd.price
-            FROM request_document rd
-            JOIN receipt r ON r.request_id = rd.id
-            WHERE r.paid_at IS NOT NULL
-            AND r.paid_at::date BETWEEN %s AND %s
-        """, (start_date, end_date))
-        rows = cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(FINANCIAL_DATA_QUERY, (start_date, end_date))
+            rows = cursor.fetchall()
 
         # Calculate total income and breakdown
-        total_income = sum(row['price'] for row in rows)
-        breakdown = defaultdict(float)
-        for row in rows:
-            breakdown[row['document_type']] += row['price']
-
-        # Format breakdown data
+        total_income = sum((row['amount'] for row in rows), Decimal(0))
         income_breakdown = []
-        for doc_type, amount in breakdown.items():
-            percent = (amount / total_income * 100) if total_income else 0
+        for row in rows:
+            percent = (row['amount'] / total_income * 100) if total_income else Decimal(0)
             income_breakdown.append({
-                'category': doc_type.replace('_', ' ').title(),
-                'amount': f"{amount:,.2f}",
+                'category': row['document_type'].replace('_', ' ').title(),
+                'amount': f"{row['amount']:,.2f}",
                 'percent': f"{percent:.2f}"
             })
 
-        # Sort by amount descending
-        income_breakdown.sort(key=lambda x: float(x['amount'].replace(',', '')), reverse=True)
-        
         return total_income, income_breakdown
     except Exception as e:
         print(f"Error getting financial data: {e}")
-        return 0, []
-    finally:
-        if conn:
-            db.putconn(conn)
+        return Decimal(0), []
+
+# Everything paid so far comes from the daily rollup rather than the whole request table
+COLLECTED_QUERY = "SELECT COALESCE(SUM(amount), 0) AS sum FROM revenue_daily"
 
+PENDING_COLLECTIONS_QUERY = """
+    SELECT COALESCE(SUM(price), 0) as sum 
+    FROM request_document 
+    WHERE status = 'To Pay'
+"""
+
+@cached('collections')
 def get_all_collections():
     """Get total collections and pending amounts"""
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get released collections
-        cursor.execute("""
-            SELECT SUM(price) as sum 
-            FROM request_document 
-            WHERE status = 'Released'
-        """)
-        collections = cursor.fetchone()
+        with db_session() as cursor:
+            cursor.execute(COLLECTED_QUERY)
+            collections = cursor.fetchone()
         
-        # Get pending collections
-        cursor.execute("""
-            SELECT SUM(price) as sum 
-            FROM request_document 
-            WHERE status = 'To Pay'
-        """)
-        pending = cursor.fetchone()
+            cursor.execute(PENDING_COLLECTIONS_QUERY)
+            pending = cursor.fetchone()
         
-        return collections, pending
+            return collections, pending
     except Exception as e:
         print(f"Error getting collections: {e}")
-        return {'sum': 0}, {'sum': 0}
-    finally:
-        if conn:
-            db.putconn(conn)
+        raise Uncacheable(({'sum': 0}, {'sum': 0}))
+
+PENDING_RECEIPTS_QUERY = """
+    SELECT 
+        request_document.*, 
+        CONCAT(first_name, ' ', last_name) as resident_name, 
+        receipt.* 
+    FROM receipt 
+    LEFT JOIN request_document ON receipt.request_id = request_document.id 
+    LEFT JOIN resident ON request_document.resident_id = resident.id 
+    WHERE request_document.status IN ('To Pay', 'Released', 'To Pick Up')
+"""
 
 def get_all_pending_receipts():
     """Get all pending receipts with resident information"""
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT 
-                request_document.*, 
-                CONCAT(first_name, ' ', last_name) as resident_name, 
-                receipt.* 
-            FROM receipt 
-            LEFT JOIN request_document ON receipt.request_id = request_document.id 
-            LEFT JOIN resident ON request_document.resident_id = resident.id 
-            WHERE request_document.status IN ('To Pay', 'Released', 'To Pick Up')
-        """)
-        return cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(PENDING_RECEIPTS_QUERY)
+            return cursor.fetchall()
     except Exception as e:
         print(f"Error getting pending receipts: {e}")
         return []
-    finally:
-        if conn:
-            db.putconn(conn)
 
+RECENT_PAYMENTS_QUERY = """
+    SELECT 
+        r.paid_at, 
+        rd.price, 
+        rd.document_type, 
+        CONCAT(res.first_name, ' ', res.last_name) as resident_name
+    FROM receipt r
+    JOIN request_document rd ON r.request_id = rd.id
+    LEFT JOIN resident res ON rd.resident_id = res.id
+    WHERE r.paid_at IS NOT NULL 
+    AND r.paid_at >= NOW() - INTERVAL '%s hours'
+    ORDER BY r.paid_at DESC
+"""
+
+@cached('payments')
 def get_recent_payments(hours=8):
     """Get recent payments within specified hours"""
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT 
-                r.paid_at, 
-                rd.price, 
-                rd.document_type, 
-                CONCAT(res.first_name, ' ', res.last_name) as resident_name
-            FROM receipt r
-            JOIN request_document rd ON r.request_id = rd.id
-            LEFT JOIN resident res ON rd.resident_id = res.id
-            WHERE r.paid_at IS NOT NULL 
-            AND r.paid_at >= NOW() - INTERVAL '%s hours'
-            ORDER BY r.paid_at DESC
-        """, (hours,))
-        return cursor.fetchall()
+        with db_session() as cursor:
+            cursor.execute(RECENT_PAYMENTS_QUERY, (hours,))
+            return cursor.fetchall()
     except Exception as e:
         print(f"Error getting recent payments: {e}")
-        return []
-    finally:
-        if conn:
-            db.putconn(conn)
+        raise Uncacheable([])
 
 # =================================== ADMIN FUNCTIONS ===================================
 def add():
@@ -315,30 +345,22 @@ def add():
         print("All fields are required")
         return
 
-    conn = None
     try:
-        conn = db.getconn()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        password_hash = hashpw(password.encode('utf-8'), gensalt()).decode('utf-8')
-
-        # Check for existing users
-        roles = ['secretary', 'resident', 'treasurer']
-        for role in roles:
-            cursor.execute(f"SELECT * FROM {role} WHERE email = %s", (email,))
-            if cursor.fetchone():
-                print(f"User with email {email} already exists in {role} role")
+        password_hash = hash_password(password)
+
+        with db_session(commit=True) as cursor:
+            # Check for existing users
+            existing = get_account_by_email(email, cursor)
+            if existing:
+                print(f"User with email {email} already exists in {existing['role']} role")
                 return
 
-        # Add new treasurer
-        cursor.execute("""
-            INSERT INTO treasurer(email, password, username) 
-            VALUES (%s, %s, %s)
-        """, (email, password_hash, username))
-        conn.commit()
+            # Add new treasurer
+            cursor.execute("""
+                INSERT INTO treasurer(email, password, username) 
+                VALUES (%s, %s, %s)
+            """, (email, password_hash, username))
         print("Treasurer account created successfully")
     except Exception as e:
         print(f"Error creating treasurer account: {e}")
-    finally:
-        if conn:
-            db.putconn(conn)
 # add()
\ No newline at end of file
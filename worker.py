@@ -0,0 +1,36 @@
+"""
+Background job worker for the Barangay Management System (see jobs.py).
+
+    python worker.py [--threads N] [--types render_certificate,process_images] [--once]
+
+Run one or more of these next to the web server. SIGTERM or Ctrl+C lets running jobs finish before exiting.
+"""
+import argparse
+import signal
+import sys
+import threading
+
+import jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=4, help='jobs to run at once in this process')
+    parser.add_argument('--types', type=lambda value: [t for t in value.split(',') if t],
+                        help=f"comma-separated job types to run (default all: {', '.join(sorted(jobs.HANDLERS))})")
+    parser.add_argument('--once', action='store_true', help='exit once no job is due instead of waiting for more')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.types or []) - set(jobs.HANDLERS)
+    if unknown:
+        parser.error(f"unknown job type(s): {', '.join(sorted(unknown))}")
+
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    jobs.run_worker(args.threads, args.types, args.once, stop)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())